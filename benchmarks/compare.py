@@ -0,0 +1,51 @@
+"""Compare benchmark results to a baseline, failing on regressions.
+
+Run with `uv run python -m benchmarks.compare baseline.json new.json`.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def compare(
+    baseline: dict[str, float], current: dict[str, float], threshold: float
+) -> list[str]:
+    """Print the change of each result, return the ones that regressed.
+    Results are times or sizes, lower is better.
+    """
+    regressions: list[str] = []
+    for name, value in current.items():
+        if name not in baseline:
+            print(f"{name:>36}: {value:,.0f} (new)")
+            continue
+        change = value / baseline[name] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = " REGRESSION"
+        print(
+            f"{name:>36}: {baseline[name]:,.0f} -> {value:,.0f} ({change:+.1%}){flag}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative increase considered a regression.",
+    )
+    args = parser.parse_args()
+    baseline, current = (
+        json.loads(path.read_text()) for path in (args.baseline, args.current)
+    )
+    if baseline["python"] != current["python"]:
+        print(f"python versions differ: {baseline['python']} and {current['python']}")
+    if compare(baseline["results"], current["results"], args.threshold):
+        sys.exit(1)
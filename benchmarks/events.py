@@ -0,0 +1,64 @@
+"""Measure the cost of emitting events to sync and async listeners.
+
+Run with `uv run python -m benchmarks.events`.
+"""
+
+import argparse
+import time
+
+import uvloop
+
+from local_tuya.events import Event, EventNotifier
+
+
+class BaseEvent(Event): ...
+
+
+class ChildEvent(BaseEvent): ...
+
+
+def _sync(_: Event) -> None:
+    pass
+
+
+async def _async(_: Event) -> None:
+    pass
+
+
+async def run(notifier: EventNotifier, events: int, batch: bool) -> float:
+    event = ChildEvent()
+    if batch:
+        batch_events = [event] * events
+        start = time.perf_counter()
+        await notifier.emit_many(batch_events)
+    else:
+        start = time.perf_counter()
+        for _ in range(events):
+            await notifier.emit(event)
+    return time.perf_counter() - start
+
+
+async def main(events: int, listeners: int) -> None:
+    cases: dict[str, EventNotifier] = {
+        "no listener": EventNotifier(),
+        "sync": EventNotifier(),
+        "async": EventNotifier(),
+        "base class": EventNotifier(),
+    }
+    for _ in range(listeners):
+        cases["sync"].register(ChildEvent, _sync)
+        cases["async"].register(ChildEvent, _async)
+        cases["base class"].register(BaseEvent, _sync)
+    for name, notifier in cases.items():
+        for batch in (False, True):
+            elapsed = await run(notifier, events, batch)
+            label = f"{name}{' (emit_many)' if batch else ''}"
+            print(f"{label:>24}: {elapsed / events * 1e9:,.0f}ns/event")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--listeners", type=int, default=3)
+    args = parser.parse_args()
+    uvloop.run(main(args.events, args.listeners))
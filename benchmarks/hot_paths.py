@@ -0,0 +1,347 @@
+"""Time the hot paths of the receive and update pipelines, and the memory used per device.
+
+Run with `uv run python -m benchmarks.hot_paths --save benchmarks/baselines/new.json`,
+then compare to a previous run with `uv run python -m benchmarks.compare`.
+"""
+
+import argparse
+import asyncio
+import gc
+import inspect
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from collections.abc import AsyncIterator, Callable
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
+
+import aiomqtt
+import uvloop
+from imbue import Container
+
+from local_tuya.backoff import SequenceBackoff
+from local_tuya.contrib.airton_ac import ACDataPoint, AirtonACDevice
+from local_tuya.contrib.ceiling_fan import CeilingFanDevice
+from local_tuya.device import Device, DeviceConfig
+from local_tuya.device.buffer import UpdateBuffer
+from local_tuya.emulator import DeviceCodec
+from local_tuya.events import Event, EventNotifier
+from local_tuya.mqtt import MQTTClient, MQTTConfig
+from local_tuya.mqtt.discovery import DiscoveryMessage
+from local_tuya.protocol import DeviceDiscovery, Protocol, Values
+from local_tuya.tuya import TuyaConfig, TuyaPackage, TuyaProtocol
+from local_tuya.tuya.events import TuyaResponseReceived
+from local_tuya.tuya.message import StatusResponse, UpdateCommand
+from local_tuya.tuya.message.handlers.crypto import AESCipher
+from local_tuya.tuya.message.handlers.v33 import V33MessageHandler
+from local_tuya.tuya.state import State
+
+KEY = b"0123456789abcdef"
+TUYA_CONFIG = TuyaConfig(id_="id", address="127.0.0.1", key=KEY)
+AC_STATE: Values = {
+    ACDataPoint.power: True,
+    ACDataPoint.set_point: 220,
+    ACDataPoint.temperature: 235,
+    ACDataPoint.mode: "cold",
+    ACDataPoint.fan: "auto",
+    ACDataPoint.eco: False,
+    ACDataPoint.light: True,
+    ACDataPoint.swing: "off",
+    ACDataPoint.swing_direction: "off",
+    ACDataPoint.sleep: False,
+    ACDataPoint.health: False,
+}
+MEMORY = "memory per device"
+
+# Benchmark name to a setup returning the function to time.
+BENCHMARKS: dict[str, Callable[[], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str):
+    def _register(setup: Callable[[], Callable[[], Any]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return _register
+
+
+class _NullProtocol(Protocol):
+    """Count states published by devices."""
+
+    def __init__(self):
+        self.timeout = 5
+        self.states = 0
+
+    async def receive_commands(self) -> AsyncIterator[tuple[str, Values]]:
+        return
+        yield
+
+    async def set_availability(self, device_id: str, status: bool) -> None: ...
+
+    async def send_state(self, device_id: str, payload: Values) -> None:
+        self.states += 1
+
+    async def send_discovery(
+        self, device: DeviceDiscovery, device_id: str, device_name: str
+    ) -> None: ...
+
+
+def _device(device_class: type[Device]) -> Device:
+    return device_class(
+        "benchmark",
+        DeviceConfig(tuya=TUYA_CONFIG),
+        _NullProtocol(),
+        EventNotifier(),
+        MagicMock(spec=TuyaProtocol),
+    )
+
+
+@benchmark("V33MessageHandler.pack")
+def _pack():
+    handler = V33MessageHandler(TUYA_CONFIG)
+    command = UpdateCommand({ACDataPoint.power: True, ACDataPoint.set_point: 220})
+    return lambda: handler.pack(1, command)
+
+
+@benchmark("V33MessageHandler.unpack")
+def _unpack():
+    handler = V33MessageHandler(TUYA_CONFIG)
+    frame = DeviceCodec(KEY).pack(1, 8, {"dps": AC_STATE}, version_header=True)
+
+    def _run():
+        handler.feed(frame)
+        return handler.unpack()
+
+    return _run
+
+
+@benchmark("AESCipher.encrypt")
+def _encrypt():
+    cipher = AESCipher(KEY)
+    data = json.dumps({"dps": AC_STATE}).encode()
+    return lambda: cipher.encrypt(data)
+
+
+@benchmark("AESCipher.decrypt")
+def _decrypt():
+    cipher = AESCipher(KEY)
+    data = cipher.encrypt(json.dumps({"dps": AC_STATE}).encode())
+    return lambda: cipher.decrypt(data)
+
+
+@benchmark("EventNotifier.emit")
+def _emit():
+    notifier = EventNotifier()
+    for _ in range(3):
+        notifier.register(Event, lambda _: None)
+    event = Event()
+    return lambda: notifier.emit(event)
+
+
+@benchmark("State._update")
+def _state_update():
+    state = State("benchmark", 3600, EventNotifier())
+    state._state = dict(AC_STATE)
+    # Alternate values so that the state changes every time.
+    events = itertools.cycle(
+        TuyaResponseReceived(
+            0, StatusResponse({"dps": {ACDataPoint.temperature: t}}), None
+        )
+        for t in (235, 240)
+    )
+    return lambda: state._update(next(events))
+
+
+@benchmark("Constraints.filter_values")
+def _filter_values():
+    constraints = AirtonACDevice.CONSTRAINTS
+    assert constraints
+    current: Values = {**AC_STATE, ACDataPoint.eco: True}
+    values: Values = {ACDataPoint.set_point: 240, ACDataPoint.fan: "turbo"}
+    return lambda: constraints.filter_values(values, current)
+
+
+@benchmark("UpdateBuffer._filter")
+def _buffer_filter():
+    buffer = UpdateBuffer(
+        device_name="benchmark",
+        delay=0,
+        protocol=MagicMock(spec=TuyaProtocol),
+        event_notifier=EventNotifier(),
+        constraints=AirtonACDevice.CONSTRAINTS,
+        retries=0,
+        retry_backoff=SequenceBackoff(1),
+        timeout=5,
+    )
+    buffer._state = dict(AC_STATE)
+    values: Values = {ACDataPoint.power: True, ACDataPoint.set_point: 240}
+    return lambda: buffer._filter(values)
+
+
+@benchmark("AirtonACDevice._from_tuya_payload")
+def _ac_from_tuya():
+    device = _device(AirtonACDevice)
+    return lambda: device._from_tuya_payload(AC_STATE)
+
+
+@benchmark("AirtonACDevice._to_tuya_payload")
+def _ac_to_tuya():
+    device = _device(AirtonACDevice)
+    payload = device._from_tuya_payload(AC_STATE)
+    return lambda: device._to_tuya_payload(payload)
+
+
+@benchmark("CeilingFanDevice._from_tuya_payload")
+def _fan_from_tuya():
+    device = _device(CeilingFanDevice)
+    values: Values = {"1": True, "3": "2", "4": "forward", "9": False, "102": "normal"}
+    return lambda: device._from_tuya_payload(values)
+
+
+@benchmark("CeilingFanDevice._to_tuya_payload")
+def _fan_to_tuya():
+    device = _device(CeilingFanDevice)
+    payload: Values = {"power": True, "speed": "L2", "light": False}
+    return lambda: device._to_tuya_payload(payload)
+
+
+@benchmark("DiscoveryMessage.get")
+def _discovery():
+    message = DiscoveryMessage(
+        "prefix", "prefix", AirtonACDevice.DISCOVERY, "id", "name"
+    )
+    components = AirtonACDevice.DISCOVERY.components
+    return lambda: [message.get(c) for c in components]
+
+
+@benchmark("MQTTClient._process_message")
+def _process_message():
+    client = MQTTClient(MQTTConfig(hostname="127.0.0.1"))
+    message = aiomqtt.Message("local-tuya/set/id/set_point", b"22", 0, False, 0, None)
+    return lambda: client._process_message(message)
+
+
+async def _time(func: Callable[[], Any], is_async: bool, number: int) -> float:
+    start = time.perf_counter()
+    if is_async:
+        for _ in range(number):
+            await func()
+    else:
+        for _ in range(number):
+            func()
+    return time.perf_counter() - start
+
+
+async def measure(func: Callable[[], Any], duration: float, repeat: int) -> float:
+    """Get the best time of a call in nanoseconds,
+    calling it enough times to run for at least the duration in each repetition.
+    """
+    # Warm up.
+    result = func()
+    if is_async := inspect.isawaitable(result):
+        await result
+    number = 1
+    while (elapsed := await _time(func, is_async, number)) < duration:
+        number = max(number * 2, int(number * duration / max(elapsed, 1e-9)))
+    timings = [elapsed]
+    for _ in range(repeat - 1):
+        timings.append(await _time(func, is_async, number))
+    return min(timings) / number * 1e9
+
+
+@asynccontextmanager
+async def _wired_device(
+    index: int, port: int, protocol: Protocol
+) -> AsyncIterator[None]:
+    config = DeviceConfig(
+        tuya=TuyaConfig(
+            id_=f"emulated{index}", address="127.0.0.1", port=port + index, key=KEY
+        )
+    )
+    async with Container(
+        TuyaPackage(name=config.tuya.id_, config=config.tuya)
+    ).application_context() as container:
+        async with AirtonACDevice(
+            config.tuya.id_,
+            config,
+            protocol,
+            await container.get(EventNotifier),
+            await container.get(TuyaProtocol),
+        ):
+            yield
+
+
+async def memory_per_device(devices: int, port: int) -> float:
+    """Bytes allocated per device connected to an emulated one and having published its state.
+    The emulator runs in another process so that it is not measured.
+    """
+    emulator = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "local_tuya.emulator",
+        "--model",
+        AirtonACDevice.DISCOVERY.model,
+        "--count",
+        str(devices),
+        "--port",
+        str(port),
+        "--key",
+        KEY.decode(),
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        assert emulator.stderr
+        while b"emulating" not in await emulator.stderr.readline():
+            pass
+        protocol = _NullProtocol()
+        gc.collect()
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        async with AsyncExitStack() as stack:
+            for i in range(devices):
+                await stack.enter_async_context(_wired_device(i, port, protocol))
+            async with asyncio.timeout(30):
+                while protocol.states < devices:
+                    await asyncio.sleep(0.01)
+            gc.collect()
+            after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        emulator.terminate()
+        await emulator.wait()
+    return (after - before) / devices
+
+
+async def main(
+    duration: float, repeat: int, devices: int, port: int, save: Path | None
+) -> None:
+    results: dict[str, float] = {}
+    for name, setup in BENCHMARKS.items():
+        results[name] = await measure(setup(), duration, repeat)
+        print(f"{name:>36}: {results[name]:,.0f}ns")
+    if devices:
+        results[MEMORY] = await memory_per_device(devices, port)
+        print(f"{MEMORY:>36}: {results[MEMORY]:,.0f}B")
+    if save:
+        save.parent.mkdir(parents=True, exist_ok=True)
+        save.write_text(
+            json.dumps(
+                {"python": platform.python_version(), "results": results}, indent=2
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--port", type=int, default=17000)
+    parser.add_argument("--save", type=Path)
+    args = parser.parse_args()
+    uvloop.run(main(args.duration, args.repeat, args.devices, args.port, args.save))
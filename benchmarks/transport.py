@@ -0,0 +1,137 @@
+"""Compare transports receiving status pushes from many devices over localhost.
+
+Run with `uv run python -m benchmarks.transport`.
+"""
+
+import argparse
+import asyncio
+import binascii
+import json
+import time
+
+import uvloop
+
+from local_tuya.backoff import SequenceBackoff
+from local_tuya.events import EventNotifier
+from local_tuya.tuya.config import TuyaConfig
+from local_tuya.tuya.events import TuyaResponseReceived
+from local_tuya.tuya.message import get_handler
+from local_tuya.tuya.message.handlers.crypto import AESCipher
+from local_tuya.tuya.message.handlers.v33 import V33MessageHandler
+from local_tuya.tuya.transport import ProtocolTransport, Transport
+
+KEY = b"0123456789abcdef"
+
+
+def status_frame(sequence_number: int, cipher: AESCipher) -> bytes:
+    """Build a status push as sent by a v3.3 device."""
+    encrypted = cipher.encrypt(
+        json.dumps({"dps": {"1": True, "3": sequence_number}}).encode()
+    )
+    payload = (
+        V33MessageHandler.RETURN_CODE.pack(0)
+        + b"3.3"
+        + V33MessageHandler.VERSION_HEADER
+        + encrypted
+    )
+    data = (
+        V33MessageHandler.HEADER.pack(
+            V33MessageHandler.PREFIX,
+            sequence_number,
+            8,
+            len(payload) + V33MessageHandler.END.size,
+        )
+        + payload
+    )
+    return data + V33MessageHandler.END.pack(
+        binascii.crc32(data) & 0xFFFFFFFF,
+        V33MessageHandler.SUFFIX,
+    )
+
+
+async def run(
+    transport_class: type[Transport],
+    devices: int,
+    frames: int,
+    batch: int,
+) -> float:
+    cipher = AESCipher(KEY)
+    chunks = [
+        b"".join(status_frame(i + j, cipher) for j in range(batch))
+        for i in range(0, frames - batch + 1, batch)
+    ]
+    done = asyncio.Event()
+    received = 0
+    connected = 0
+    all_connected = asyncio.Event()
+    start_sending = asyncio.Event()
+
+    async def _serve(_: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        nonlocal connected
+        connected += 1
+        if connected == devices:
+            all_connected.set()
+        await start_sending.wait()
+        for chunk in chunks:
+            writer.write(chunk)
+            await writer.drain()
+        await done.wait()
+        writer.close()
+
+    def _count(_: TuyaResponseReceived) -> None:
+        nonlocal received
+        received += 1
+        if received == devices * len(chunks) * batch:
+            done.set()
+
+    server = await asyncio.start_server(_serve, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    transports = []
+    for i in range(devices):
+        notifier = EventNotifier()
+        notifier.register(TuyaResponseReceived, _count)
+        transports.append(
+            transport_class(
+                name=f"device-{i}",
+                address="127.0.0.1",
+                port=port,
+                backoff=SequenceBackoff(0),
+                timeout=5,
+                keepalive=60,
+                message_handler=get_handler(
+                    TuyaConfig(id_=str(i), address="127.0.0.1", key=KEY)
+                ),
+                event_notifier=notifier,
+            )
+        )
+    async with server:
+        for transport in transports:
+            await transport.__aenter__()
+        await all_connected.wait()
+        start = time.perf_counter()
+        start_sending.set()
+        await done.wait()
+        elapsed = time.perf_counter() - start
+        for transport in transports:
+            await transport.__aexit__(None, None, None)
+    return elapsed
+
+
+async def main(devices: int, frames: int, batch: int) -> None:
+    frames -= frames % batch
+    total = devices * frames
+    for transport_class in (Transport, ProtocolTransport):
+        elapsed = await run(transport_class, devices, frames, batch)
+        print(
+            f"{transport_class.__name__:>17}: {elapsed:.3f}s, "
+            f"{total / elapsed:,.0f} frames/s, {elapsed / total * 1e6:.1f}µs/frame"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=4)
+    args = parser.parse_args()
+    uvloop.run(main(args.devices, args.frames, args.batch))
@@ -1,49 +1,151 @@
 import asyncio
+import random
+import time
 from contextlib import AbstractContextManager
+from enum import StrEnum
 from typing import Any
 
-from pydantic import GetCoreSchemaHandler
+from pydantic import BaseModel, GetCoreSchemaHandler
 from pydantic_core import CoreSchema, core_schema
 
 
+class Jitter(StrEnum):
+    """Randomize waits so that clients failing together do not retry together."""
+
+    # Wait exactly the value of the sequence.
+    none = "none"
+    # Wait between 0 and the value.
+    full = "full"
+    # Wait between half the value and the value.
+    equal = "equal"
+    # Wait between the first non zero value of the sequence and 3 times the previous wait,
+    # capped at the value.
+    decorrelated = "decorrelated"
+
+
+class _SequenceBackoffConfig(BaseModel):
+    sequence: tuple[float, ...]
+    jitter: Jitter = Jitter.none
+
+
 class SequenceBackoff(AbstractContextManager):
     """Backoff according to a wait sequence.
     When it reaches the end of the sequence, it will keep using the last value.
 
-    >>> with SequenceBackoff(1, 5, 10) as backoff:
+    >>> with SequenceBackoff(1, 5, 10, jitter=Jitter.full) as backoff:
     >>>     ...
     >>>     await backoff.wait()
+
+    In configuration files it is either the sequence, or a mapping with
+    the `sequence` and `jitter` keys.
     """
 
-    def __init__(self, *sequence: float):
+    def __init__(self, *sequence: float, jitter: Jitter = Jitter.none):
         self.__seq = tuple(sequence)
         self.__index = 0
+        self.__jitter = jitter
+        self.__base = next((e for e in sequence if e > 0), 0)
+        self.__previous = self.__base
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         self.reset()
 
     def reset(self) -> None:
         self.__index = 0
+        self.__previous = self.__base
 
-    async def wait(self) -> None:
-        await asyncio.sleep(self.__seq[self.__index])
+    def delay(self) -> float:
+        """Get the next wait and advance in the sequence."""
+        value = self.__seq[self.__index]
         if self.__index < len(self.__seq) - 1:
             self.__index += 1
+        match self.__jitter:
+            case Jitter.full:
+                return random.uniform(0, value)
+            case Jitter.equal:
+                return random.uniform(value / 2, value)
+            case Jitter.decorrelated:
+                self.__previous = min(
+                    value,
+                    random.uniform(self.__base, max(self.__previous, self.__base) * 3),
+                )
+                return self.__previous
+        return value
+
+    async def wait(self) -> None:
+        await asyncio.sleep(self.delay())
 
     def __repr__(self) -> str:
-        return f"SequenceBackoff({', '.join(str(e) for e in self.__seq)})"
+        sequence = ", ".join(str(e) for e in self.__seq)
+        if self.__jitter is Jitter.none:
+            return f"SequenceBackoff({sequence})"
+        return f"SequenceBackoff({sequence}, jitter={self.__jitter})"
 
     @classmethod
     def __get_pydantic_core_schema__(
         cls, _: Any, handler: GetCoreSchemaHandler
     ) -> CoreSchema:
         return core_schema.no_info_after_validator_function(
-            lambda e: cls(*e),
-            handler(tuple[float, ...]),
+            lambda e: (
+                cls(*e.sequence, jitter=e.jitter)
+                if isinstance(e, _SequenceBackoffConfig)
+                else cls(*e)
+            ),
+            core_schema.union_schema(
+                [
+                    handler(tuple[float, ...]),
+                    handler(_SequenceBackoffConfig),
+                ]
+            ),
             serialization=core_schema.plain_serializer_function_ser_schema(
                 cls._serialize
             ),
         )
 
-    def _serialize(self) -> tuple[float, ...]:
-        return self.__seq
+    def _serialize(self) -> tuple[float, ...] | dict[str, Any]:
+        if self.__jitter is Jitter.none:
+            return self.__seq
+        return {"sequence": self.__seq, "jitter": self.__jitter.value}
+
+
+class CircuitState(StrEnum):
+    # Working normally, or failing for a short time.
+    closed = "closed"
+    # Failing for too long, only probing.
+    open = "open"
+
+
+class CircuitBreaker:
+    """Track how long a resource has been failing.
+    When failing for longer than the threshold the circuit opens
+    and retries should be replaced with cheap probes.
+    """
+
+    def __init__(self, threshold: float, probe_interval: float):
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self.state = CircuitState.closed
+        self._failing_since: float | None = None
+
+    @property
+    def open(self) -> bool:
+        return self.state is CircuitState.open
+
+    def failure(self) -> bool:
+        """Record a failure, return whether the circuit just opened."""
+        now = time.monotonic()
+        if self._failing_since is None:
+            self._failing_since = now
+        if self.state is CircuitState.closed and (
+            self.threshold and now - self._failing_since >= self.threshold
+        ):
+            self.state = CircuitState.open
+            return True
+        return False
+
+    def success(self) -> bool:
+        """Record a success, return whether the circuit was open."""
+        self._failing_since = None
+        was_open = self.open
+        self.state = CircuitState.closed
+        return was_open
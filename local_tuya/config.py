@@ -8,12 +8,25 @@ from pydantic_settings import (
 )
 
 from local_tuya.contrib import FullDeviceConfig
+from local_tuya.metrics import MetricsConfig
 from local_tuya.mqtt import MQTTConfig
+from local_tuya.tracing import TracingConfig
+from local_tuya.watchdog import WatchdogConfig
 
 
 class Config(BaseSettings):
     mqtt: MQTTConfig
     devices: tuple[FullDeviceConfig, ...]
+    # Maximum number of devices connecting at the same time.
+    max_concurrent_connections: int = 10
+    # Devices started per second, to spread connections and messages on startup.
+    startup_rate: float = 20
+    # Listen to devices broadcasting their presence on the network,
+    # to reconnect as soon as they are back and follow address changes.
+    presence_listener: bool = False
+    watchdog: WatchdogConfig = Field(default_factory=WatchdogConfig)
+    metrics: MetricsConfig = Field(default_factory=MetricsConfig)
+    tracing: TracingConfig = Field(default_factory=TracingConfig)
     logging: dict[str, Any] = Field(
         default_factory=lambda: {
             "version": 1,
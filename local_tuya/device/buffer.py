@@ -1,19 +1,59 @@
 import asyncio
+import contextlib
 import logging
+import time
+from contextlib import AbstractContextManager
+from functools import partial
+from typing import ClassVar
 
 from concurrent_tasks import BackgroundTask
 
 from local_tuya.backoff import SequenceBackoff
 from local_tuya.device.constraints import Constraints
-from local_tuya.events import EventNotifier
+from local_tuya.device.events import AbortReason, UpdateAborted, UpdatePending
+from local_tuya.events import EventNotifier, Registration
+from local_tuya.metrics import REGISTRY
 from local_tuya.protocol import Values
+from local_tuya.tracing import TRACER, Stage, Trace, TraceStatus
 from local_tuya.tuya import TuyaProtocol, TuyaStateUpdated
+from local_tuya.tuya.message import Response
 
 logger = logging.getLogger(__name__)
 
+UPDATE_DURATION = REGISTRY.histogram(
+    "local_tuya_update_duration_seconds",
+    "Time taken to send updates to the device.",
+    ("device",),
+)
+UPDATE_RETRIES = REGISTRY.counter(
+    "local_tuya_update_retries_total", "Updates sent again.", ("device",)
+)
+UPDATES_CONFIRMED = REGISTRY.counter(
+    "local_tuya_updates_confirmed_total",
+    "Updates confirmed by the state of the device.",
+    ("device",),
+)
+UPDATES_ABORTED = REGISTRY.counter(
+    "local_tuya_updates_aborted_total",
+    "Updates still not confirmed after all retries.",
+    ("device",),
+)
 
-class UpdateBuffer:
-    """Debounce updates to the device."""
+
+class UpdateBuffer(AbstractContextManager):
+    """Debounce updates to the device, send them and confirm them with the device state.
+
+    A single task per device processes updates: they are merged while it waits
+    for the debounce delay or the confirmation of the previous update,
+    so that the tasks and memory used do not depend on the rate of updates.
+
+    When `max_delay` is set, the debounce is adaptive: the first update after
+    an idle period is sent at once, the ones following it are coalesced in a window
+    growing with their interval, between `delay` and `max_delay`.
+    """
+
+    # Traces of merged updates kept until sent, older ones are superseded.
+    MAX_TRACES: ClassVar[int] = 32
 
     def __init__(
         self,
@@ -24,122 +64,340 @@ class UpdateBuffer:
         constraints: Constraints | None,
         retries: int,
         retry_backoff: SequenceBackoff,
+        timeout: float,
+        max_delay: float | None = None,
+        probe_delay: float = 1,
     ):
-        event_notifier.register(TuyaStateUpdated, self._set_state)
+        self._registration: Registration | None = None
         self._name = device_name
+        self._event_notifier = event_notifier
         self._protocol = protocol
+        self._timeout = timeout
 
         self._state: Values | None = None
         self._state_updated = asyncio.Event()
+        # Values requested and not yet confirmed.
         self._buffer: Values = {}
         self._constraints = constraints
+        # Set on new updates and states.
+        self._wakeup = asyncio.Event()
+        # Updates were received since the buffer was last sent.
+        self._pending = False
+        self._task = BackgroundTask(self._run)
 
         self._delay = delay
-        # Allow a single call to the device, and lock management of update task.
-        self._update_finished = asyncio.Event()
-        self._update_finished.set()
-        self._update_waiter: asyncio.Future[None] | None = None
-        self._update_task = BackgroundTask(self._update)
+        self._max_delay = max_delay
+        # Adaptive debounce window, and average interval between updates in a burst.
+        self._window = delay
+        self._interval: float | None = None
+        self._last_update: float | None = None
+        # Loop time at which the buffer is sent.
+        self._send_at = 0.0
 
         self._retries = retries
         self._retry_backoff = retry_backoff
-        self._retry_task: BackgroundTask | None = None
+        self._probe_delay = probe_delay
+
+        # Values sent in the current phase, and phases left to send.
+        self._sent: Values = {}
+        self._phases: list[Values] = []
+        # Values announced as pending, until sent again, confirmed or aborted.
+        self._announced: Values = {}
+
+        # Traces of commands waiting to be sent, and sent waiting for confirmation.
+        self._traces: list[Trace] = []
+        self._sent_traces: list[Trace] = []
+
+        self._update_duration = UPDATE_DURATION.labels(device_name)
+        self._update_retries = UPDATE_RETRIES.labels(device_name)
+        self._updates_confirmed = UPDATES_CONFIRMED.labels(device_name)
+        self._updates_aborted = UPDATES_ABORTED.labels(device_name)
 
-    def close(self) -> None:
-        self._update_task.cancel()
-        if self._retry_task:
-            self._retry_task.cancel()
+    def __enter__(self):
+        self._registration = self._event_notifier.register(
+            TuyaStateUpdated, self._set_state
+        )
+        self._task.create()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if self._registration:
+            self._registration.unregister()
+            self._registration = None
+        self._task.cancel()
 
     def _set_state(self, event: TuyaStateUpdated) -> None:
         self._state = event.values
         self._state_updated.set()
+        self._wakeup.set()
 
-    async def update(self, values: Values) -> None:
-        # Store the values first in case we time out.
-        if values:
-            self._buffer = await self._filter(values)
-        # Make sure nothing is currently updating the device.
-        await self._update_finished.wait()
-        # Stop any update currently in the buffer stage.
-        self._update_task.cancel()
-        if self._buffer:
-            self._update_task.create()
-            if not self._update_waiter:
-                self._update_waiter = asyncio.Future()
-            await self._update_waiter
+    def update(self, values: Values, trace: Trace | None = None) -> None:
+        """Merge the values in the buffer, to be sent after the debounce delay."""
+        if trace:
+            trace.mark(Stage.started)
+            self._traces.append(trace)
+            if len(self._traces) > self.MAX_TRACES:
+                TRACER.finish(self._traces[:1], TraceStatus.cancelled)
+                del self._traces[0]
+        self._buffer.update(values)
+        self._send_at = asyncio.get_running_loop().time() + self._debounce_delay()
+        self._pending = True
+        self._wakeup.set()
+
+    def _debounce_delay(self) -> float:
+        """Get how long to wait for more updates before sending to the device."""
+        if self._max_delay is None:
+            return self._delay
+        now = time.monotonic()
+        interval = None if self._last_update is None else now - self._last_update
+        self._last_update = now
+        if interval is None or interval > self._max_delay:
+            # Idle, start over.
+            self._interval = None
+        elif self._interval is None:
+            self._interval = interval
         else:
+            self._interval = (self._interval + interval) / 2
+        leading = interval is None or interval > self._window
+        # Cover the next update of the burst at the rate observed.
+        self._window = (
+            self._delay
+            if self._interval is None
+            else min(self._max_delay, max(self._delay, 2 * self._interval))
+        )
+        return 0 if leading else self._window
+
+    async def _wait(self, timeout: float | None) -> None:
+        """Wait for a new update or state, at most `timeout` seconds."""
+        self._wakeup.clear()
+        with contextlib.suppress(TimeoutError):
+            async with asyncio.timeout(timeout):
+                await self._wakeup.wait()
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                await self._wait(None)
+                continue
+            try:
+                await self._process()
+            except Exception:
+                # Only fail the commands being processed, the task keeps running.
+                logger.error(
+                    "%s: exception caught processing commands",
+                    self._name,
+                    exc_info=True,
+                )
+                await self._abort()
+
+    async def _process(self) -> None:
+        loop = asyncio.get_running_loop()
+        if (remaining := self._send_at - loop.time()) > 0:
             logger.debug(
-                "%s: cancelling previous commands as update is no longer required",
+                "%s: received command waiting %.3fs before sending to device",
                 self._name,
+                remaining,
             )
-            if self._update_waiter:
-                self._update_waiter.set_result(None)
-                self._update_waiter = None
+            while (remaining := self._send_at - loop.time()) > 0:
+                await self._wait(remaining)
+        if self._state is None:
+            await self._state_updated.wait()
+        self._pending = False
+        await self._send()
+        if self._retries and (self._sent_traces or self._buffer):
+            await self._confirm()
+
+    async def _abort(self) -> None:
+        """Drop the buffer and fail its traces."""
+        TRACER.finish(self._traces + self._sent_traces, TraceStatus.failed)
+        self._traces, self._sent_traces = [], []
+        values = {**self._buffer, **self._sent}
+        for phase in self._phases:
+            values.update(phase)
+        self._buffer, self._sent, self._phases = {}, {}, []
+        await self._emit_aborted(values, AbortReason.failed)
 
-    async def _update(self) -> None:
-        if self._delay:
+    async def _send(self) -> None:
+        """Send the buffer in phases ordered by the constraints.
+        Without retries, a phase is sent once the previous one is acknowledged,
+        otherwise once it is confirmed.
+        """
+        assert self._state is not None
+        self._buffer = self._filter(self._buffer)
+        await self._announce()
+        traces, self._traces = self._traces, []
+        if not self._buffer:
             logger.debug(
-                "%s: received command waiting %ss before sending to device",
+                "%s: cancelling previous commands as update is no longer required",
                 self._name,
-                self._delay,
             )
-            await asyncio.sleep(self._delay)
-        if not self._buffer:
+            TRACER.finish(traces, TraceStatus.cancelled)
+            self._sent, self._phases = {}, []
             return
         logger.debug("%s: updating device with: %s", self._name, self._buffer)
-        self._update_finished.clear()
+        self._phases = (
+            self._constraints.plan(self._buffer, self._state)
+            if self._constraints
+            else [self._buffer.copy()]
+        )
+        for trace in traces:
+            trace.mark(Stage.debounced)
+        ack = await self._send_phase(traces)
+        while ack and self._phases and not self._retries:
+            try:
+                await ack
+            except Exception:
+                logger.error(
+                    "%s: update not acknowledged, aborting next phases", self._name
+                )
+                TRACER.finish(traces, TraceStatus.failed)
+                await self._abort_phases()
+                return
+            ack = await self._send_phase(traces)
+
+    async def _send_phase(self, traces: list[Trace]) -> asyncio.Future[Response] | None:
+        self._sent = self._phases.pop(0)
+        if self._phases:
+            logger.debug(
+                "%s: sending %s before %s", self._name, self._sent, self._phases
+            )
+        start = time.perf_counter()
         try:
-            await self._protocol.update(self._buffer.copy())
-            if self._update_waiter:
-                self._update_waiter.set_result(None)
-            # This should not go in the `finally` as we don't want to retry if cancelled.
-            self._start_check_and_retry()
+            # Bound the wait for the connection and the window of commands in flight.
+            async with asyncio.timeout(self._timeout):
+                ack = await self._protocol.update(self._sent.copy())
         except Exception as e:
-            if self._update_waiter:
-                self._update_waiter.set_exception(e)
-            self._start_check_and_retry()
-        finally:
-            self._update_finished.set()
-            self._update_waiter = None
-
-    async def _filter(self, values: Values) -> Values:
-        """Filter the new values to take into account:
+            if isinstance(e, TimeoutError):
+                logger.error("%s: timeout sending command to device", self._name)
+            else:
+                logger.error(
+                    "%s: exception caught sending command to device",
+                    self._name,
+                    exc_info=True,
+                )
+            if self._retries:
+                self._sent_traces.extend(traces)
+            else:
+                TRACER.finish(traces, TraceStatus.failed)
+                await self._abort_phases()
+            return None
+        self._update_duration.observe(time.perf_counter() - start)
+        for trace in traces:
+            trace.mark(Stage.sent)
+        if self._retries:
+            ack.add_done_callback(partial(self._acknowledged, traces))
+            self._sent_traces.extend(traces)
+        elif not self._phases:
+            ack.add_done_callback(partial(self._acknowledged, traces))
+        return ack
+
+    async def _abort_phases(self) -> None:
+        values = self._sent.copy()
+        for phase in self._phases:
+            values.update(phase)
+        self._phases = []
+        await self._emit_aborted(values, AbortReason.failed)
+
+    async def _announce(self) -> None:
+        """Announce the values about to be sent as pending,
+        and abort the ones announced before that are no longer sent,
+        unless the device state already matches them."""
+        assert self._state is not None
+        if dropped := {
+            k: v
+            for k, v in self._announced.items()
+            if k not in self._buffer and self._state[k] != v
+        }:
+            await self._event_notifier.emit(UpdateAborted(dropped, AbortReason.dropped))
+        self._announced = self._buffer.copy()
+        if self._buffer:
+            await self._event_notifier.emit(UpdatePending(self._buffer.copy()))
+
+    async def _emit_aborted(self, values: Values, reason: AbortReason) -> None:
+        self._announced = {}
+        await self._event_notifier.emit(UpdateAborted(values, reason))
+
+    def _acknowledged(self, traces: list[Trace], ack: asyncio.Future[Response]) -> None:
+        failed = ack.cancelled() or ack.exception()
+        if not failed:
+            for trace in traces:
+                trace.mark(Stage.acknowledged)
+        # Otherwise traces complete when the update is confirmed.
+        if not self._retries:
+            TRACER.finish(
+                traces, TraceStatus.failed if failed else TraceStatus.acknowledged
+            )
+
+    def _filter(self, values: Values) -> Values:
+        """Filter the values to take into account:
         - values already equal to the value from the current device state
         - constraints.
         """
-        if self._state is None:
-            await self._state_updated.wait()
         assert self._state is not None
-        filtered = {
-            k: v for k, v in {**self._buffer, **values}.items() if self._state[k] != v
-        }
+        filtered = {k: v for k, v in values.items() if self._state[k] != v}
         if not self._constraints:
             return filtered
         return self._constraints.filter_values(filtered, self._state)
 
-    def _start_check_and_retry(self) -> None:
-        if not self._retries or self._retry_task:
-            return
-        self._retry_task = BackgroundTask(self._check_and_retry)
-        task = self._retry_task.create()
-
-        def _cleanup(_: asyncio.Task) -> None:
-            self._retry_task = None
+    def _is_confirmed(self) -> bool:
+        """The current state matches the values last sent."""
+        assert self._state is not None
+        return all(self._state[k] == v for k, v in self._sent.items())
 
-        task.add_done_callback(_cleanup)
+    async def _wait_confirmed(self, timeout: float) -> bool:
+        """Wait for the state to match the values last sent, or for new updates."""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while (
+            not self._is_confirmed()
+            and not self._pending
+            and (remaining := deadline - asyncio.get_running_loop().time()) > 0
+        ):
+            await self._wait(remaining)
+        return self._is_confirmed()
 
-    async def _check_and_retry(self) -> None:
-        """Retry unless the state received from the device matches the update."""
-        assert self._state is not None
+    async def _confirm(self) -> None:
+        """Retry unless the state received from the device matches the update.
+        The device usually pushes its state right after an update, otherwise it is
+        queried after the probe delay, and the backoff applies from there.
+        New updates interrupt the confirmation, what is left is sent along with them.
+        """
         with self._retry_backoff:
             i = 0
             while True:
-                await self._retry_backoff.wait()
+                confirmed = await self._wait_confirmed(self._probe_delay)
+                if not confirmed and not self._pending:
+                    logger.debug("%s: update not confirmed, querying state", self._name)
+                    try:
+                        async with asyncio.timeout(self._timeout):
+                            await self._protocol.query_state()
+                    except Exception:
+                        logger.error(
+                            "%s: exception caught querying state",
+                            self._name,
+                            exc_info=True,
+                        )
+                    confirmed = await self._wait_confirmed(self._retry_backoff.delay())
                 # Filter the buffer with the current state.
+                assert self._state is not None
                 self._buffer = {
                     k: v for k, v in self._buffer.items() if self._state[k] != v
                 }
-                if not self._buffer:
+                if confirmed and self._buffer:
+                    if self._pending:
+                        # Sent along with the new updates.
+                        return
+                    logger.debug(
+                        "%s: phase confirmed, sending the next one", self._name
+                    )
+                    await self._send()
+                    continue
+                if confirmed:
+                    self._announced = {}
+                    self._updates_confirmed.inc()
+                    for trace in self._sent_traces:
+                        trace.mark(Stage.confirmed)
+                    TRACER.finish(self._sent_traces, TraceStatus.confirmed)
+                    self._sent_traces = []
                     if i == 0:
                         logger.debug("%s: update confirmed", self._name)
                     else:
@@ -147,7 +405,15 @@ class UpdateBuffer:
                             "%s: update confirmed after retry %i", self._name, i
                         )
                     return
+                if self._pending:
+                    return
                 if i == self._retries:
+                    self._updates_aborted.inc()
+                    await self._emit_aborted(
+                        self._buffer.copy(), AbortReason.unconfirmed
+                    )
+                    TRACER.finish(self._sent_traces, TraceStatus.unconfirmed)
+                    self._sent_traces = []
                     logger.error(
                         "%s: update still not confirmed after %i retries, aborting",
                         self._name,
@@ -160,12 +426,8 @@ class UpdateBuffer:
                     i + 1,
                 )
                 # Retry to send what is left in the buffer.
-                try:
-                    await self.update({})
-                except Exception:
-                    logger.error(
-                        "%s: exception caught retrying update",
-                        self._name,
-                        exc_info=True,
-                    )
+                self._update_retries.inc()
+                for trace in self._sent_traces:
+                    trace.mark(Stage.retried)
+                await self._send()
                 i += 1
@@ -10,9 +10,19 @@ class DeviceConfig(BaseModel):
     included_components: set[str] | None = None
     # Seconds to wait for more update commands in order to group them.
     debounce_updates: float = 0.5
+    # Send the first command after an idle period at once, and group the ones following it
+    # in a window adapting to their rate, up to `max_debounce_updates` seconds.
+    adaptive_debounce: bool = False
+    max_debounce_updates: float = 2
     # Determines how often to retry updates until the state matches.
     # `retries` can be set to 0 to disable retries.
     retries: int = 5
     retry_backoff: SequenceBackoff = Field(
         default_factory=lambda: SequenceBackoff(5, 10, 30, 60)
     )
+    # Seconds to wait for the device to push its state after an update before querying it,
+    # `retry_backoff` then applies.
+    confirmation_probe_delay: float = 1
+    # Publish the values sent as the state until the device confirms them,
+    # they are rolled back if the update is aborted.
+    optimistic: bool = False
@@ -1,3 +1,6 @@
+import functools
+from typing import ClassVar
+
 from local_tuya.protocol import Value, Values
 
 type Blacklist = dict[str, set[Value] | None]
@@ -17,37 +20,95 @@ class Constraint:
         self._value = value
         self._blacklist: Blacklist = {dp: v for dp, v in blacklist}
 
+    @property
+    def trigger(self) -> tuple[str, Value]:
+        return self._data_point, self._value
+
     def blacklist(self, values: Values) -> Blacklist:
         if values[self._data_point] != self._value:
             return {}
         return self._blacklist
 
 
+def _merge(blacklist: _Blacklist, other: Blacklist | _Blacklist) -> None:
+    for k, v in other.items():
+        if k not in blacklist:
+            blacklist[k] = set()
+        if v:
+            blacklist[k] |= v
+
+
 class Constraints:
-    """Represent all constraints for a given device."""
+    """Represent all constraints for a given device.
+
+    Constraints are indexed by the datapoint/value triggering them,
+    only the triggering datapoints are checked and the blacklist
+    for their values is cached.
+    """
+
+    # Number of trigger value combinations kept, shared by devices of a model.
+    CACHE_SIZE: ClassVar[int] = 64
 
     def __init__(self, *constraints: Constraint):
         self._constraints = constraints
+        self._index: dict[tuple[str, Value], _Blacklist] = {}
+        for constraint in constraints:
+            _merge(
+                self._index.setdefault(constraint.trigger, {}),
+                constraint.blacklist(dict([constraint.trigger])),
+            )
+        self._triggers = tuple(dict.fromkeys(dp for dp, _ in self._index))
+        self._get_blacklist = functools.lru_cache(maxsize=self.CACHE_SIZE)(
+            self._blacklist
+        )
 
-    def _blacklist(self, values: Values) -> _Blacklist:
+    def _blacklist(self, trigger_values: tuple[Value | None, ...]) -> _Blacklist:
         blacklist: _Blacklist = {}
-        for constraint in self._constraints:
-            for k, v in constraint.blacklist(values).items():
-                if k not in blacklist:
-                    blacklist[k] = set()
-                if v:
-                    blacklist[k] |= v
+        for data_point, value in zip(self._triggers, trigger_values, strict=True):
+            if (entry := self._index.get((data_point, value))) is not None:
+                _merge(blacklist, entry)
         return blacklist
 
     def filter_values(self, values: Values, current: Values) -> Values:
         """Filter values that can be updated given the device constraints."""
         # Check on merged values.
-        blacklist = self._blacklist({**current, **values})
-        filtered: Values = {}
-        for data_point, value in values.items():
-            if data_point in blacklist and (
-                not blacklist[data_point] or value in blacklist[data_point]
-            ):
-                continue
-            filtered[data_point] = value
-        return filtered
+        blacklist = self._get_blacklist(
+            tuple(
+                values[dp] if dp in values else current.get(dp) for dp in self._triggers
+            )
+        )
+        return _filter(blacklist, values)
+
+    def plan(self, values: Values, current: Values) -> list[Values]:
+        """Split values that can be updated given the device constraints in phases
+        to apply in order: values blocked by the current state are applied
+        after the values unblocking them.
+        """
+        remaining = self.filter_values(values, current)
+        phases: list[Values] = []
+        state = current
+        while remaining:
+            phase = _filter(
+                self._get_blacklist(tuple(state.get(dp) for dp in self._triggers)),
+                remaining,
+            )
+            if not phase:
+                # Blocking each other, apply them together.
+                phase = remaining
+            phases.append(phase)
+            state = {**state, **phase}
+            remaining = {k: v for k, v in remaining.items() if k not in phase}
+        return phases
+
+
+def _filter(blacklist: _Blacklist, values: Values) -> Values:
+    if not blacklist:
+        return values.copy()
+    filtered: Values = {}
+    for data_point, value in values.items():
+        if data_point in blacklist and (
+            not blacklist[data_point] or value in blacklist[data_point]
+        ):
+            continue
+        filtered[data_point] = value
+    return filtered
@@ -1,8 +1,9 @@
 import asyncio
 import logging
+import time
 from abc import ABC, abstractmethod
 from collections.abc import Collection
-from contextlib import AsyncExitStack
+from contextlib import AbstractAsyncContextManager, AsyncExitStack
 from functools import partial
 from typing import ClassVar
 
@@ -11,17 +12,27 @@ from concurrent_tasks import TaskPool
 from local_tuya.device.buffer import UpdateBuffer
 from local_tuya.device.config import DeviceConfig
 from local_tuya.device.constraints import Constraints
-from local_tuya.events import EventNotifier
+from local_tuya.device.events import UpdateAborted, UpdatePending
+from local_tuya.events import Dispatch, EventNotifier, Overflow
+from local_tuya.metrics import REGISTRY
 from local_tuya.protocol import DeviceDiscovery, Protocol, Values
+from local_tuya.tracing import TRACER, TraceStatus, current_trace
 from local_tuya.tuya import (
-    TuyaConnectionClosed,
+    TuyaConnectionChanged,
     TuyaConnectionEstablished,
     TuyaProtocol,
     TuyaStateUpdated,
 )
+from local_tuya.watchdog import device_name
 
 logger = logging.getLogger(__name__)
 
+PENDING_TASKS = REGISTRY.gauge(
+    "local_tuya_pending_tasks",
+    "Messages queued or running in the task pool.",
+    ("device",),
+)
+
 
 class Device(AsyncExitStack, ABC):
     DISCOVERY: ClassVar[DeviceDiscovery]
@@ -49,14 +60,53 @@ class Device(AsyncExitStack, ABC):
             constraints=self.CONSTRAINTS,
             retries=config.retries,
             retry_backoff=config.retry_backoff,
+            timeout=config.tuya.timeout,
+            max_delay=(
+                config.max_debounce_updates if config.adaptive_debounce else None
+            ),
+            probe_delay=config.confirmation_probe_delay,
+        )
+        # Released on exit.
+        # Queued so the connection does not wait for the protocol,
+        # only the latest state and availability are relevant.
+        self.enter_context(
+            event_notifier.register(
+                TuyaStateUpdated,
+                self._update_state,
+                Dispatch.queue,
+                maxsize=1,
+                overflow=Overflow.coalesce,
+            )
+        )
+        self.enter_context(
+            event_notifier.register(
+                TuyaConnectionChanged,
+                self._set_availability,
+                Dispatch.queue,
+                maxsize=1,
+                overflow=Overflow.coalesce,
+            )
         )
-        event_notifier.register(TuyaStateUpdated, self._update_state)
-        event_notifier.register(TuyaConnectionEstablished, self._set_availability)
-        event_notifier.register(TuyaConnectionClosed, self._set_availability)
+        if config.optimistic:
+            self.enter_context(
+                event_notifier.register(UpdatePending, self._set_pending)
+            )
+            self.enter_context(
+                event_notifier.register(UpdateAborted, self._abort_pending)
+            )
+        # Optimistic values published until confirmed by the device state.
+        self._tuya_state: Values | None = None
+        self._pending: Values = {}
+        self._published: Values | None = None
 
-        # Run in task pools to buffer traffic and avoid blocking the device.
+        # Run in a task pool to buffer traffic and avoid blocking the device.
+        # Messages wait for the protocol to connect, up to its timeout,
+        # so that they do not pile up while it is disconnected.
+        # Commands are merged in the update buffer instead.
         self._protocol_pool = TaskPool(size=2, timeout=self._protocol.timeout)
-        self._tuya_pool = TaskPool(size=2, timeout=config.tuya.timeout)
+        self._pending_tasks = PENDING_TASKS.labels(name)
+        # Start time, until the first connection is established.
+        self._started: float | None = None
 
     @classmethod
     @abstractmethod
@@ -72,25 +122,81 @@ class Device(AsyncExitStack, ABC):
 
     async def __aenter__(self):
         logger.debug("%s: initializing...", self._name)
-        await self.enter_async_context(self._protocol_pool)
-        await self.enter_async_context(self._tuya_pool)
-        if self._cfg.enable_discovery:
-            self._check_future(
-                self._protocol_pool.create_task(
-                    self._protocol.send_discovery(
-                        self.DISCOVERY.filter_components(self._cfg.included_components),
-                        self._cfg.tuya.id_,
-                        self._name,
+        # Tasks started from here are attributed to the device,
+        # without changing the context of the caller.
+        token = device_name.set(self._name)
+        try:
+            # Stop exporting the metrics of the device once closed.
+            self.callback(REGISTRY.remove, self._name)
+            self.callback(TRACER.remove, self._name)
+            self._started = time.monotonic()
+            await self.enter_async_context(self._protocol_pool)
+            if self._cfg.enable_discovery:
+                self._check_future(
+                    self._protocol_pool.create_task(
+                        self._protocol.send_discovery(
+                            self.DISCOVERY.filter_components(
+                                self._cfg.included_components
+                            ),
+                            self._cfg.tuya.id_,
+                            self._name,
+                        ),
                     ),
-                ),
-                task="sending discovery",
-            )
-        self.callback(self._buffer.close)
-        await self.enter_async_context(self._tuya_protocol.initialize())
+                    task="sending discovery",
+                )
+            self.enter_context(self._buffer)
+            # Let queued listeners process the events emitted while closing the connection.
+            self.push_async_callback(asyncio.sleep, 0)
+            await self.enter_async_context(self._tuya_protocol.initialize())
+        finally:
+            device_name.reset(token)
         return self
 
+    def publishing(self) -> AbstractAsyncContextManager:
+        """Publish the states received without connecting to the device,
+        waiting on exit for those being published.
+        """
+        return self._protocol_pool
+
     def _update_state(self, event: TuyaStateUpdated) -> None:
-        state = self._from_tuya_payload(event.values)
+        if not self._cfg.optimistic:
+            self._send_state(event.values)
+            return
+        self._tuya_state = event.values
+        if self._cfg.retries:
+            # Until confirmed or aborted.
+            self._pending = {
+                k: v for k, v in self._pending.items() if event.values[k] != v
+            }
+        else:
+            # Not checked, the device state prevails.
+            self._pending = {}
+        self._publish_optimistic()
+
+    def _set_pending(self, event: UpdatePending) -> None:
+        self._pending.update(event.values)
+        self._publish_optimistic()
+
+    def _abort_pending(self, event: UpdateAborted) -> None:
+        for k in event.values:
+            self._pending.pop(k, None)
+        # Roll back to the device state, even if it was already published.
+        self._published = None
+        self._publish_optimistic()
+
+    def _publish_optimistic(self) -> None:
+        """Publish the device state with the pending values,
+        unless the same values were already published."""
+        if self._tuya_state is None:
+            return
+        values = {**self._tuya_state, **self._pending}
+        if values == self._published:
+            return
+        self._published = values
+        self._send_state(values)
+
+    def _send_state(self, tuya_values: Values) -> None:
+        state = self._from_tuya_payload(tuya_values)
         logger.debug("%s: received new device state: %s", self._name, state)
         self._check_future(
             self._protocol_pool.create_task(
@@ -99,9 +205,12 @@ class Device(AsyncExitStack, ABC):
             task="sending state update",
         )
 
-    def _set_availability(
-        self, event: TuyaConnectionEstablished | TuyaConnectionClosed
-    ) -> None:
+    def _set_availability(self, event: TuyaConnectionChanged) -> None:
+        if isinstance(event, TuyaConnectionEstablished) and self._started is not None:
+            logger.info(
+                "%s: connected in %.3fs", self._name, time.monotonic() - self._started
+            )
+            self._started = None
         self._check_future(
             self._protocol_pool.create_task(
                 self._protocol.set_availability(
@@ -113,6 +222,14 @@ class Device(AsyncExitStack, ABC):
         )
 
     def update(self, payload: Values) -> None:
+        if trace := current_trace.get():
+            # Identified by the device ID until dispatched.
+            trace.device = self._name
+        if self._tuya_protocol.unreachable:
+            logger.warning("%s: device unreachable, ignoring command", self._name)
+            if trace:
+                TRACER.finish((trace,), TraceStatus.failed)
+            return
         try:
             tuya_payload = self._to_tuya_payload(payload)
         except Exception:
@@ -122,19 +239,20 @@ class Device(AsyncExitStack, ABC):
                 payload,
                 exc_info=True,
             )
+            if trace:
+                TRACER.finish((trace,), TraceStatus.failed)
             return
         logger.debug("%s: received command: %s", self._name, tuya_payload)
-        self._check_future(
-            self._tuya_pool.create_task(self._buffer.update(tuya_payload)),
-            task="sending command to device",
-        )
+        self._buffer.update(tuya_payload, trace)
 
     def _check_future(self, future: asyncio.Future, *, task: str) -> None:
         """Add a callback to warn if errors are raised in background tasks
         otherwise they would be silenced."""
+        self._pending_tasks.inc()
         future.add_done_callback(partial(self._log_task_exceptions, task))
 
     def _log_task_exceptions(self, task: str, future: asyncio.Future) -> None:
+        self._pending_tasks.dec()
         if future.cancelled():
             return
         try:
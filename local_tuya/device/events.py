@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from enum import StrEnum
+
+from local_tuya.events import Event
+from local_tuya.protocol import Values
+
+
+@dataclass
+class UpdatePending(Event):
+    """Values about to be sent to the device, after filtering and constraints."""
+
+    values: Values
+
+
+class AbortReason(StrEnum):
+    # Still not matching the device state after all retries.
+    unconfirmed = "unconfirmed"
+    # No longer sent, reverted by a new update or blocked by the constraints.
+    dropped = "dropped"
+    # Could not be sent to the device.
+    failed = "failed"
+
+
+@dataclass
+class UpdateAborted(Event):
+    """Values announced as pending that will not be applied to the device."""
+
+    values: Values
+    reason: AbortReason
@@ -0,0 +1,3 @@
+from local_tuya.emulator.codec import DeviceCodec
+from local_tuya.emulator.device import Behavior, EmulatedDevice, Fleet
+from local_tuya.emulator.schemas import AIRTON_AC, CEILING_FAN, SCHEMAS, Schema
@@ -0,0 +1,94 @@
+"""Emulate many devices on consecutive local ports, to load test without hardware."""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Annotated
+
+import uvloop
+import yaml
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from local_tuya.emulator.device import Behavior, EmulatedDevice, Fleet
+from local_tuya.emulator.schemas import SCHEMAS
+
+
+class Options(BaseSettings):
+    model_config = SettingsConfigDict(
+        cli_parse_args=True,
+        cli_prog_name="local-tuya-emulator",
+        cli_kebab_case=True,
+    )
+
+    model: Annotated[
+        str, Field(description=f"Device model, one of {', '.join(SCHEMAS)}.")
+    ]
+    count: Annotated[int, Field(description="Number of devices.")] = 1
+    port: Annotated[int, Field(description="Port of the first device.")] = 7000
+    key: Annotated[str, Field(description="Local key of all devices.")] = (
+        "0123456789abcdef"
+    )
+    behavior: Annotated[
+        Behavior, Field(description="Latency, jitter, pushes and failures.")
+    ] = Behavior()
+    devices_config: Annotated[
+        Path | None,
+        Field(description="Write the devices section of the configuration here."),
+    ] = None
+
+
+async def run(options: Options) -> None:
+    fleet = Fleet(
+        EmulatedDevice(
+            f"emulated{i}",
+            options.key.encode(),
+            options.port + i,
+            SCHEMAS[options.model],
+            options.behavior,
+        )
+        for i in range(options.count)
+    )
+    if options.devices_config:
+        options.devices_config.write_text(
+            yaml.safe_dump(
+                {
+                    "devices": [
+                        {
+                            "name": device.id_,
+                            "model": options.model,
+                            "config": {
+                                "tuya": {
+                                    "id_": device.id_,
+                                    "address": device.host,
+                                    "port": device.port,
+                                    "key": options.key,
+                                }
+                            },
+                        }
+                        for device in fleet.devices
+                    ]
+                },
+                sort_keys=False,
+            )
+        )
+    async with fleet:
+        logging.info(
+            "emulating %i devices on ports %i-%i",
+            options.count,
+            options.port,
+            options.port + options.count - 1,
+        )
+        await asyncio.Event().wait()
+
+
+def main() -> None:
+    options = Options()
+    if options.model not in SCHEMAS:
+        raise ValueError(f"unknown model {options.model}")
+    logging.basicConfig(level=logging.INFO)
+    uvloop.run(run(options))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import binascii
+import json
+
+from local_tuya.errors import LocalTuyaError
+from local_tuya.tuya.config import TuyaVersion
+from local_tuya.tuya.message.handlers.crypto import AESCipher
+from local_tuya.tuya.message.handlers.v33 import V33MessageHandler
+from local_tuya.tuya.message.messages import Payload
+
+
+class DeviceCodec:
+    """Device side of the v3.3 protocol: decode commands and encode responses.
+    The framing is the one of `V33MessageHandler`, with a return code in responses.
+    """
+
+    def __init__(self, key: bytes, version: TuyaVersion = TuyaVersion.v33):
+        self._cipher = AESCipher(key)
+        self._version = version
+        self._version_header = version + V33MessageHandler.VERSION_HEADER
+        # Received data, only bytes after the offset are yet to be decoded.
+        self._buffer = b""
+        self._offset = 0
+
+    def feed(self, data: bytes) -> None:
+        if self._offset < len(self._buffer):
+            self._buffer = self._buffer[self._offset :] + data
+        else:
+            self._buffer = data
+        self._offset = 0
+
+    def unpack(self) -> tuple[int, int, Payload | None] | None:
+        """Decode the next command as sequence number, command and payload,
+        `None` if the frame is not complete yet.
+        """
+        header, end = V33MessageHandler.HEADER, V33MessageHandler.END
+        buffer, offset = self._buffer, self._offset
+        if len(buffer) - offset < header.size:
+            return None
+        prefix, sequence_number, command, length = header.unpack_from(buffer, offset)
+        if prefix != V33MessageHandler.PREFIX:
+            raise LocalTuyaError(f"incorrect prefix: 0x{prefix:08x}")
+        if not end.size <= length <= V33MessageHandler.MAX_PAYLOAD_LENGTH:
+            raise LocalTuyaError(f"incorrect payload length: {length}")
+        start = offset + header.size
+        if len(buffer) < start + length:
+            return None
+        self._offset = start + length
+        crc, suffix = end.unpack_from(buffer, self._offset - end.size)
+        if suffix != V33MessageHandler.SUFFIX:
+            raise LocalTuyaError(f"incorrect suffix: 0x{suffix:08x}")
+        if binascii.crc32(buffer[offset : self._offset - end.size]) & 0xFFFFFFFF != crc:
+            raise LocalTuyaError("incorrect hash")
+        payload = buffer[start : self._offset - end.size]
+        if payload.startswith(self._version):
+            payload = payload[len(self._version_header) :]
+        if not payload:
+            return sequence_number, command, None
+        return sequence_number, command, json.loads(self._cipher.decrypt(payload))
+
+    def pack(
+        self,
+        sequence_number: int,
+        command: int,
+        payload: Payload | None = None,
+        return_code: int = 0,
+        version_header: bool = False,
+    ) -> bytes:
+        body = V33MessageHandler.RETURN_CODE.pack(return_code)
+        if payload is not None:
+            if version_header:
+                body += self._version_header
+            body += self._cipher.encrypt(
+                json.dumps(payload, separators=(",", ":")).encode()
+            )
+        data = (
+            V33MessageHandler.HEADER.pack(
+                V33MessageHandler.PREFIX,
+                sequence_number,
+                command,
+                len(body) + V33MessageHandler.END.size,
+            )
+            + body
+        )
+        return data + V33MessageHandler.END.pack(
+            binascii.crc32(data) & 0xFFFFFFFF,
+            V33MessageHandler.SUFFIX,
+        )
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import random
+from collections.abc import Iterable
+from contextlib import AbstractAsyncContextManager, AsyncExitStack
+from typing import cast
+
+from pydantic import BaseModel
+
+from local_tuya.emulator.codec import DeviceCodec
+from local_tuya.emulator.schemas import Schema
+from local_tuya.protocol import Values
+from local_tuya.timers import JITTER, Timer
+from local_tuya.tuya.config import TuyaConfig
+from local_tuya.tuya.message.messages import Payload
+
+logger = logging.getLogger(__name__)
+
+# Command codes.
+UPDATE = 7
+STATUS = 8
+HEARTBEAT = 9
+STATE = 10
+
+
+class Behavior(BaseModel):
+    """How an emulated device deviates from an ideal one."""
+
+    # Seconds before replying, varying randomly by up to `jitter` seconds.
+    latency: float = 0
+    jitter: float = 0
+    # Seconds between spontaneous status pushes of a random data point, 0 to disable.
+    push_interval: float = 0
+    # Probability to drop the connection when receiving a command.
+    disconnect_rate: float = 0
+    # Probability to reply garbage instead of a valid frame.
+    garbage_rate: float = 0
+    # Probability to reply in two halves, the second one `slow_delay` seconds later.
+    slow_rate: float = 0
+    slow_delay: float = 1
+
+
+class _Connection(asyncio.Protocol):
+    def __init__(self, device: EmulatedDevice):
+        self._device = device
+        self._codec = DeviceCodec(device.key)
+        self._transport: asyncio.Transport | None = None
+        self._loop = asyncio.get_running_loop()
+        # Keep replies in order despite the jitter.
+        self._last_reply = 0.0
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        # Not a subclass with uvloop.
+        self._transport = cast(asyncio.Transport, transport)
+        self._device.connections.add(self)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._transport = None
+        self._device.connections.discard(self)
+
+    def data_received(self, data: bytes) -> None:
+        self._codec.feed(data)
+        while self._transport:
+            try:
+                command = self._codec.unpack()
+            except Exception:
+                logger.warning("%s: invalid command, disconnecting", self._device.id_)
+                self.close()
+                return
+            if command is None:
+                return
+            self._device.handle(self, *command)
+
+    def reply(self, frame: bytes) -> None:
+        behavior = self._device.behavior
+        if random.random() < behavior.garbage_rate:
+            frame = random.randbytes(len(frame))
+        when = self._loop.time() + behavior.latency
+        if behavior.jitter:
+            when += random.uniform(0, behavior.jitter)
+        self._last_reply = when = max(when, self._last_reply)
+        if random.random() < behavior.slow_rate:
+            half = len(frame) // 2
+            self._loop.call_at(when, self._write, frame[:half])
+            self._last_reply = when = when + behavior.slow_delay
+            frame = frame[half:]
+        self._loop.call_at(when, self._write, frame)
+
+    def _write(self, data: bytes) -> None:
+        if self._transport and not self._transport.is_closing():
+            self._transport.write(data)
+
+    def close(self) -> None:
+        if self._transport:
+            self._transport.close()
+
+
+class EmulatedDevice(AbstractAsyncContextManager):
+    """Serve the v3.3 protocol on a local port, as a device with the given schema.
+    Heartbeats, state queries and updates are answered, updates are then
+    pushed as a status to all connections as devices do.
+
+    >>> async with EmulatedDevice("id", b"0123456789abcdef", 7000, CEILING_FAN):
+    >>>     ...
+    """
+
+    def __init__(
+        self,
+        id_: str,
+        key: bytes,
+        port: int,
+        schema: Schema,
+        behavior: Behavior | None = None,
+        host: str = "127.0.0.1",
+    ):
+        self.id_ = id_
+        self.key = key
+        self.port = port
+        self.host = host
+        self.behavior = behavior or Behavior()
+        self.schema = {str(k): v for k, v in schema.items()}
+        self.values: Values = {k: v[0] for k, v in self.schema.items()}
+        self.connections: set[_Connection] = set()
+        self._codec = DeviceCodec(key)
+        self._server: asyncio.Server | None = None
+        self._push_timer = Timer(self._push)
+        self._sequence_number = 0
+
+    @property
+    def tuya_config(self) -> TuyaConfig:
+        """Configuration to connect to this device."""
+        return TuyaConfig(id_=self.id_, address=self.host, port=self.port, key=self.key)
+
+    async def __aenter__(self):
+        self._server = await asyncio.get_running_loop().create_server(
+            lambda: _Connection(self), self.host, self.port
+        )
+        # In case the port was chosen by the system.
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.behavior.push_interval:
+            self._push_timer.reset(self.behavior.push_interval, JITTER)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._push_timer.cancel()
+        if self._server:
+            self._server.close()
+            self.disconnect()
+            await self._server.wait_closed()
+            self._server = None
+
+    def disconnect(self) -> None:
+        """Drop all connections."""
+        for connection in list(self.connections):
+            connection.close()
+
+    def handle(
+        self,
+        connection: _Connection,
+        sequence_number: int,
+        command: int,
+        payload: Payload | None,
+    ) -> None:
+        if random.random() < self.behavior.disconnect_rate:
+            connection.close()
+            return
+        if command == HEARTBEAT:
+            connection.reply(self._codec.pack(sequence_number, HEARTBEAT))
+        elif command == STATE:
+            connection.reply(
+                self._codec.pack(sequence_number, STATE, {"dps": self.values})
+            )
+        elif command == UPDATE:
+            dps = payload.get("dps") if payload else None
+            if not isinstance(dps, dict) or not dps.keys() <= self.schema.keys():
+                connection.reply(
+                    self._codec.pack(sequence_number, UPDATE, return_code=1)
+                )
+                return
+            connection.reply(self._codec.pack(sequence_number, UPDATE))
+            self.update(dps)
+        else:
+            logger.warning("%s: unknown command %i", self.id_, command)
+
+    def update(self, values: Values) -> None:
+        """Change values and push a status to all connections."""
+        self.values.update(values)
+        self._sequence_number += 1
+        frame = self._codec.pack(
+            self._sequence_number, STATUS, {"dps": values}, version_header=True
+        )
+        for connection in self.connections:
+            connection.reply(frame)
+
+    def _push(self) -> None:
+        data_point = random.choice(tuple(self.schema))
+        self.update({data_point: random.choice(self.schema[data_point])})
+        self._push_timer.reset(self.behavior.push_interval, JITTER)
+
+
+class Fleet(AsyncExitStack):
+    """Serve many emulated devices from a single event loop."""
+
+    def __init__(self, devices: Iterable[EmulatedDevice]):
+        super().__init__()
+        self.devices = tuple(devices)
+
+    async def __aenter__(self):
+        await super().__aenter__()
+        try:
+            await asyncio.gather(*(self.enter_async_context(d) for d in self.devices))
+        except BaseException:
+            await self.aclose()
+            raise
+        return self
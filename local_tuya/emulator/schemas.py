@@ -0,0 +1,48 @@
+from collections.abc import Mapping, Sequence
+
+from local_tuya.contrib.airton_ac import (
+    ACDataPoint,
+    ACFanSpeed,
+    ACMode,
+    AirtonACDevice,
+)
+from local_tuya.contrib.ceiling_fan import (
+    CeilingFanDevice,
+    FanDataPoint,
+    FanDirection,
+    FanMode,
+    FanSpeed,
+)
+from local_tuya.protocol import Value
+
+# Values a data point can take, the first one is the initial value.
+type Schema = Mapping[str, Sequence[Value]]
+
+_SWITCH = (False, True)
+
+AIRTON_AC: Schema = {
+    ACDataPoint.power: _SWITCH,
+    ACDataPoint.set_point: tuple(range(210, 320, 10)) + tuple(range(160, 210, 10)),
+    ACDataPoint.temperature: tuple(range(220, 350, 5)) + tuple(range(100, 220, 5)),
+    ACDataPoint.mode: tuple(ACMode),
+    ACDataPoint.fan: tuple(ACFanSpeed),
+    ACDataPoint.eco: _SWITCH,
+    ACDataPoint.light: _SWITCH,
+    ACDataPoint.swing: ("off", "un_down"),
+    ACDataPoint.swing_direction: ("off", ACDataPoint.swing.value),
+    ACDataPoint.sleep: _SWITCH,
+    ACDataPoint.health: _SWITCH,
+}
+
+CEILING_FAN: Schema = {
+    FanDataPoint.power: _SWITCH,
+    FanDataPoint.speed: tuple(FanSpeed),
+    FanDataPoint.direction: tuple(FanDirection),
+    FanDataPoint.light: _SWITCH,
+    FanDataPoint.mode: tuple(FanMode),
+}
+
+SCHEMAS: dict[str, Schema] = {
+    AirtonACDevice.DISCOVERY.model: AIRTON_AC,
+    CeilingFanDevice.DISCOVERY.model: CEILING_FAN,
+}
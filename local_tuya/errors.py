@@ -8,3 +8,7 @@ class ResponseError(LocalTuyaError):
 
 class DecodeResponseError(LocalTuyaError):
     """Error parsing Tuya response."""
+
+
+class DeviceUnreachableError(LocalTuyaError):
+    """Tuya device could not be reached for a long time."""
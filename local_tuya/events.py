@@ -1,9 +1,16 @@
+import asyncio
+import contextvars
 import inspect
 import logging
-from collections import defaultdict
-from collections.abc import Awaitable, Callable
+import weakref
+from collections import defaultdict, deque
+from collections.abc import Callable, Coroutine, Iterable
+from contextlib import AbstractContextManager
+from enum import StrEnum
 from typing import Any, cast
 
+from local_tuya.watchdog import device_name
+
 logger = logging.getLogger(__name__)
 
 
@@ -11,36 +18,252 @@ class Event:
     """Base event class"""
 
 
+class Dispatch(StrEnum):
+    """How events are passed to a listener."""
+
+    # Awaited by the emitter, in order of registration.
+    inline = "inline"
+    # Run in a separate task, the emitter does not wait for it.
+    task = "task"
+    # Queued and run in order in a separate task, the emitter does not wait for it.
+    queue = "queue"
+
+
+class Overflow(StrEnum):
+    """What to do when the queue of a listener is full."""
+
+    # Discard the new event.
+    drop = "drop"
+    # Discard the oldest event, keeping the latest ones.
+    coalesce = "coalesce"
+
+
+# Listener and whether it is a coroutine function.
+type _Listener = tuple[Callable[[Event], Any], bool]
+
+
 class EventNotifier:
-    def __init__(self):
-        self._listeners: defaultdict[
-            type[Event], list[Callable[[Event], Awaitable[None]]]
-        ] = defaultdict(list)
+    """Notify listeners of events.
+    Listeners registered for a class also receive events of its subclasses,
+    after the listeners of the subclass.
+    """
+
+    def __init__(self, name: str = ""):
+        # Name of the device, listeners dispatched in tasks run in its context.
+        self._context = contextvars.copy_context()
+        if name:
+            self._context.run(device_name.set, name)
+        self._listeners: defaultdict[type[Event], list[_Listener]] = defaultdict(list)
+        # Listeners by class of event emitted, computed when first emitted.
+        self._routes: dict[type[Event], tuple[_Listener, ...]] = {}
 
     def register[T: Event](
-        self, event_class: type[T], listener: Callable[[T], Any]
-    ) -> None:
-        self._listeners[event_class].append(
-            cast(
-                Callable[[Event], Awaitable[None]],
-                _make_async(listener),
-            )
+        self,
+        event_class: type[T],
+        listener: Callable[[T], Any],
+        dispatch: Dispatch = Dispatch.inline,
+        maxsize: int = 100,
+        overflow: Overflow = Overflow.drop,
+        weak: bool = False,
+    ) -> Registration:
+        """Register a listener for an event class.
+        Listeners not dispatched inline do not delay the emitter, use a queue
+        with a max size to bound the number of events pending.
+        Bound methods can be referenced weakly,
+        they are unregistered when their object is garbage collected.
+
+        >>> with notifier.register(MyEvent, listener):
+        >>>     ...  # Unregistered when exiting.
+        """
+        registration = Registration(self, event_class)
+        wrapped: Callable[[T], Any] = listener
+        if weak:
+            wrapped = _WeakListener(listener, registration.unregister)
+        match dispatch:
+            case Dispatch.task:
+                wrapped = registration.dispatcher = _TaskDispatcher(
+                    wrapped, self._context
+                )
+            case Dispatch.queue:
+                wrapped = registration.dispatcher = _QueueDispatcher(
+                    wrapped, self._context, maxsize, overflow
+                )
+        registration.listener = (
+            cast(Callable[[Event], Any], wrapped),
+            inspect.iscoroutinefunction(wrapped),
         )
+        self._listeners[event_class].append(registration.listener)
+        self._routes.clear()
+        return registration
+
+    def unregister(self, event_class: type[Event], listener: _Listener) -> None:
+        listeners = self._listeners.get(event_class, [])
+        for i, registered in enumerate(listeners):
+            if registered is listener:
+                del listeners[i]
+                self._routes.clear()
+                return
+
+    def listener_counts(self) -> dict[str, int]:
+        """Number of listeners by event class, to check for leaks."""
+        return {
+            event_class.__name__: len(listeners)
+            for event_class, listeners in self._listeners.items()
+            if listeners
+        }
 
     async def emit(self, event: Event) -> None:
-        for listener in self._listeners[type(event)]:
+        listeners = self._routes.get(type(event))
+        if listeners is None:
+            listeners = self._route(type(event))
+        for listener, is_async in listeners:
             try:
-                await listener(event)
+                if is_async:
+                    await listener(event)
+                # Sync functions can still return a coroutine.
+                elif (res := listener(event)) is not None and inspect.iscoroutine(res):
+                    await res
             except Exception:
-                logger.warning(
-                    "error processing event %r for listener %s", event, listener
-                )
+                _log_error(event, listener)
+
+    async def emit_many(self, events: Iterable[Event]) -> None:
+        """Emit events in order."""
+        for event in events:
+            await self.emit(event)
+
+    def _route(self, event_class: type[Event]) -> tuple[_Listener, ...]:
+        listeners = tuple(
+            listener
+            for cls in event_class.__mro__
+            for listener in self._listeners.get(cls, ())
+        )
+        self._routes[event_class] = listeners
+        return listeners
+
+
+class Registration(AbstractContextManager):
+    """Handle to unregister a listener."""
 
+    def __init__(self, notifier: EventNotifier, event_class: type[Event]):
+        self._notifier = notifier
+        self._event_class = event_class
+        self.listener: _Listener | None = None
+        # Listeners not dispatched inline, stopped when unregistered.
+        self.dispatcher: _TaskDispatcher | _QueueDispatcher | None = None
 
-def _make_async[**P](func: Callable[P, Any]) -> Callable[P, Awaitable[None]]:
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.unregister()
+
+    def unregister(self) -> None:
+        if self.listener:
+            self._notifier.unregister(self._event_class, self.listener)
+            self.listener = None
+        if self.dispatcher:
+            self.dispatcher.close()
+            self.dispatcher = None
+
+
+def _log_error(event: Event, listener: Callable) -> None:
+    logger.warning("error processing event %r for listener %s", event, listener)
+
+
+def _make_async[**P](
+    func: Callable[P, Any],
+) -> Callable[P, Coroutine[Any, Any, None]]:
     async def _wrapper(*args: P.args, **kwargs: P.kwargs) -> None:
         res = func(*args, **kwargs)
         if inspect.iscoroutine(res):
             await res
 
     return _wrapper
+
+
+class _WeakListener:
+    def __init__(self, method: Callable[[Any], Any], callback: Callable[[], None]):
+        self._ref = weakref.WeakMethod(method, lambda _: callback())
+
+    def __call__(self, event: Event) -> Any:
+        if (method := self._ref()) is not None:
+            return method(event)
+        return None
+
+    def __repr__(self) -> str:
+        return f"weak {self._ref()}"
+
+
+class _TaskDispatcher:
+    def __init__(self, listener: Callable[[Any], Any], context: contextvars.Context):
+        self._listener = listener
+        self._context = context
+        self._run = _make_async(listener)
+        # Keep references until tasks are done.
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+
+    def __call__(self, event: Event) -> None:
+        if self._closed:
+            return
+        task = asyncio.create_task(self._run(event), context=self._context)
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._done(event, t))
+
+    def _done(self, event: Event, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            _log_error(event, self._listener)
+
+    def close(self) -> None:
+        """Cancel the events being processed."""
+        self._closed = True
+        for task in self._tasks:
+            task.cancel()
+
+
+class _QueueDispatcher:
+    def __init__(
+        self,
+        listener: Callable[[Any], Any],
+        context: contextvars.Context,
+        maxsize: int,
+        overflow: Overflow,
+    ):
+        self._listener = listener
+        self._context = context
+        self._run = _make_async(listener)
+        self._maxsize = maxsize
+        self._overflow = overflow
+        self._queue: deque[Event] = deque()
+        self._task: asyncio.Task | None = None
+        self._closed = False
+
+    def __call__(self, event: Event) -> None:
+        if self._closed:
+            return
+        if len(self._queue) >= self._maxsize:
+            if self._overflow is Overflow.drop:
+                logger.warning(
+                    "queue full for listener %s, dropping %r", self._listener, event
+                )
+                return
+            self._queue.popleft()
+        self._queue.append(event)
+        if not self._task:
+            self._task = asyncio.create_task(self._process(), context=self._context)
+
+    async def _process(self) -> None:
+        try:
+            while self._queue:
+                event = self._queue.popleft()
+                try:
+                    await self._run(event)
+                except Exception:
+                    _log_error(event, self._listener)
+        finally:
+            self._task = None
+
+    def close(self) -> None:
+        """Discard the events queued and cancel the one being processed."""
+        self._closed = True
+        self._queue.clear()
+        if self._task:
+            self._task.cancel()
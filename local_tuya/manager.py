@@ -1,5 +1,6 @@
 import asyncio
 import logging.config
+import time
 from collections.abc import AsyncIterator
 from contextlib import AsyncExitStack, asynccontextmanager
 
@@ -11,8 +12,11 @@ from local_tuya.contrib import FullDeviceConfig
 from local_tuya.dependencies import load_container
 from local_tuya.device import Device
 from local_tuya.events import EventNotifier
+from local_tuya.metrics import MetricsServer
 from local_tuya.protocol import Protocol
-from local_tuya.tuya import TuyaPackage, TuyaProtocol
+from local_tuya.tracing import TRACER, Stage, current_trace
+from local_tuya.tuya import PresenceListener, TuyaPackage, TuyaProtocol
+from local_tuya.watchdog import Watchdog
 
 logger = logging.getLogger(__name__)
 
@@ -24,19 +28,88 @@ class DeviceManager(AsyncExitStack):
         self._stop_event = asyncio.Event()
 
     async def __aenter__(self):
+        if self._cfg.watchdog.enabled:
+            await self.enter_async_context(Watchdog(self._cfg.watchdog))
+        if self._cfg.metrics.port is not None:
+            await self.enter_async_context(MetricsServer(self._cfg.metrics))
+        self.enter_context(TRACER.configure(self._cfg.tracing))
         app_container = await self.enter_async_context(
             load_container(self._cfg).application_context()
         )
         logger.debug("initializing...")
         protocol = await app_container.get(Protocol)
+        connection_limiter = asyncio.Semaphore(self._cfg.max_concurrent_connections)
+        presence_listener = (
+            await self.enter_async_context(PresenceListener())
+            if self._cfg.presence_listener
+            else None
+        )
         devices: dict[str, Device] = {}
-        for device_config in self._cfg.devices:
-            device = await self.enter_async_context(
-                self._create_and_run_device(device_config, protocol)
+        # Each device is entered and exited in its own task,
+        # started is resolved once entered.
+        stop_devices = asyncio.Event()
+        started: list[asyncio.Future[Device]] = []
+        tasks: list[asyncio.Task] = []
+        self.push_async_callback(self._stop_devices, stop_devices, tasks)
+        for i, device_config in enumerate(self._cfg.devices):
+            started.append(asyncio.get_running_loop().create_future())
+            tasks.append(
+                asyncio.create_task(
+                    self._run_device(
+                        device_config,
+                        protocol,
+                        connection_limiter,
+                        presence_listener,
+                        # Stagger startups to avoid flooding the network and the broker.
+                        i / self._cfg.startup_rate,
+                        started[-1],
+                        stop_devices,
+                    )
+                )
             )
-            devices[device_config.config.tuya.id_] = device
+        # A device failing to start does not prevent the others from starting.
+        results = await asyncio.gather(*started, return_exceptions=True)
+        for device_config, result in zip(self._cfg.devices, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.error("%s: could not start", device_config.name, exc_info=result)
+            else:
+                devices[device_config.config.tuya.id_] = result
         self.enter_context(BackgroundTask(self._receive_commands, protocol, devices))
-        logger.info("initialized %d device(s)", len(self._cfg.devices))
+        logger.info("initialized %d device(s)", len(devices))
+
+    @staticmethod
+    async def _stop_devices(stop: asyncio.Event, tasks: list[asyncio.Task]) -> None:
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_device(
+        self,
+        device_config: FullDeviceConfig,
+        protocol: Protocol,
+        connection_limiter: asyncio.Semaphore,
+        presence_listener: PresenceListener | None,
+        delay: float,
+        started: asyncio.Future[Device],
+        stop: asyncio.Event,
+    ) -> None:
+        """Run the device until stopped."""
+        try:
+            await asyncio.sleep(delay)
+            start = time.monotonic()
+            async with self._create_and_run_device(
+                device_config, protocol, connection_limiter, presence_listener
+            ) as device:
+                logger.debug(
+                    "%s: started in %.3fs", device_config.name, time.monotonic() - start
+                )
+                if not started.done():
+                    started.set_result(device)
+                await stop.wait()
+        except Exception as e:
+            if started.done():
+                logger.error("%s: exception caught", device_config.name, exc_info=True)
+            else:
+                started.set_exception(e)
 
     async def _stop(self) -> None:
         self._stop_event.set()
@@ -55,6 +128,8 @@ class DeviceManager(AsyncExitStack):
         logger.debug("receiving commands...")
         async for device_id, payload in protocol.receive_commands():
             if device := devices.get(device_id):
+                if trace := current_trace.get():
+                    trace.mark(Stage.dispatched)
                 device.update(payload)
             else:
                 logger.warning("received command for unknown device: %s", device_id)
@@ -64,12 +139,16 @@ class DeviceManager(AsyncExitStack):
         self,
         device_config: FullDeviceConfig,
         protocol: Protocol,
+        connection_limiter: asyncio.Semaphore,
+        presence_listener: PresenceListener | None,
     ) -> AsyncIterator[Device]:
         device_class = device_config.infer()
         async with Container(
             TuyaPackage(
                 name=device_config.name,
                 config=device_config.config.tuya,
+                connection_limiter=connection_limiter,
+                presence_listener=presence_listener,
             ),
         ).application_context() as device_container:
             event_notifier = await device_container.get(EventNotifier)
@@ -82,3 +161,17 @@ class DeviceManager(AsyncExitStack):
                 tuya_protocol,
             ) as device:
                 yield device
+        if listeners := event_notifier.listener_counts():
+            logger.warning(
+                "%s: listeners not released: %s", device_config.name, listeners
+            )
+        if latencies := TRACER.percentiles(device_config.name):
+            logger.info(
+                "%s: command latencies: %s",
+                device_config.name,
+                ", ".join(
+                    f"{stage} "
+                    + " ".join(f"p{p}={v:.3f}s" for p, v in percentiles.items())
+                    for stage, percentiles in latencies.items()
+                ),
+            )
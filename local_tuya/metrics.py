@@ -0,0 +1,277 @@
+import asyncio
+import bisect
+import logging
+from array import array
+from collections.abc import Callable, Sequence
+from contextlib import AbstractAsyncContextManager
+from typing import ClassVar
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsConfig(BaseModel):
+    # Serve metrics in Prometheus text format on this port, disabled if not set.
+    port: int | None = None
+    host: str = "127.0.0.1"
+
+
+class Metric:
+    """Family of metrics sharing a name, one value per combination of labels.
+    Values are stored in preallocated arrays, children are created once
+    when setting up components so recording does not allocate.
+    """
+
+    TYPE: ClassVar[str]
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children: dict[tuple[str, ...], int] = {}
+        self._values = array("d")
+
+    def _index(self, labels: tuple[str, ...]) -> int:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        if labels not in self._children:
+            self._children[labels] = len(self._values)
+            self._values.append(0)
+        return self._children[labels]
+
+    def remove(self, *labels: str) -> None:
+        """Stop exporting a child, its value is not reused."""
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        self._children.pop(labels, None)
+
+    def _format_labels(self, labels: tuple[str, ...], **extra: str) -> str:
+        pairs = [*zip(self.label_names, labels, strict=True), *extra.items()]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+        for labels, index in self._children.items():
+            lines.append(
+                f"{self.name}{self._format_labels(labels)} {self._values[index]}"
+            )
+        return lines
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def labels(self, *labels: str) -> CounterChild:
+        return CounterChild(self._values, self._index(labels))
+
+
+class CounterChild:
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, values: array, index: int):
+        self._values = values
+        self._index = index
+
+    @property
+    def value(self) -> float:
+        return self._values[self._index]
+
+    def inc(self, amount: float = 1) -> None:
+        self._values[self._index] += amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def labels(self, *labels: str) -> GaugeChild:
+        return GaugeChild(self._values, self._index(labels))
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1) -> None:
+        self._values[self._index] -= amount
+
+    def set(self, value: float) -> None:
+        self._values[self._index] = value
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # For each child: a count per bucket, then +Inf, then the sum.
+        self._size = len(self.buckets) + 2
+
+    def labels(self, *labels: str) -> HistogramChild:
+        if labels not in self._children:
+            self._index(labels)
+            # Reserve the rest of the child's values.
+            self._values.extend([0] * (self._size - 1))
+        return HistogramChild(self.buckets, self._values, self._children[labels])
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+        for labels, index in self._children.items():
+            cumulative = 0.0
+            for i, bound in enumerate((*self.buckets, "+Inf")):
+                cumulative += self._values[index + i]
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{self._format_labels(labels, le=str(bound))} {cumulative}"
+                )
+            lines.append(
+                f"{self.name}_sum{self._format_labels(labels)} "
+                f"{self._values[index + self._size - 1]}"
+            )
+            lines.append(f"{self.name}_count{self._format_labels(labels)} {cumulative}")
+        return lines
+
+
+class HistogramChild:
+    __slots__ = ("_buckets", "_index", "_values")
+
+    def __init__(self, buckets: tuple[float, ...], values: array, index: int):
+        self._buckets = buckets
+        self._values = values
+        self._index = index
+
+    def observe(self, value: float) -> None:
+        self._values[self._index + bisect.bisect_left(self._buckets, value)] += 1
+        self._values[self._index + len(self._buckets) + 1] += value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        # Called before rendering, to update values computed on demand.
+        self._collectors: list[Callable[[], None]] = []
+
+    def counter(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def remove(self, device: str) -> None:
+        """Remove the children of a device that was closed, from all metrics."""
+        for metric in self._metrics.values():
+            if "device" not in metric.label_names:
+                continue
+            index = metric.label_names.index("device")
+            for labels in [c for c in metric._children if c[index] == device]:
+                metric.remove(*labels)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.remove(collector)
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text format."""
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register[M: Metric](self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+# Default registry, fed by all components.
+REGISTRY = Registry()
+
+
+class MetricsServer(AbstractAsyncContextManager):
+    """Serve metrics over HTTP for scraping."""
+
+    def __init__(self, config: MetricsConfig, registry: Registry = REGISTRY):
+        self._host = config.host
+        self._port = config.port
+        self._registry = registry
+        self._server: asyncio.Server | None = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        logger.info("serving metrics on %s:%s", self._host, self.port)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @property
+    def port(self) -> int:
+        assert self._server
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+            if path == b"/metrics":
+                status = b"200 OK"
+                body = self._registry.render().encode()
+            else:
+                status = b"404 Not Found"
+                body = b""
+            writer.write(
+                b"HTTP/1.1 "
+                + status
+                + b"\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8"
+                + b"\r\nContent-Length: "
+                + str(len(body)).encode()
+                + b"\r\nConnection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except asyncio.IncompleteReadError:
+            # Disconnected before sending the request.
+            pass
+        except Exception:
+            logger.error("error serving metrics", exc_info=True)
+        finally:
+            writer.close()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
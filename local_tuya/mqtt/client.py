@@ -3,11 +3,12 @@ import contextlib
 import json
 import logging
 from collections.abc import AsyncIterator
-from time import time_ns
+from time import monotonic, time_ns
 
 import aiomqtt
 from concurrent_tasks import BackgroundTask
 
+from local_tuya.metrics import REGISTRY
 from local_tuya.mqtt.config import (
     MQTTConfig,
     get_state_topic,
@@ -15,9 +16,18 @@ from local_tuya.mqtt.config import (
 )
 from local_tuya.mqtt.discovery import DiscoveryMessage
 from local_tuya.protocol import DeviceDiscovery, Protocol, Value, Values
+from local_tuya.tracing import TRACER, current_trace
 
 logger = logging.getLogger(__name__)
 
+PUBLISHES = REGISTRY.counter("local_tuya_mqtt_publishes_total", "Messages published.")
+PUBLISH_FAILURES = REGISTRY.counter(
+    "local_tuya_mqtt_publish_failures_total", "Messages that failed to be published."
+)
+RECONNECTS = REGISTRY.counter(
+    "local_tuya_mqtt_reconnects_total", "Connections lost to the broker."
+)
+
 
 class MQTTClient(Protocol):
     def __init__(self, config: MQTTConfig):
@@ -39,11 +49,21 @@ class MQTTClient(Protocol):
         self._connected = asyncio.Event()
         self._backoff = config.backoff
         self._closed = True
+        # Retained messages by topic, published again on connection,
+        # so that discovery and availability sent while disconnected are not lost.
+        self._retained: dict[str, str | bytes] = {}
+        # Pacing of publishes, allowing bursts of up to `max_publish_rate` messages.
+        self._publish_rate = config.max_publish_rate
+        self._publish_tokens = config.max_publish_rate
+        self._tokens_updated = monotonic()
+        self._publishes = PUBLISHES.labels()
+        self._publish_failures = PUBLISH_FAILURES.labels()
+        self._reconnects = RECONNECTS.labels()
 
     async def __aenter__(self):
         self._closed = False
+        # Do not wait for the connection, messages are published once connected.
         self._connect_task.create()
-        await self._connected.wait()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -71,9 +91,12 @@ class MQTTClient(Protocol):
         await self._client.publish(self._status_topic, b"online", retain=True)
         await self._client.subscribe(f"{self._driver_prefix}/set/#")
         logger.info("connected to mqtt")
+        for topic, payload in list(self._retained.items()):
+            await self._publish(topic, payload, retain=True)
 
     async def _reconnect(self) -> None:
         if not self._closed and self._connected.is_set():
+            self._reconnects.inc()
             self._connected.clear()
             with contextlib.suppress(aiomqtt.MqttError):
                 await self._client.__aexit__(None, None, None)
@@ -88,7 +111,10 @@ class MQTTClient(Protocol):
             await self._connected.wait()
             try:
                 async for message in self._client.messages:
+                    received = monotonic()
                     if result := self._process_message(message):
+                        # Followed by the consumer, iterating in the same context.
+                        current_trace.set(TRACER.start(result[0], received))
                         yield result
                 break
             except aiomqtt.MqttError:
@@ -179,17 +205,40 @@ class MQTTClient(Protocol):
     ):
         if self._closed:
             raise RuntimeError("client is closed")
+        if retain:
+            self._retained[topic] = payload
+            if not self._connected.is_set():
+                # Published on connection.
+                return
         while True:
             if self._closed:
                 break
             await self._connected.wait()
+            await self._pace()
             try:
                 await self._client.publish(
                     topic,
                     payload,
                     retain=retain,
                 )
+                self._publishes.inc()
                 break
             except aiomqtt.MqttError:
+                self._publish_failures.inc()
                 logger.warning("error sending message, reconnecting")
                 await self._reconnect()
+
+    async def _pace(self) -> None:
+        """Wait for a token to publish, tokens are refilled at the publish rate."""
+        if not self._publish_rate:
+            return
+        now = monotonic()
+        self._publish_tokens = min(
+            self._publish_rate,
+            self._publish_tokens + (now - self._tokens_updated) * self._publish_rate,
+        )
+        self._tokens_updated = now
+        # Reserve a token, waiting in order for those already reserved.
+        self._publish_tokens -= 1
+        if self._publish_tokens < 0:
+            await asyncio.sleep(-self._publish_tokens / self._publish_rate)
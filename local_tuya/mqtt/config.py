@@ -20,6 +20,9 @@ class MQTTConfig(BaseModel):
     password: str | None = None
     timeout: float = 5
     keepalive: int = 60
+    # Messages published per second, in bursts of up to as many messages,
+    # to avoid flooding the broker on startup. Set to 0 to disable.
+    max_publish_rate: float = 100
     backoff: SequenceBackoff = Field(
         default_factory=lambda: SequenceBackoff(0, 1, 5, 10, 30, 60, 300)
     )
@@ -0,0 +1,167 @@
+"""Replay frames recorded from a device through the receive pipeline:
+decoding, state and device model.
+At maximum speed, this measures the throughput of the pipeline on real traffic.
+"""
+
+import asyncio
+import logging.config
+import time
+from collections.abc import AsyncIterator, Iterable
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Annotated
+
+import uvloop
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from local_tuya.config import Config
+from local_tuya.contrib import FullDeviceConfig
+from local_tuya.events import EventNotifier
+from local_tuya.protocol import DeviceDiscovery, Protocol, Values
+from local_tuya.tuya import TuyaProtocol
+from local_tuya.tuya.message import get_handler
+from local_tuya.tuya.recorder import Direction, Record, read_records
+from local_tuya.tuya.state import State
+from local_tuya.tuya.transport import DECODE_ERRORS, Transport
+
+
+@dataclass
+class ReplayStats:
+    frames: int = 0
+    messages: int = 0
+    decode_errors: int = 0
+    states: int = 0
+    elapsed: float = 0
+
+
+class _ReplayProtocol(Protocol):
+    """Count the states the device model would publish."""
+
+    def __init__(self, stats: ReplayStats):
+        self.timeout = 5
+        self._stats = stats
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None: ...
+
+    async def receive_commands(self) -> AsyncIterator[tuple[str, Values]]:
+        return
+        yield
+
+    async def send_state(self, device_id: str, payload: Values) -> None:
+        self._stats.states += 1
+
+    async def set_availability(self, device_id: str, status: bool) -> None: ...
+
+    async def send_discovery(
+        self, device: DeviceDiscovery, device_id: str, device_name: str
+    ) -> None: ...
+
+
+async def replay(
+    device_config: FullDeviceConfig,
+    records: Iterable[Record],
+    speed: float = 1,
+) -> ReplayStats:
+    """Feed frames received from the device, at the original speed multiplied by
+    `speed`, or as fast as possible if 0.
+    """
+    stats = ReplayStats()
+    tuya_config = device_config.config.tuya
+    handler = get_handler(tuya_config)
+    notifier = EventNotifier(device_config.name)
+    # Never entered, only decoding frames.
+    transport = Transport(
+        name=device_config.name,
+        address=tuya_config.address,
+        port=tuya_config.port,
+        backoff=tuya_config.connection_backoff,
+        timeout=tuya_config.timeout,
+        keepalive=0,
+        message_handler=handler,
+        event_notifier=notifier,
+    )
+    tuya_protocol = TuyaProtocol(
+        device_config.name, notifier, transport, tuya_config.timeout
+    )
+    device = device_config.infer()(
+        device_config.name,
+        device_config.config,
+        _ReplayProtocol(stats),
+        notifier,
+        tuya_protocol,
+    )
+    start = time.perf_counter()
+    first: float | None = None
+    async with AsyncExitStack() as stack:
+        # Release the listeners of the components not entered.
+        stack.push_async_callback(transport.aclose)
+        stack.callback(tuya_protocol.close)
+        stack.push_async_callback(device.aclose)
+        stack.enter_context(State(device_config.name, float("inf"), notifier))
+        decode_errors = DECODE_ERRORS.labels(device_config.name)
+        initial_errors = decode_errors.value
+        async with device.publishing():
+            for record in records:
+                if record.direction is not Direction.received:
+                    continue
+                if first is None:
+                    first = record.timestamp
+                elif speed:
+                    delay = (record.timestamp - first) / speed
+                    await asyncio.sleep(delay - (time.perf_counter() - start))
+                stats.frames += 1
+                for event in transport.decode(record.data):
+                    stats.messages += 1
+                    await notifier.emit(event)
+                # Let the device process the state, queued by its listener,
+                # as it would while waiting for the next data from the connection.
+                await asyncio.sleep(0)
+        stats.decode_errors = int(decode_errors.value - initial_errors)
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+class Options(BaseSettings):
+    model_config = SettingsConfigDict(
+        cli_parse_args=True,
+        cli_prog_name="local-tuya-replay",
+        cli_kebab_case=True,
+    )
+
+    config: Annotated[
+        str,
+        Field(description="The path containing the configuration."),
+    ]
+    device: Annotated[str, Field(description="Name of the device recorded.")]
+    recording: Annotated[Path, Field(description="The recording to replay.")]
+    speed: Annotated[
+        float,
+        Field(description="Speed factor, 0 to replay as fast as possible."),
+    ] = 1
+
+
+def main() -> None:
+    options = Options()
+    Config.YAML_FILE = options.config
+    config = Config()
+    logging.config.dictConfig(config.logging)
+    device_config = next((d for d in config.devices if d.name == options.device), None)
+    if not device_config:
+        raise ValueError(f"unknown device {options.device}")
+    stats = uvloop.run(
+        replay(device_config, read_records(options.recording), options.speed)
+    )
+    print(
+        f"{stats.frames} frames, {stats.messages} messages, "
+        f"{stats.decode_errors} decode errors, {stats.states} states "
+        f"in {stats.elapsed:.3f}s ({stats.messages / stats.elapsed:,.0f} messages/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import weakref
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Spread periodic timers of components started together.
+JITTER = 0.1
+
+
+class Scheduler:
+    """Run timer callbacks for all components of an event loop,
+    using a single loop handle for the earliest deadline.
+
+    Postponing a timer is lazy, its entry is checked again when due.
+    Cancelled entries release their timer, and are removed when due
+    or once they make up half of the heap.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._heap: list[_Entry] = []
+        self._counter = itertools.count()
+        self._handle: asyncio.TimerHandle | None = None
+        self._removed = 0
+
+    def time(self) -> float:
+        return self._loop.time()
+
+    def push(self, timer: Timer, when: float) -> _Entry:
+        entry = _Entry(when, next(self._counter), timer)
+        heapq.heappush(self._heap, entry)
+        if self._handle is None or when < self._handle.when():
+            if self._handle:
+                self._handle.cancel()
+            self._handle = self._loop.call_at(when, self._run)
+        return entry
+
+    def remove(self, entry: _Entry) -> None:
+        entry.timer = None
+        self._removed += 1
+        if self._removed * 2 >= len(self._heap):
+            self._heap = [e for e in self._heap if e.timer]
+            heapq.heapify(self._heap)
+            self._removed = 0
+            if not self._heap and self._handle:
+                self._handle.cancel()
+                self._handle = None
+
+    def _run(self) -> None:
+        self._handle = None
+        now = self._loop.time()
+        while self._heap and self._heap[0].when <= now:
+            entry = heapq.heappop(self._heap)
+            if entry.timer:
+                entry.timer.expire(now)
+            else:
+                self._removed -= 1
+        if self._heap:
+            self._handle = self._loop.call_at(self._heap[0].when, self._run)
+
+
+class _Entry:
+    __slots__ = ("count", "timer", "when")
+
+    def __init__(self, when: float, count: int, timer: Timer):
+        self.when = when
+        # Order of entries with the same deadline.
+        self.count = count
+        self.timer: Timer | None = timer
+
+    def __lt__(self, other: _Entry) -> bool:
+        return (self.when, self.count) < (other.when, other.count)
+
+
+_schedulers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Scheduler] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_scheduler() -> Scheduler:
+    """Get the scheduler shared by the running loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _schedulers:
+        _schedulers[loop] = Scheduler(loop)
+    return _schedulers[loop]
+
+
+class Timer:
+    """Call a function once a deadline is reached.
+    Resetting the deadline is cheap, making it suitable for idle detection.
+
+    >>> timer = Timer(callback)
+    >>> timer.reset(5)
+    >>> timer.reset(5)  # Postpone.
+    >>> timer.cancel()
+    """
+
+    __slots__ = ("_callback", "_deadline", "_entry", "_scheduler")
+
+    def __init__(self, callback: Callable[[], Any]):
+        self._callback = callback
+        self._scheduler: Scheduler | None = None
+        self._deadline: float | None = None
+        # Earliest entry of the timer in the scheduler.
+        self._entry: _Entry | None = None
+
+    @property
+    def active(self) -> bool:
+        return self._deadline is not None
+
+    def reset(self, delay: float, jitter: float = 0) -> None:
+        """Fire after `delay` seconds, varying by up to `jitter` times the delay."""
+        if self._scheduler is None:
+            self._scheduler = get_scheduler()
+        if jitter:
+            delay *= 1 + random.uniform(-jitter, jitter)
+        self._deadline = self._scheduler.time() + delay
+        if self._entry is None or self._deadline < self._entry.when:
+            if self._entry:
+                # Superseded by an earlier entry.
+                self._scheduler.remove(self._entry)
+            self._entry = self._scheduler.push(self, self._deadline)
+
+    def cancel(self) -> None:
+        self._deadline = None
+        if self._entry:
+            assert self._scheduler
+            self._scheduler.remove(self._entry)
+            self._entry = None
+
+    def expire(self, now: float) -> None:
+        """Called by the scheduler when the entry for this timer is due."""
+        self._entry = None
+        if self._deadline is None:
+            return
+        if self._deadline > now:
+            # Postponed.
+            assert self._scheduler
+            self._entry = self._scheduler.push(self, self._deadline)
+            return
+        self._deadline = None
+        try:
+            self._callback()
+        except Exception:
+            logger.error(
+                "error calling timer callback %s", self._callback, exc_info=True
+            )
@@ -0,0 +1,194 @@
+import itertools
+import json
+import logging
+import math
+import time
+import uuid
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import StrEnum
+from pathlib import Path
+from typing import Any, TextIO
+
+from pydantic import BaseModel
+
+from local_tuya.metrics import REGISTRY, HistogramChild
+
+logger = logging.getLogger(__name__)
+
+STAGE_DURATION = REGISTRY.histogram(
+    "local_tuya_command_stage_seconds",
+    "Time taken by commands to reach each stage from the previous one.",
+    ("device", "stage"),
+)
+
+
+class TracingConfig(BaseModel):
+    # Number of completed traces kept in memory.
+    size: int = 1000
+    # Append completed traces to this file as JSON lines.
+    export_path: Path | None = None
+
+
+class Stage(StrEnum):
+    # Message received from the protocol.
+    received = "received"
+    # Dispatched to the device by the manager.
+    dispatched = "dispatched"
+    # Merged in the update buffer.
+    started = "started"
+    # Debounce delay elapsed.
+    debounced = "debounced"
+    # Written to the device.
+    sent = "sent"
+    # Acknowledged by the device.
+    acknowledged = "acknowledged"
+    # Not confirmed by the state of the device, sent again.
+    retried = "retried"
+    # Confirmed by the state of the device.
+    confirmed = "confirmed"
+
+
+class TraceStatus(StrEnum):
+    # Confirmed by the state of the device.
+    confirmed = "confirmed"
+    # Acknowledged, but confirmation is not checked.
+    acknowledged = "acknowledged"
+    # Still not confirmed after all retries.
+    unconfirmed = "unconfirmed"
+    # No longer required, the device is already in the state requested.
+    cancelled = "cancelled"
+    failed = "failed"
+
+
+@dataclass(slots=True)
+class Trace:
+    """Timestamps of a command at every stage until it completes."""
+
+    device: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    stages: list[tuple[Stage, float]] = field(default_factory=list)
+    status: TraceStatus | None = None
+    # Wall clock time of the first stage, monotonic time is used for stages.
+    timestamp: float = field(default_factory=time.time)
+
+    def mark(self, stage: Stage, at: float | None = None) -> None:
+        if self.status is None:
+            self.stages.append((stage, time.monotonic() if at is None else at))
+
+    def durations(self) -> Iterator[tuple[Stage, float]]:
+        """Time taken to reach each stage from the previous one."""
+        for (_, previous), (stage, at) in itertools.pairwise(self.stages):
+            yield stage, at - previous
+
+    def to_dict(self) -> dict[str, Any]:
+        start = self.stages[0][1] if self.stages else 0
+        return {
+            "id": self.id,
+            "device": self.device,
+            "status": self.status,
+            "timestamp": self.timestamp,
+            # Seconds since the first stage.
+            "stages": [[stage, round(at - start, 6)] for stage, at in self.stages],
+        }
+
+
+# Trace of the command being processed.
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+class Tracer:
+    """Keep the latest completed traces, and export them."""
+
+    def __init__(self, size: int = 1000):
+        self.traces: deque[Trace] = deque(maxlen=size)
+        self._exporter: TextIO | None = None
+        # Writes to the export file, to keep blocking I/O off the event loop.
+        self._export_executor: ThreadPoolExecutor | None = None
+        # Histograms by device and stage, cached as they are updated for every trace.
+        self._stage_durations: dict[tuple[str, Stage], HistogramChild] = {}
+
+    def start(self, device: str, received: float | None = None) -> Trace:
+        trace = Trace(device)
+        trace.mark(Stage.received, received)
+        return trace
+
+    def finish(self, traces: Iterable[Trace], status: TraceStatus) -> None:
+        for trace in traces:
+            if trace.status is not None:
+                continue
+            trace.status = status
+            self.traces.append(trace)
+            for stage, duration in trace.durations():
+                self._stage_duration(trace.device, stage).observe(duration)
+            logger.debug(
+                "%s: command %s %s in %.3fs",
+                trace.device,
+                trace.id,
+                status,
+                trace.stages[-1][1] - trace.stages[0][1],
+            )
+            if self._export_executor:
+                self._export_executor.submit(self._export, trace.to_dict())
+
+    def _stage_duration(self, device: str, stage: Stage) -> HistogramChild:
+        key = (device, stage)
+        if (child := self._stage_durations.get(key)) is None:
+            child = self._stage_durations[key] = STAGE_DURATION.labels(device, stage)
+        return child
+
+    def remove(self, device: str) -> None:
+        """Forget the histograms of a device that was closed."""
+        for key in [k for k in self._stage_durations if k[0] == device]:
+            del self._stage_durations[key]
+
+    def _export(self, trace: dict[str, Any]) -> None:
+        assert self._exporter
+        self._exporter.write(json.dumps(trace) + "\n")
+
+    def percentiles(
+        self,
+        device: str,
+        percentiles: Iterable[int] = (50, 90, 99),
+    ) -> dict[Stage, dict[int, float]]:
+        """Percentiles of the time taken to reach each stage, from the traces kept."""
+        durations: dict[Stage, list[float]] = {}
+        for trace in self.traces:
+            if trace.device == device:
+                for stage, duration in trace.durations():
+                    durations.setdefault(stage, []).append(duration)
+        res: dict[Stage, dict[int, float]] = {}
+        for stage, values in durations.items():
+            values.sort()
+            # Nearest rank.
+            res[stage] = {
+                p: values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+                for p in percentiles
+            }
+        return res
+
+    @contextmanager
+    def configure(self, config: TracingConfig) -> Iterator[None]:
+        self.traces = deque(self.traces, maxlen=config.size)
+        if not config.export_path:
+            yield
+            return
+        with config.export_path.open("a") as exporter:
+            self._exporter = exporter
+            # A single thread keeps the traces in order.
+            self._export_executor = ThreadPoolExecutor(1, "tracing-export")
+            try:
+                yield
+            finally:
+                # Write the remaining traces before closing the file.
+                self._export_executor.shutdown()
+                self._export_executor = None
+                self._exporter = None
+
+
+# Default tracer, fed by all components.
+TRACER = Tracer()
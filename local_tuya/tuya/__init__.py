@@ -1,8 +1,10 @@
 from local_tuya.tuya.config import TuyaConfig, TuyaVersion
 from local_tuya.tuya.dependencies import TuyaPackage
 from local_tuya.tuya.events import (
+    TuyaConnectionChanged,
     TuyaConnectionClosed,
     TuyaConnectionEstablished,
     TuyaStateUpdated,
 )
+from local_tuya.tuya.presence import PresenceListener
 from local_tuya.tuya.protocol import TuyaProtocol
@@ -1,8 +1,9 @@
 from enum import Enum
+from pathlib import Path
 
 from pydantic import BaseModel, Field
 
-from local_tuya.backoff import SequenceBackoff
+from local_tuya.backoff import Jitter, SequenceBackoff
 
 
 class TuyaVersion(bytes, Enum):
@@ -19,13 +20,32 @@ class TuyaConfig(BaseModel):
     version: TuyaVersion = TuyaVersion.v33
     # How long to wait between reconnection attempts.
     connection_backoff: SequenceBackoff = Field(
-        default_factory=lambda: SequenceBackoff(0, 1, 5, 10, 30, 60, 300)
+        default_factory=lambda: SequenceBackoff(
+            0, 1, 5, 10, 30, 60, 300, jitter=Jitter.equal
+        )
     )
+    # Seconds unable to connect after which the device is considered unreachable.
+    # Updates are then rejected and connection is only attempted every `probe_interval`,
+    # which should not exceed the last `connection_backoff` delay.
+    # Disabled when 0.
+    unreachable_after: float = 0
+    probe_interval: float = 300
     # Seconds to wait until command can be confirmed.
     # This excludes time waiting for the connection to be established.
     timeout: float = 5
     # Seconds between each heartbeat interval keeping the connection alive.
     heartbeat_interval: float = 15
+    # Only send heartbeats when nothing was received from the device during the interval,
+    # reconnect when they are not answered within `timeout`.
+    adaptive_heartbeat: bool = False
     # How long to keep the state until a refresh is done.
     # State is maintained via status updates so a low value shouldn't be required.
     state_refresh_interval: float = 3600
+    # Decode messages directly from the connection protocol instead of a stream reader.
+    # This lowers latency and CPU usage when running many devices.
+    protocol_transport: bool = False
+    # Record raw frames exchanged with the device to this file,
+    # to replay them with `python -m local_tuya.replay`.
+    record_path: Path | None = None
+    # Bytes after which the recording is rotated, the previous one is kept.
+    record_max_size: int = 10_000_000
@@ -1,28 +1,39 @@
+import asyncio
 from collections.abc import Iterator
 
 from imbue import Package, auto_context
 
+from local_tuya.backoff import CircuitBreaker
 from local_tuya.events import EventNotifier
 from local_tuya.tuya.config import TuyaConfig
-from local_tuya.tuya.heartbeat import Heartbeat
+from local_tuya.tuya.heartbeat import AdaptiveHeartbeat, Heartbeat
 from local_tuya.tuya.message import (
     MessageHandler,
     get_handler,
 )
+from local_tuya.tuya.presence import PresenceListener
 from local_tuya.tuya.protocol import TuyaProtocol
+from local_tuya.tuya.recorder import Recorder
 from local_tuya.tuya.state import State
-from local_tuya.tuya.transport import Transport
+from local_tuya.tuya.transport import ProtocolTransport, Transport
 
 
 class TuyaPackage(Package):
-    EXTRA_DEPENDENCIES = (
-        TuyaProtocol,
-        EventNotifier,
-    )
-
-    def __init__(self, name: str, config: TuyaConfig):
+    def __init__(
+        self,
+        name: str,
+        config: TuyaConfig,
+        connection_limiter: asyncio.Semaphore | None = None,
+        presence_listener: PresenceListener | None = None,
+    ):
         self._name = name
         self._cfg = config
+        self._connection_limiter = connection_limiter
+        self._presence_listener = presence_listener
+
+    @auto_context
+    def notifier(self) -> EventNotifier:
+        return EventNotifier(self._name)
 
     @auto_context
     def message_handler(self) -> MessageHandler:
@@ -34,7 +45,10 @@ class TuyaPackage(Package):
         notifier: EventNotifier,
         message_handler: MessageHandler,
     ) -> Transport:
-        return Transport(
+        transport_class = (
+            ProtocolTransport if self._cfg.protocol_transport else Transport
+        )
+        transport = transport_class(
             name=self._name,
             address=self._cfg.address,
             port=self._cfg.port,
@@ -43,14 +57,52 @@ class TuyaPackage(Package):
             keepalive=self._cfg.heartbeat_interval * 2,
             message_handler=message_handler,
             event_notifier=notifier,
+            connection_limiter=self._connection_limiter,
+            circuit_breaker=CircuitBreaker(
+                self._cfg.unreachable_after, self._cfg.probe_interval
+            ),
+            recorder=(
+                Recorder(self._cfg.record_path, self._cfg.record_max_size)
+                if self._cfg.record_path
+                else None
+            ),
+        )
+        if self._presence_listener:
+            # Released on exit of the transport.
+            transport.enter_context(
+                self._presence_listener.register(self._cfg.id_, transport.device_seen)
+            )
+        return transport
+
+    @auto_context
+    def protocol(
+        self,
+        notifier: EventNotifier,
+        transport: Transport,
+    ) -> TuyaProtocol:
+        return TuyaProtocol(
+            name=self._name,
+            event_notifier=notifier,
+            transport=transport,
+            timeout=self._cfg.timeout,
         )
 
     @auto_context(eager=True)
     def heartbeat(self, notifier: EventNotifier) -> Iterator[Heartbeat]:
-        with Heartbeat(
-            interval=self._cfg.heartbeat_interval,
-            event_notifier=notifier,
-        ) as heartbeat:
+        heartbeat: Heartbeat
+        if self._cfg.adaptive_heartbeat:
+            heartbeat = AdaptiveHeartbeat(
+                name=self._name,
+                interval=self._cfg.heartbeat_interval,
+                timeout=self._cfg.timeout,
+                event_notifier=notifier,
+            )
+        else:
+            heartbeat = Heartbeat(
+                interval=self._cfg.heartbeat_interval,
+                event_notifier=notifier,
+            )
+        with heartbeat:
             yield heartbeat
 
     @auto_context(eager=True)
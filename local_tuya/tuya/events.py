@@ -5,17 +5,29 @@ from local_tuya.protocol import Values
 from local_tuya.tuya.message import Command, Response
 
 
-class TuyaConnectionEstablished(Event): ...
+class TuyaConnectionChanged(Event):
+    """Base class of the connection being established or closed."""
+
+
+class TuyaConnectionEstablished(TuyaConnectionChanged): ...
 
 
 @dataclass
-class TuyaConnectionClosed(Event):
+class TuyaConnectionClosed(TuyaConnectionChanged):
     error: Exception | None
 
 
+class TuyaConnectionStale(Event): ...
+
+
+class TuyaDeviceUnreachable(Event): ...
+
+
 @dataclass
 class TuyaCommandSent(Event):
     command: Command
+    # Assigned by the transport if not set.
+    sequence_number: int | None = None
 
 
 @dataclass
@@ -1,26 +1,107 @@
-from typing import Self
+import logging
+from contextlib import AbstractContextManager, ExitStack
 
-from concurrent_tasks import PeriodicTask
+from concurrent_tasks import BackgroundTask
 
 from local_tuya.events import EventNotifier
+from local_tuya.timers import JITTER, Timer
 from local_tuya.tuya.events import (
     TuyaCommandSent,
     TuyaConnectionClosed,
     TuyaConnectionEstablished,
+    TuyaConnectionStale,
+    TuyaResponseReceived,
 )
 from local_tuya.tuya.message import HeartbeatCommand
 
+logger = logging.getLogger(__name__)
+
+
+class Heartbeat(AbstractContextManager):
+    """Send heartbeats periodically while connected."""
 
-class Heartbeat(PeriodicTask):
     def __init__(self, interval: float, event_notifier: EventNotifier):
-        super().__init__(interval, self._heartbeat)
+        self._interval = interval
         self._notifier = event_notifier
-        event_notifier.register(TuyaConnectionClosed, lambda _: self.cancel())
-        event_notifier.register(TuyaConnectionEstablished, lambda _: self.create())
+        self._timer = Timer(self._heartbeat)
+        self._send_task = BackgroundTask(self._send)
+        # Released on exit.
+        self._registrations = ExitStack()
+        self._registrations.enter_context(
+            event_notifier.register(TuyaConnectionClosed, lambda _: self._stop())
+        )
+        self._registrations.enter_context(
+            event_notifier.register(TuyaConnectionEstablished, lambda _: self._start())
+        )
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._stop()
+        self._registrations.close()
+
+    def _start(self) -> None:
+        self._heartbeat()
 
-    def __enter__(self) -> Self:
-        """Don't start automatically, only when connection is established."""
-        return self
+    def _stop(self) -> None:
+        self._timer.cancel()
+        self._send_task.cancel()
 
-    async def _heartbeat(self) -> None:
+    def _heartbeat(self) -> None:
+        self._send_task.create()
+        self._timer.reset(self._interval, JITTER)
+
+    async def _send(self) -> None:
         await self._notifier.emit(TuyaCommandSent(HeartbeatCommand()))
+
+
+class AdaptiveHeartbeat(Heartbeat):
+    """Only send heartbeats when nothing has been received for an interval.
+    Any message received proves the connection is alive.
+    Request a reconnection when heartbeats are not answered.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        interval: float,
+        timeout: float,
+        event_notifier: EventNotifier,
+        max_missed: int = 2,
+    ):
+        super().__init__(interval, event_notifier)
+        self._name = name
+        self._timeout = timeout
+        self._max_missed = max_missed
+        self._missed = 0
+        self._stale_task = BackgroundTask(self._stale)
+        self._registrations.enter_context(
+            event_notifier.register(TuyaResponseReceived, self._received)
+        )
+
+    def _start(self) -> None:
+        self._missed = 0
+        self._timer.reset(self._interval)
+
+    def _stop(self) -> None:
+        super()._stop()
+        self._stale_task.cancel()
+
+    def _received(self, _: TuyaResponseReceived) -> None:
+        if self._timer.active:
+            self._missed = 0
+            self._timer.reset(self._interval)
+
+    def _heartbeat(self) -> None:
+        if self._missed >= self._max_missed:
+            logger.warning(
+                "%s: %i heartbeats not answered, reconnecting",
+                self._name,
+                self._missed,
+            )
+            self._stale_task.create()
+            return
+        self._missed += 1
+        self._send_task.create()
+        self._timer.reset(self._timeout)
+
+    async def _stale(self) -> None:
+        await self._notifier.emit(TuyaConnectionStale())
@@ -17,9 +17,9 @@ class AESCipher:
         cipher = AES.new(self.key, AES.MODE_ECB)
         return cipher.encrypt(pad(s, self.BLOCK_SIZE))
 
-    def decrypt(self, s: bytes) -> bytes:
+    def decrypt(self, s: bytes | memoryview) -> bytes:
         if not s:
-            return s
+            return b""
         if len(s) % self.BLOCK_SIZE:
             raise ValueError(
                 f"length {len(s)} should be a multiple of {self.BLOCK_SIZE}"
@@ -1,5 +1,4 @@
 from abc import ABC, abstractmethod
-from collections.abc import Awaitable, Callable
 from typing import Self
 
 from local_tuya.tuya.config import TuyaConfig
@@ -17,8 +16,15 @@ class MessageHandler(ABC):
         """Pack a message into bytes."""
 
     @abstractmethod
-    async def unpack(
-        self,
-        read: Callable[[int], Awaitable[bytes]],
-    ) -> tuple[int, Response, type[Command] | None]:
-        """Extract message from the bytes received, also return unused remaining bytes."""
+    def feed(self, data: bytes) -> None:
+        """Add bytes received from the device to the decoding buffer."""
+
+    @abstractmethod
+    def unpack(self) -> tuple[int, Response, type[Command] | None] | None:
+        """Extract the next complete message from the decoding buffer.
+        Return `None` if more data is required.
+        """
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Discard partial data, when the connection is reset."""
@@ -2,10 +2,12 @@ import binascii
 import json
 import logging
 import struct
-from collections.abc import Awaitable, Callable
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Mapping
 from typing import ClassVar, Self
 
 from local_tuya.errors import DecodeResponseError, LocalTuyaError, ResponseError
+from local_tuya.protocol import Value, Values
 from local_tuya.tuya.config import TuyaConfig, TuyaVersion
 from local_tuya.tuya.message.handlers.crypto import AESCipher
 from local_tuya.tuya.message.handlers.handler import MessageHandler
@@ -29,12 +31,16 @@ class V33MessageHandler(MessageHandler):
     PREFIX: ClassVar[int] = 0x000055AA
     SUFFIX: ClassVar[int] = 0x0000AA55
     VERSION_HEADER: ClassVar[bytes] = 12 * b"\x00"
+    # Anything above is considered a corrupted frame.
+    MAX_PAYLOAD_LENGTH: ClassVar[int] = 0x10000
+    # Number of encrypted payloads kept, most commands sent are identical.
+    CACHE_SIZE: ClassVar[int] = 64
 
     # Prefix + sequence num + command + payload length.
-    HEADER_FMT: ClassVar[str] = ">4I"
-    RETURN_CODE_FMT: ClassVar[str] = ">I"
+    HEADER: ClassVar[struct.Struct] = struct.Struct(">4I")
+    RETURN_CODE: ClassVar[struct.Struct] = struct.Struct(">I")
     # Hash + suffix.
-    END_FMT: ClassVar[str] = ">2I"
+    END: ClassVar[struct.Struct] = struct.Struct(">2I")
 
     # Messages.
     COMMANDS: ClassVar[dict[type[Command], int]] = {
@@ -61,6 +67,12 @@ class V33MessageHandler(MessageHandler):
         self._cfg = config
         self._cipher = AESCipher(config.key)
         self._version_header = config.version + self.VERSION_HEADER
+        self._prefix = self.PREFIX.to_bytes(length=4, byteorder="big")
+        # Encrypted bodies by command class and payload, least recently used first.
+        self._bodies: OrderedDict[tuple[type[Command], Hashable], bytes] = OrderedDict()
+        # Received data, only bytes after the offset are yet to be decoded.
+        self._buffer = b""
+        self._offset = 0
 
     @property
     def separator(self) -> bytes:
@@ -75,86 +87,102 @@ class V33MessageHandler(MessageHandler):
     def pack(self, sequence_number: int, command: Command) -> bytes:
         if type(command) not in self.COMMANDS:
             raise LocalTuyaError(f"unknown command {command}")
-        payload = command.payload or {}
-        encrypted = self._cipher.encrypt(
-            json.dumps(payload, separators=(",", ":")).encode()
-        )
-        if isinstance(command, UpdateCommand):
-            full_payload = self._version_header + encrypted
-        else:
-            full_payload = encrypted
-
+        body = self._get_body(command)
         data = (
-            struct.pack(
-                self.HEADER_FMT,
+            self.HEADER.pack(
                 self.PREFIX,
                 sequence_number,
                 self.COMMANDS[type(command)],
-                len(full_payload) + struct.calcsize(self.END_FMT),
+                len(body) + self.END.size,
             )
-            + full_payload
+            + body
         )
-        data += struct.pack(
-            self.END_FMT,
+        return data + self.END.pack(
             binascii.crc32(data) & 0xFFFFFFFF,
             self.SUFFIX,
         )
-        return data
-
-    async def unpack(
-        self,
-        read: Callable[[int], Awaitable[bytes]],
-    ) -> tuple[int, Response, type[Command] | None]:
-        header_length = struct.calcsize(self.HEADER_FMT)
-        header_data = await read(header_length)
-        if len(header_data) < header_length:
-            raise DecodeResponseError(f"not enough header data: {header_data!r}")
-        prefix, sequence_number, cmd, payload_length = struct.unpack(
-            self.HEADER_FMT, header_data
+
+    def _get_body(self, command: Command) -> bytes:
+        payload = command.payload or {}
+        key = (type(command), _freeze(payload))
+        if (body := self._bodies.get(key)) is not None:
+            self._bodies.move_to_end(key)
+            return body
+        # Keys are sent in the order of the payload.
+        body = self._cipher.encrypt(json.dumps(payload, separators=(",", ":")).encode())
+        if type(command) is UpdateCommand:
+            body = self._version_header + body
+        self._bodies[key] = body
+        if len(self._bodies) > self.CACHE_SIZE:
+            self._bodies.popitem(last=False)
+        return body
+
+    def feed(self, data: bytes) -> None:
+        if self._offset < len(self._buffer):
+            # Only keep the partial frame.
+            self._buffer = self._buffer[self._offset :] + data
+        else:
+            self._buffer = data
+        self._offset = 0
+
+    def reset(self) -> None:
+        self._buffer = b""
+        self._offset = 0
+
+    def unpack(self) -> tuple[int, Response, type[Command] | None] | None:
+        buffer, offset = self._buffer, self._offset
+        if len(buffer) - offset < self.HEADER.size:
+            return None
+        prefix, sequence_number, cmd, payload_length = self.HEADER.unpack_from(
+            buffer, offset
         )
         if prefix != self.PREFIX:
+            self._resync()
             raise DecodeResponseError(f"incorrect prefix: 0x{prefix:08x}")
-        payload_data = await read(payload_length)
-        if len(payload_data) < payload_length:
-            raise DecodeResponseError(f"not enough payload data: {payload_data!r}")
-        return_code_length = struct.calcsize(self.RETURN_CODE_FMT)
-        end_length = struct.calcsize(self.END_FMT)
-        if payload_length < return_code_length + end_length:
-            raise DecodeResponseError(f"payload not long enough: {payload_data!r}")
+        if payload_length < self.RETURN_CODE.size + self.END.size:
+            self._resync()
+            raise DecodeResponseError(f"payload not long enough: {payload_length}")
+        if payload_length > self.MAX_PAYLOAD_LENGTH:
+            self._resync()
+            raise DecodeResponseError(f"payload too long: {payload_length}")
+        start = offset + self.HEADER.size
+        end = start + payload_length
+        if len(buffer) < end:
+            return None
+        # The frame is complete, consume it even if it cannot be decoded.
+        self._offset = end
 
         # Header.
-        if prefix != self.PREFIX:
-            raise DecodeResponseError(f"incorrect prefix: 0x{prefix:08x}")
         if cmd not in self.RESPONSES:
             raise DecodeResponseError(f"unknown response type 0x{cmd:08x}")
         response_factory = self.RESPONSES[cmd]
         command_class = self.COMMAND_CLASSES.get(cmd)
 
         # Payload metadata.
-        (return_code,) = struct.unpack(
-            self.RETURN_CODE_FMT,
-            payload_data[:return_code_length],
-        )
-        _, suffix = struct.unpack(
-            self.END_FMT, payload_data[-end_length:]
+        payload_data = memoryview(buffer)[start:end]
+        (return_code,) = self.RETURN_CODE.unpack_from(payload_data)
+        _, suffix = self.END.unpack_from(
+            payload_data, payload_length - self.END.size
         )  # Ignore the hash.
         if suffix != self.SUFFIX:
             raise DecodeResponseError(f"incorrect suffix: 0x{suffix:08x}")
 
-        payload = payload_data[return_code_length:-end_length]
-        if payload.startswith(self._cfg.version):
+        payload = payload_data[self.RETURN_CODE.size : -self.END.size]
+        if payload[: len(self._cfg.version)] == self._cfg.version:
             payload = payload[len(self._version_header) :]
 
         # Parse payload.
         parsed_payload: Payload | None = None
         error: ResponseError | None = None
         if return_code:
-            error = ResponseError(f"error from device: {payload!r}")
+            error = ResponseError(f"error from device: {bytes(payload)!r}")
         elif payload:
             try:
                 decrypted = self._cipher.decrypt(payload)
             except Exception as e:
-                raise DecodeResponseError(f"could not decrypt {payload!r}") from e
+                raise DecodeResponseError(
+                    f"could not decrypt {bytes(payload)!r}"
+                ) from e
             try:
                 parsed_payload = json.loads(decrypted)
             except Exception as e:
@@ -167,3 +195,25 @@ class V33MessageHandler(MessageHandler):
             response_factory(parsed_payload, error),
             command_class,
         )
+
+    def _resync(self) -> None:
+        """Skip to the next prefix as the frame boundaries are lost."""
+        index = self._buffer.find(self._prefix, self._offset + 1)
+        if index == -1:
+            # Keep what could be the start of the next prefix.
+            index = max(
+                self._offset + 1,
+                len(self._buffer) - len(self._prefix) + 1,
+            )
+        self._offset = index
+
+
+def _freeze(payload: Mapping[str, Value | Values]) -> Hashable:
+    """Hashable equivalent of a payload, regardless of the order of its keys."""
+    return tuple(
+        sorted(
+            # Along with the type, as `True == 1` but they are not sent the same.
+            (k, _freeze(v)) if isinstance(v, dict) else (k, type(v).__name__, v)
+            for k, v in payload.items()
+        )
+    )
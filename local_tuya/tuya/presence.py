@@ -0,0 +1,123 @@
+import asyncio
+import binascii
+import hashlib
+import json
+import logging
+import socket
+from collections.abc import Callable, Collection
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
+from typing import Any
+
+from local_tuya.tuya.message.handlers.crypto import AESCipher
+from local_tuya.tuya.message.handlers.v33 import V33MessageHandler
+
+logger = logging.getLogger(__name__)
+
+# Devices broadcast in clear on the first port and encrypted on the second.
+PORTS = (6666, 6667)
+# Key shared by all devices to encrypt broadcasts.
+UDP_KEY = hashlib.md5(b"yGAdlopoPVldABfn").digest()
+
+
+def decode_broadcast(data: bytes, cipher: AESCipher) -> dict[str, Any] | None:
+    """Decode a presence broadcast, return `None` if it is not valid."""
+    header, end = V33MessageHandler.HEADER, V33MessageHandler.END
+    if len(data) < header.size + V33MessageHandler.RETURN_CODE.size + end.size:
+        return None
+    prefix, _, _, length = header.unpack_from(data)
+    if prefix != V33MessageHandler.PREFIX or len(data) != header.size + length:
+        return None
+    crc, suffix = end.unpack_from(data, len(data) - end.size)
+    if (
+        suffix != V33MessageHandler.SUFFIX
+        or binascii.crc32(data[: -end.size]) & 0xFFFFFFFF != crc
+    ):
+        return None
+    payload = data[header.size + V33MessageHandler.RETURN_CODE.size : -end.size]
+    try:
+        if not payload.startswith(b"{"):
+            payload = cipher.decrypt(payload)
+        decoded = json.loads(payload)
+    except ValueError:
+        return None
+    return decoded if isinstance(decoded, dict) else None
+
+
+class PresenceListener(asyncio.DatagramProtocol, AbstractAsyncContextManager):
+    """Listen to broadcasts sent by devices on the local network,
+    and notify when a device is seen along with its address.
+
+    A single listener is shared by all devices.
+    """
+
+    def __init__(self, ports: Collection[int] = PORTS):
+        self._ports = ports
+        self._cipher = AESCipher(UDP_KEY)
+        self._transports: list[asyncio.DatagramTransport] = []
+        self._callbacks: dict[str, Callable[[str], None]] = {}
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        for port in self._ports:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: self,
+                local_addr=("0.0.0.0", port),
+                family=socket.AF_INET,
+                reuse_port=True,
+                allow_broadcast=True,
+            )
+            self._transports.append(transport)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        for transport in self._transports:
+            transport.close()
+        self._transports.clear()
+
+    def register(
+        self, device_id: str, callback: Callable[[str], None]
+    ) -> PresenceRegistration:
+        """Call the callback with the device address when it is seen.
+
+        >>> with listener.register(device_id, callback):
+        >>>     ...  # Unregistered when exiting.
+        """
+        self._callbacks[device_id] = callback
+        return PresenceRegistration(self._callbacks, device_id, callback)
+
+    def datagram_received(self, data: bytes, addr: tuple[str | Any, int]) -> None:
+        if not (broadcast := decode_broadcast(data, self._cipher)):
+            return
+        callback = self._callbacks.get(broadcast.get("gwId", ""))
+        if not callback:
+            return
+        try:
+            callback(broadcast.get("ip") or addr[0])
+        except Exception:
+            logger.error("error handling broadcast %s", broadcast, exc_info=True)
+
+    def error_received(self, exc: Exception) -> None:
+        logger.warning("error receiving broadcast", exc_info=exc)
+
+
+class PresenceRegistration(AbstractContextManager):
+    """Handle to unregister a device."""
+
+    def __init__(
+        self,
+        callbacks: dict[str, Callable[[str], None]],
+        device_id: str,
+        callback: Callable[[str], None],
+    ):
+        self._callbacks = callbacks
+        self._device_id = device_id
+        self._callback: Callable[[str], None] | None = callback
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.unregister()
+
+    def unregister(self) -> None:
+        # Unless registered again since.
+        if self._callback and self._callbacks.get(self._device_id) is self._callback:
+            del self._callbacks[self._device_id]
+        self._callback = None
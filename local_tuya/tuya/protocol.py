@@ -1,23 +1,140 @@
-from contextlib import AbstractAsyncContextManager
-from dataclasses import dataclass
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from contextlib import ExitStack, asynccontextmanager
 
+from local_tuya.backoff import CircuitState
+from local_tuya.errors import DeviceUnreachableError
 from local_tuya.events import EventNotifier
 from local_tuya.protocol import Values
-from local_tuya.tuya.events import TuyaCommandSent
+from local_tuya.tuya.events import (
+    TuyaCommandSent,
+    TuyaConnectionClosed,
+    TuyaResponseReceived,
+)
 from local_tuya.tuya.message import (
+    Response,
+    StateCommand,
     UpdateCommand,
 )
 from local_tuya.tuya.transport import Transport
 
+logger = logging.getLogger(__name__)
+
 
-@dataclass
 class TuyaProtocol:
-    event_notifier: EventNotifier
-    transport: Transport
+    def __init__(
+        self,
+        name: str,
+        event_notifier: EventNotifier,
+        transport: Transport,
+        timeout: float,
+        window: int = 8,
+    ):
+        # Released when the transport is closed.
+        self._registrations = ExitStack()
+        self._registrations.enter_context(
+            event_notifier.register(TuyaResponseReceived, self._acknowledge)
+        )
+        self._registrations.enter_context(
+            event_notifier.register(TuyaConnectionClosed, self._abort)
+        )
+        self._name = name
+        self.event_notifier = event_notifier
+        self.transport = transport
+        self._timeout = timeout
+        # Commands sent and waiting for a response, by sequence number.
+        self._in_flight: dict[int, asyncio.Future[Response]] = {}
+        self._window = asyncio.Semaphore(window)
+
+    async def update(
+        self,
+        values: Values,
+        timeout: float | None = None,
+    ) -> asyncio.Future[Response]:
+        """Update the device.
+        Return a future resolved when the device acknowledges the command.
+        """
+        if self.unreachable:
+            raise DeviceUnreachableError(f"{self._name} is unreachable")
+        await self._window.acquire()
+        command = UpdateCommand(values)
+        sequence_number = self.transport.get_sequence_number(command)
+        loop = asyncio.get_running_loop()
+        ack: asyncio.Future[Response] = loop.create_future()
+        self._in_flight[sequence_number] = ack
+        start = time.monotonic()
+        timeout_handle: asyncio.TimerHandle | None = None
+
+        def _done(_: asyncio.Future[Response]) -> None:
+            if timeout_handle:
+                timeout_handle.cancel()
+            if self._in_flight.get(sequence_number) is ack:
+                del self._in_flight[sequence_number]
+            self._window.release()
+            if not ack.cancelled() and not ack.exception():
+                logger.debug(
+                    "%s: command %i acknowledged in %.3fs",
+                    self._name,
+                    sequence_number,
+                    time.monotonic() - start,
+                )
+
+        ack.add_done_callback(_done)
+        try:
+            await self.event_notifier.emit(TuyaCommandSent(command, sequence_number))
+        except BaseException:
+            ack.cancel()
+            raise
+        if not ack.done():
+            # Exclude time waiting for the connection to be established.
+            timeout_handle = loop.call_later(
+                self._timeout if timeout is None else timeout,
+                _set_exception,
+                ack,
+                TimeoutError(f"no response to command {sequence_number}"),
+            )
+        return ack
+
+    async def query_state(self) -> None:
+        """Request the device state, received as a state update."""
+        await self.event_notifier.emit(TuyaCommandSent(StateCommand()))
+
+    @property
+    def unreachable(self) -> bool:
+        """The device could not be reached for a long time."""
+        return self.transport.circuit_state is CircuitState.open
+
+    def _acknowledge(self, event: TuyaResponseReceived) -> None:
+        if event.command_class is not UpdateCommand:
+            return
+        ack = self._in_flight.pop(event.sequence_number, None)
+        if not ack:
+            return
+        if event.response.error:
+            _set_exception(ack, event.response.error)
+        elif not ack.done():
+            ack.set_result(event.response)
+
+    def _abort(self, event: TuyaConnectionClosed) -> None:
+        """Responses will not be received on a new connection."""
+        for ack in tuple(self._in_flight.values()):
+            _set_exception(
+                ack, event.error or ConnectionResetError("connection closed")
+            )
+
+    def close(self) -> None:
+        """Release the listeners of a protocol that was not initialized."""
+        self._registrations.close()
+
+    @asynccontextmanager
+    async def initialize(self) -> AsyncIterator[None]:
+        with self._registrations:
+            async with self.transport:
+                yield
 
-    async def update(self, values: Values) -> None:
-        """Update the device."""
-        await self.event_notifier.emit(TuyaCommandSent(UpdateCommand(values)))
 
-    def initialize(self) -> AbstractAsyncContextManager:
-        return self.transport
+def _set_exception(future: asyncio.Future, exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
@@ -0,0 +1,98 @@
+import logging
+import struct
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager
+from enum import IntEnum
+from pathlib import Path
+from typing import BinaryIO, ClassVar, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Direction(IntEnum):
+    received = 0
+    sent = 1
+
+
+class Record(NamedTuple):
+    timestamp: float
+    direction: Direction
+    data: bytes
+
+
+class Recorder(AbstractContextManager):
+    """Record raw frames exchanged with a device, to reproduce issues.
+    The log is rotated when reaching the max size, keeping the previous one
+    with a `.1` suffix.
+    Frames are written by a dedicated thread, to keep blocking I/O off the event loop.
+    """
+
+    MAGIC: ClassVar[bytes] = b"LTR1"
+    # Timestamp + direction + data length.
+    HEADER: ClassVar[struct.Struct] = struct.Struct(">dBI")
+
+    def __init__(self, path: Path, max_size: int):
+        self._path = path
+        self._max_size = max_size
+        self._file: BinaryIO | None = None
+        self._size = 0
+        self._executor: ThreadPoolExecutor | None = None
+
+    def __enter__(self):
+        self._open()
+        # A single thread keeps the frames in order.
+        self._executor = ThreadPoolExecutor(1, "recorder")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if self._executor:
+            self._executor.submit(self._close)
+            # Write the remaining frames before returning.
+            self._executor.shutdown()
+            self._executor = None
+
+    def _close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _open(self) -> None:
+        self._file = self._path.open("ab")
+        self._size = self._file.tell()
+        if not self._size:
+            self._file.write(self.MAGIC)
+            self._size = len(self.MAGIC)
+
+    def record(self, direction: Direction, data: bytes) -> None:
+        if self._executor:
+            self._executor.submit(self._write, time.time(), direction, data)
+
+    def _write(self, timestamp: float, direction: Direction, data: bytes) -> None:
+        if not self._file:
+            return
+        if self._size + self.HEADER.size + len(data) > self._max_size:
+            self._rotate()
+        self._file.write(self.HEADER.pack(timestamp, direction, len(data)))
+        self._file.write(data)
+        self._size += self.HEADER.size + len(data)
+
+    def _rotate(self) -> None:
+        assert self._file
+        self._file.close()
+        self._path.replace(self._path.with_name(self._path.name + ".1"))
+        logger.debug("rotated recording %s", self._path)
+        self._open()
+
+
+def read_records(path: Path) -> Iterator[Record]:
+    """Read a recording, stopping at the last complete record."""
+    with path.open("rb") as file:
+        if file.read(len(Recorder.MAGIC)) != Recorder.MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        while len(header := file.read(Recorder.HEADER.size)) == Recorder.HEADER.size:
+            timestamp, direction, length = Recorder.HEADER.unpack(header)
+            if len(data := file.read(length)) < length:
+                return
+            yield Record(timestamp, Direction(direction), data)
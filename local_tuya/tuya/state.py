@@ -1,10 +1,11 @@
 import logging
-from typing import Self
+from contextlib import AbstractContextManager, ExitStack
 
-from concurrent_tasks import PeriodicTask
+from concurrent_tasks import BackgroundTask
 
 from local_tuya.events import EventNotifier
 from local_tuya.protocol import Values
+from local_tuya.timers import JITTER, Timer
 from local_tuya.tuya.events import (
     TuyaCommandSent,
     TuyaConnectionClosed,
@@ -21,26 +22,47 @@ from local_tuya.tuya.message import (
 logger = logging.getLogger(__name__)
 
 
-class State(PeriodicTask):
+class State(AbstractContextManager):
     def __init__(
         self,
         name: str,
         refresh_interval: float,
         event_notifier: EventNotifier,
     ):
-        super().__init__(refresh_interval, self._refresh)
-        event_notifier.register(TuyaResponseReceived, self._update)
-        event_notifier.register(TuyaConnectionClosed, lambda _: self.cancel())
-        event_notifier.register(TuyaConnectionEstablished, lambda _: self.create())
+        # Released on exit.
+        self._registrations = ExitStack()
+        # Processed inline: status responses are partial, none can be dropped.
+        self._registrations.enter_context(
+            event_notifier.register(TuyaResponseReceived, self._update)
+        )
+        self._registrations.enter_context(
+            event_notifier.register(TuyaConnectionClosed, lambda _: self._stop())
+        )
+        self._registrations.enter_context(
+            event_notifier.register(
+                TuyaConnectionEstablished, lambda _: self._refresh()
+            )
+        )
         self._name = name
+        self._refresh_interval = refresh_interval
         self._notifier = event_notifier
         self._state: Values | None = None
+        self._timer = Timer(self._refresh)
+        self._refresh_task = BackgroundTask(self._request_state)
 
-    def __enter__(self) -> Self:
-        """Don't start automatically, only when connection is established."""
-        return self
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._stop()
+        self._registrations.close()
 
-    async def _refresh(self) -> None:
+    def _refresh(self) -> None:
+        self._refresh_task.create()
+        self._timer.reset(self._refresh_interval, JITTER)
+
+    def _stop(self) -> None:
+        self._timer.cancel()
+        self._refresh_task.cancel()
+
+    async def _request_state(self) -> None:
         await self._notifier.emit(TuyaCommandSent(StateCommand()))
 
     async def _update(self, event: TuyaResponseReceived) -> None:
@@ -1,26 +1,71 @@
 import asyncio
+import heapq
+import itertools
 import logging
-from collections.abc import Iterator
-from contextlib import AbstractContextManager, AsyncExitStack, contextmanager
-from functools import partial
-from typing import Self
+from collections import deque
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import (
+    AbstractContextManager,
+    AsyncExitStack,
+    contextmanager,
+)
+from typing import ClassVar, NamedTuple, Self, cast
 
 from concurrent_tasks import BackgroundTask, RobustStream
 
-from local_tuya.backoff import SequenceBackoff
+from local_tuya.backoff import CircuitBreaker, CircuitState, SequenceBackoff
+from local_tuya.errors import DeviceUnreachableError
 from local_tuya.events import EventNotifier
+from local_tuya.metrics import REGISTRY
+from local_tuya.timers import Timer
 from local_tuya.tuya.events import (
     TuyaCommandSent,
     TuyaConnectionClosed,
     TuyaConnectionEstablished,
+    TuyaConnectionStale,
+    TuyaDeviceUnreachable,
     TuyaResponseReceived,
 )
-from local_tuya.tuya.message import Command, HeartbeatCommand, MessageHandler
+from local_tuya.tuya.message import (
+    Command,
+    HeartbeatCommand,
+    MessageHandler,
+    StateCommand,
+    UpdateCommand,
+)
+from local_tuya.tuya.recorder import Direction, Recorder
+from local_tuya.watchdog import device_name
 
 logger = logging.getLogger(__name__)
 
+RECONNECTS = REGISTRY.counter(
+    "local_tuya_reconnects_total", "Connections lost to the device.", ("device",)
+)
+CONNECTION_FAILURES = REGISTRY.counter(
+    "local_tuya_connection_failures_total",
+    "Failed attempts to connect to the device.",
+    ("device",),
+)
+FRAMES_RECEIVED = REGISTRY.counter(
+    "local_tuya_frames_received_total",
+    "Messages received from the device.",
+    ("device",),
+)
+FRAMES_SENT = REGISTRY.counter(
+    "local_tuya_frames_sent_total", "Messages sent to the device.", ("device",)
+)
+DECODE_ERRORS = REGISTRY.counter(
+    "local_tuya_decode_errors_total",
+    "Messages from the device that could not be decoded.",
+    ("device",),
+)
+
 
 class TuyaStream(RobustStream):
+    """Stream reconnecting to the device, extended through the connector and backoff
+    given to `RobustStream` and the protocol callbacks only.
+    """
+
     def __init__(
         self,
         name: str,
@@ -29,35 +74,139 @@ class TuyaStream(RobustStream):
         backoff: SequenceBackoff,
         timeout: float,
         event_notifier: EventNotifier,
+        connection_limiter: asyncio.Semaphore | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
     ):
         super().__init__(
-            connector=partial(
-                asyncio.get_running_loop().create_connection,
-                host=address,
-                port=port,
-            ),
+            connector=self._open_connection,
             name=name,
-            backoff=backoff.wait,
+            backoff=self._wait_before_connecting,
             timeout=timeout,
         )
+        self._name = name
+        self._address = address
+        self._port = port
+        self._connection_backoff = backoff
+        self._backoff_task: asyncio.Future | None = None
         self._notifier = event_notifier
         self._first_connect = True
+        # Limit connection attempts shared with other devices.
+        self._connection_limiter = connection_limiter
+        self._limiter_acquired = False
+        # Disabled unless provided.
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(0, 0)
+        # When set, received data bypasses the stream reader.
+        self.receiver: Callable[[bytes], None] | None = None
+        self._connection: asyncio.BaseTransport | None = None
+        self._connection_ready = asyncio.Event()
+        self._lost_exc: Exception | None = None
+        self._reconnects = RECONNECTS.labels(name)
+        self._connection_failures = CONNECTION_FAILURES.labels(name)
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self._notifier.emit(TuyaConnectionClosed(None))
         await super().__aexit__(exc_type, exc_val, exc_tb)
+        # In case the connector was cancelled before it started.
+        self._release_limiter()
 
     async def _connect(self) -> None:
         if self._first_connect:
             self._first_connect = False
         else:
-            await self._notifier.emit(TuyaConnectionClosed(self._last_exc))
+            self._reconnects.inc()
+            await self._notifier.emit(TuyaConnectionClosed(self._lost_exc))
+        self._lost_exc = None
         await super()._connect()
+        if self.circuit_breaker.success():
+            logger.info("%s: reachable again", self._name)
         await self._notifier.emit(TuyaConnectionEstablished())
 
+    async def _wait_before_connecting(self) -> None:
+        """Backoff called before each connection attempt."""
+        if self.circuit_breaker.open:
+            wait = asyncio.sleep(self.circuit_breaker.probe_interval)
+        else:
+            wait = self._connection_backoff.wait()
+        # Run in a task so it can be skipped when the device is seen.
+        self._backoff_task = asyncio.ensure_future(wait)
+        try:
+            await asyncio.wait((self._backoff_task,))
+        finally:
+            self._backoff_task.cancel()
+            self._backoff_task = None
+        # Waiting for other connection attempts is excluded from the timeout
+        # applied to the connector, which releases it.
+        if self._connection_limiter:
+            await self._connection_limiter.acquire()
+            self._limiter_acquired = True
+
+    async def _open_connection(
+        self, protocol_factory: Callable[[], asyncio.Protocol]
+    ) -> None:
+        try:
+            await asyncio.get_running_loop().create_connection(
+                protocol_factory, host=self._address, port=self._port
+            )
+        except Exception:
+            self._connection_failures.inc()
+            if self.circuit_breaker.failure():
+                logger.warning(
+                    "%s: unreachable for %ss, probing every %ss",
+                    self._name,
+                    self.circuit_breaker.threshold,
+                    self.circuit_breaker.probe_interval,
+                )
+                await self._notifier.emit(TuyaDeviceUnreachable())
+            raise
+        finally:
+            self._release_limiter()
+
+    def _release_limiter(self) -> None:
+        if self._connection_limiter and self._limiter_acquired:
+            self._limiter_acquired = False
+            self._connection_limiter.release()
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._connection = transport
+        super().connection_made(cast(asyncio.Transport, transport))
+        self._connection_ready.set()
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._connection = None
+        self._connection_ready.clear()
+        self._lost_exc = exc
+        super().connection_lost(exc)
+
+    def data_received(self, data: bytes) -> None:
+        if self.receiver:
+            self.receiver(data)
+        else:
+            super().data_received(data)
+
+    async def wait_connected(self) -> None:
+        await self._connection_ready.wait()
+
+    async def writelines(self, frames: Sequence[bytes]) -> None:
+        """Same as `write` but with a single write for all frames."""
+        await self.write(b"".join(frames))
+
     def reconnect(self) -> None:
-        if self._transport:
-            self._transport.close()
+        if self._connection:
+            self._connection.close()
+
+    def device_seen(self, address: str) -> None:
+        """The device announced itself on the network,
+        connect to it without waiting for the backoff.
+        """
+        if address != self._address:
+            logger.info("%s: address changed to %s", self._name, address)
+            self._address = address
+            if self._connection_ready.is_set():
+                self.reconnect()
+                return
+        if self._backoff_task:
+            logger.info("%s: device seen, reconnecting", self._name)
+            self._backoff_task.cancel()
 
 
 class SequenceNumberGetter(AbstractContextManager):
@@ -78,7 +227,26 @@ class SequenceNumberGetter(AbstractContextManager):
         self._num = 0
 
 
+class _QueuedCommand(NamedTuple):
+    priority: int
+    order: int
+    sequence_number: int
+    command: Command
+    sent: asyncio.Future[None]
+
+
 class Transport(AsyncExitStack):
+    # Maximum number of bytes read at once, all complete messages are then decoded.
+    READ_SIZE: ClassVar[int] = 0x10000
+    # Commands waiting to be sent are sent by order of priority, lowest first.
+    PRIORITIES: ClassVar[dict[type[Command], int]] = {
+        UpdateCommand: 0,
+        StateCommand: 1,
+        HeartbeatCommand: 2,
+    }
+    # Commands only sent once when queued multiple times.
+    COALESCED: ClassVar[tuple[type[Command], ...]] = (StateCommand, HeartbeatCommand)
+
     def __init__(
         self,
         name: str,
@@ -89,17 +257,47 @@ class Transport(AsyncExitStack):
         keepalive: float,
         message_handler: MessageHandler,
         event_notifier: EventNotifier,
+        connection_limiter: asyncio.Semaphore | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        recorder: Recorder | None = None,
     ):
         super().__init__()
-        self._stream = TuyaStream(name, address, port, backoff, timeout, event_notifier)
-        event_notifier.register(TuyaCommandSent, self._write)
-        event_notifier.register(
-            TuyaConnectionEstablished,
-            lambda _: self._reconnect_task.create(),
+        self._stream = TuyaStream(
+            name,
+            address,
+            port,
+            backoff,
+            timeout,
+            event_notifier,
+            connection_limiter,
+            circuit_breaker,
+        )
+        # Released on exit, after the stream is closed.
+        self.enter_context(event_notifier.register(TuyaCommandSent, self._write))
+        self.enter_context(
+            event_notifier.register(
+                TuyaConnectionEstablished,
+                lambda _: self._idle_timer.reset(self._keepalive),
+            )
+        )
+        self.enter_context(
+            event_notifier.register(
+                TuyaConnectionClosed,
+                lambda _: self._idle_timer.cancel(),
+            )
+        )
+        self.enter_context(
+            event_notifier.register(TuyaConnectionClosed, self._drop_queued)
+        )
+        self.enter_context(
+            event_notifier.register(
+                TuyaConnectionStale, lambda _: self._stream.reconnect()
+            )
         )
-        event_notifier.register(
-            TuyaConnectionClosed,
-            lambda _: self._reconnect_task.cancel(),
+        self.enter_context(
+            event_notifier.register(
+                TuyaDeviceUnreachable, lambda _: self._reject_writes()
+            )
         )
         self._name = name
         self._backoff = backoff
@@ -109,16 +307,39 @@ class Transport(AsyncExitStack):
         self._get_seq_number = SequenceNumberGetter()
         self._notifier = event_notifier
         self._reader: asyncio.StreamReader | None = None
+        self._recorder = recorder
+        self._frames_received = FRAMES_RECEIVED.labels(name)
+        self._frames_sent = FRAMES_SENT.labels(name)
+        self._decode_errors = DECODE_ERRORS.labels(name)
 
         self._receive_task = BackgroundTask(self._receive)
-        self._reconnect_task = BackgroundTask(self._reconnect)
+        # Reconnect when nothing is received for a while.
+        self._idle_timer = Timer(self._stream.reconnect)
+
+        self._queue: list[_QueuedCommand] = []
+        self._queue_order = itertools.count()
+        self._coalesced: dict[type[Command], asyncio.Future[None]] = {}
+        self._flush_task: asyncio.Task | None = None
 
     async def __aenter__(self) -> Self:
-        self.enter_context(self._get_seq_number)
-        await self.enter_async_context(self._stream)
-        self.enter_context(self._receive_task)
+        # Tasks started from here are attributed to the device,
+        # without changing the context of the caller.
+        token = device_name.set(self._name)
+        try:
+            if self._recorder:
+                self.enter_context(self._recorder)
+            self.enter_context(self._get_seq_number)
+            await self.enter_async_context(self._stream)
+            self.callback(self._cancel_writes)
+            self.callback(self._idle_timer.cancel)
+            self._start_receiving()
+        finally:
+            device_name.reset(token)
         return self
 
+    def _start_receiving(self) -> None:
+        self.enter_context(self._receive_task)
+
     @contextmanager
     def reader(self) -> Iterator[None]:
         self._reader = self._stream.reader
@@ -127,69 +348,250 @@ class Transport(AsyncExitStack):
         finally:
             self._reader = None
 
-    async def _read(self, n: int) -> bytes:
+    async def _read(self) -> bytes:
         assert self._reader
-        data = await self._reader.read(n)
+        data = await self._reader.read(self.READ_SIZE)
         if not data:
             # This means we have been (re)connected.
             raise ConnectionResetError("empty data received")
+        self._set_healthy()
+        return data
+
+    def _set_healthy(self) -> None:
         # While no data has been received, we assume the connection is not necessarily healthy.
         # It is possible to be connected and not be able to communicated with the device.
         # We assume the connection to be healthy when we receive responses.
         # As long as it is unhealthy, connection attempts will increase the backoff.
         self._backoff.reset()
-        self._reconnect_task.create()
-        return data
+        self._idle_timer.reset(self._keepalive)
 
     async def _receive(self) -> None:
         with self.reader():
             while True:
                 try:
-                    (
-                        sequence_number,
-                        response,
-                        command_class,
-                    ) = await self._msg_handler.unpack(self._read)
+                    data = await self._read()
                 except ConnectionResetError:
-                    self._msg_errors = 0
+                    self._reset()
                     continue
-                except Exception:
-                    logger.warning(
-                        "%s: error processing message", self._name, exc_info=True
-                    )
-                    # Allow 2 errors then reconnect on the 3rd.
-                    if self._msg_errors > 2:
-                        self._stream.reconnect()
-                        self._msg_errors = 0
-                    else:
-                        self._msg_errors += 1
-                    continue
-                self._msg_errors = 0
-                logger.debug(
-                    "%s: received message %i %s",
-                    self._name,
-                    sequence_number,
-                    response.__class__.__name__,
-                )
-                await self._notifier.emit(
-                    TuyaResponseReceived(
-                        sequence_number,
-                        response,
-                        command_class,
-                    )
+                await self._notifier.emit_many(self.decode(data))
+
+    def _reset(self) -> None:
+        self._msg_handler.reset()
+        self._msg_errors = 0
+
+    def decode(self, data: bytes) -> Iterator[TuyaResponseReceived]:
+        """Decode all complete messages, including those left partial
+        by the previous data received.
+        """
+        if self._recorder:
+            self._recorder.record(Direction.received, data)
+        self._msg_handler.feed(data)
+        while True:
+            try:
+                message = self._msg_handler.unpack()
+            except Exception:
+                self._decode_errors.inc()
+                logger.warning(
+                    "%s: error processing message", self._name, exc_info=True
                 )
+                # Allow 2 errors then reconnect on the 3rd.
+                if self._msg_errors > 2:
+                    self._stream.reconnect()
+                    self._reset()
+                    return
+                self._msg_errors += 1
+                continue
+            if message is None:
+                return
+            self._msg_errors = 0
+            self._frames_received.inc()
+            sequence_number, response, command_class = message
+            logger.debug(
+                "%s: received message %i %s",
+                self._name,
+                sequence_number,
+                response.__class__.__name__,
+            )
+            yield TuyaResponseReceived(sequence_number, response, command_class)
+
+    def device_seen(self, address: str) -> None:
+        self._stream.device_seen(address)
+
+    @property
+    def circuit_state(self) -> CircuitState:
+        return self._stream.circuit_breaker.state
+
+    def get_sequence_number(self, command: Command) -> int:
+        """Reserve the sequence number of a command to be sent."""
+        return self._get_seq_number(command)
 
     async def _write(self, event: TuyaCommandSent) -> None:
-        sequence_number = self._get_seq_number(event.command)
-        logger.debug(
-            "%s: sending message %i %s",
-            self._name,
-            sequence_number,
-            event.command.__class__.__name__,
+        """Queue the command and wait until it is sent."""
+        command_class = type(event.command)
+        if sent := self._coalesced.get(command_class):
+            logger.debug("%s: %s already queued", self._name, command_class.__name__)
+            # Cancelling a caller does not cancel the others.
+            await asyncio.shield(sent)
+            return
+        sequence_number = event.sequence_number
+        if sequence_number is None:
+            sequence_number = self._get_seq_number(event.command)
+        sent = asyncio.get_running_loop().create_future()
+        if command_class in self.COALESCED:
+            self._coalesced[command_class] = sent
+        heapq.heappush(
+            self._queue,
+            _QueuedCommand(
+                self.PRIORITIES.get(command_class, 0),
+                next(self._queue_order),
+                sequence_number,
+                event.command,
+                sent,
+            ),
         )
-        data = self._msg_handler.pack(sequence_number, event.command)
-        await self._stream.write(data)
+        if not self._flush_task:
+            self._flush_task = asyncio.create_task(self._flush())
+        try:
+            # Other callers might be waiting for the same command.
+            await asyncio.shield(sent)
+        except asyncio.CancelledError:
+            if command_class not in self.COALESCED:
+                # Not sent later, after the caller gave up on it.
+                self._unqueue(sent)
+            raise
+
+    async def _flush(self) -> None:
+        """Send all queued commands at once, by order of priority."""
+        try:
+            while self._queue:
+                await self._stream.wait_connected()
+                frames: list[bytes] = []
+                sent: list[asyncio.Future[None]] = []
+                while self._queue:
+                    queued = heapq.heappop(self._queue)
+                    self._coalesced.pop(type(queued.command), None)
+                    logger.debug(
+                        "%s: sending message %i %s",
+                        self._name,
+                        queued.sequence_number,
+                        queued.command.__class__.__name__,
+                    )
+                    try:
+                        frames.append(
+                            self._msg_handler.pack(
+                                queued.sequence_number, queued.command
+                            )
+                        )
+                    except Exception as e:
+                        _set_exception(queued.sent, e)
+                        continue
+                    sent.append(queued.sent)
+                try:
+                    await self._stream.writelines(frames)
+                except Exception as e:
+                    for future in sent:
+                        _set_exception(future, e)
+                else:
+                    self._frames_sent.inc(len(frames))
+                    if self._recorder:
+                        for frame in frames:
+                            self._recorder.record(Direction.sent, frame)
+                    for future in sent:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            self._flush_task = None
+
+    def _unqueue(self, sent: asyncio.Future[None]) -> None:
+        queue = [queued for queued in self._queue if queued.sent is not sent]
+        if len(queue) != len(self._queue):
+            heapq.heapify(queue)
+            self._queue = queue
+        sent.cancel()
+
+    def _drop_coalesced(self) -> None:
+        """Heartbeats and state queries are sent again upon connection."""
+        if not self._coalesced:
+            return
+        queue = []
+        for queued in self._queue:
+            if type(queued.command) in self.COALESCED:
+                if not queued.sent.done():
+                    queued.sent.set_result(None)
+            else:
+                queue.append(queued)
+        heapq.heapify(queue)
+        self._queue = queue
+        self._coalesced.clear()
+
+    def _drop_queued(self, event: TuyaConnectionClosed) -> None:
+        """Commands queued for the previous connection are not sent on the next one,
+        their acknowledgements were aborted and updates are sent again with
+        new sequence numbers.
+        """
+        self._drop_coalesced()
+        for queued in self._queue:
+            _set_exception(
+                queued.sent, event.error or ConnectionResetError("connection closed")
+            )
+        self._queue.clear()
+
+    def _reject_writes(self) -> None:
+        """Do not keep commands waiting for a device known to be unreachable."""
+        self._drop_coalesced()
+        for queued in self._queue:
+            _set_exception(
+                queued.sent, DeviceUnreachableError(f"{self._name} is unreachable")
+            )
+        self._queue.clear()
+
+    def _cancel_writes(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+        for queued in self._queue:
+            _set_exception(queued.sent, RuntimeError(f"{self._name} is closed"))
+        self._queue.clear()
+        self._coalesced.clear()
+
+
+class ProtocolTransport(Transport):
+    """Decode messages as soon as data is received by the connection protocol,
+    instead of going through a stream reader and its reading task.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stream.receiver = self._data_received
+        # Partial data from the previous connection must be discarded.
+        self.enter_context(
+            self._notifier.register(TuyaConnectionClosed, lambda _: self._reset())
+        )
+        # Events are dispatched in order by a single task.
+        self._events: deque[TuyaResponseReceived] = deque()
+        self._dispatch_task: asyncio.Task | None = None
+
+    def _start_receiving(self) -> None:
+        self.callback(self._cancel_dispatch)
+
+    def _data_received(self, data: bytes) -> None:
+        self._set_healthy()
+        self._events.extend(self.decode(data))
+        if self._events and not self._dispatch_task:
+            self._dispatch_task = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        try:
+            while self._events:
+                await self._notifier.emit(self._events.popleft())
+        finally:
+            self._dispatch_task = None
+
+    def _cancel_dispatch(self) -> None:
+        self._events.clear()
+        if self._dispatch_task:
+            self._dispatch_task.cancel()
+
 
-    async def _reconnect(self) -> None:
-        await asyncio.sleep(self._keepalive)
-        self._stream.reconnect()
+def _set_exception(future: asyncio.Future, exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from collections.abc import Coroutine, Generator
+from contextlib import AsyncExitStack
+from contextvars import ContextVar
+from typing import Any, Self
+
+from concurrent_tasks import BackgroundTask
+from pydantic import BaseModel
+
+from local_tuya.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Name of the device the code being run is working for, to attribute slow callbacks.
+device_name: ContextVar[str] = ContextVar("device_name", default="")
+
+LAG = REGISTRY.gauge(
+    "local_tuya_event_loop_lag_seconds", "Last event loop lag measured."
+)
+SLOW_STEPS = REGISTRY.counter(
+    "local_tuya_slow_steps_total",
+    "Task steps blocking the event loop for longer than the threshold.",
+    ("device",),
+)
+
+
+class WatchdogConfig(BaseModel):
+    enabled: bool = True
+    # Seconds between event loop lag measurements.
+    interval: float = 1
+    # Lag and task steps above this many seconds are reported.
+    threshold: float = 0.1
+    # Time each step of every task to find what blocks the loop, by device.
+    # Adds overhead to every task step, enable when investigating lag.
+    time_steps: bool = False
+    # Minimum seconds between warnings for the same device.
+    warning_interval: float = 60
+
+
+class Watchdog(AsyncExitStack):
+    """Measure how late the event loop is, and optionally time each step of tasks
+    to report those blocking the loop, by device.
+    """
+
+    def __init__(self, config: WatchdogConfig):
+        super().__init__()
+        self._interval = config.interval
+        self._time_steps = config.time_steps
+        self.threshold = config.threshold
+        self._warning_interval = config.warning_interval
+        # Metrics.
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.slow_steps: Counter[str] = Counter()
+        self.max_step: dict[str, float] = {}
+        # Last warning time by device.
+        self._warned: dict[str, float] = {}
+        self._lag = LAG.labels()
+
+    async def __aenter__(self) -> Self:
+        if self._time_steps:
+            self._set_task_factory()
+        self.enter_context(BackgroundTask(self._measure_lag))
+        return self
+
+    def _set_task_factory(self) -> None:
+        loop = asyncio.get_running_loop()
+        previous_factory = loop.get_task_factory()
+
+        def _task_factory(
+            loop: asyncio.AbstractEventLoop, coro: Coroutine, **kwargs: Any
+        ) -> asyncio.Future:
+            coro = _TimedCoroutine(coro, self)
+            if previous_factory:
+                return previous_factory(loop, coro, **kwargs)
+            return asyncio.Task(coro, loop=loop, **kwargs)
+
+        loop.set_task_factory(_task_factory)
+        self.callback(loop.set_task_factory, previous_factory)
+
+    async def _measure_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self._interval)
+            self.lag = max(0.0, loop.time() - start - self._interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            self._lag.set(self.lag)
+            if self.lag >= self.threshold:
+                self._warn("", "event loop lagging by %.3fs", self.lag)
+
+    def report(self, duration: float) -> None:
+        """Report a task step that took too long, in the context of the task."""
+        name = device_name.get()
+        self.slow_steps[name] += 1
+        SLOW_STEPS.labels(name).inc()
+        self.max_step[name] = max(self.max_step.get(name, 0), duration)
+        self._warn(
+            name,
+            "%s: blocked the event loop for %.3fs (%i times)",
+            name or "unknown",
+            duration,
+            self.slow_steps[name],
+        )
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+            "slow_steps": dict(self.slow_steps),
+            "max_step": dict(self.max_step),
+        }
+
+    def _warn(self, name: str, msg: str, *args: Any) -> None:
+        now = time.monotonic()
+        last = self._warned.get(name)
+        if last is not None and now - last < self._warning_interval:
+            return
+        self._warned[name] = now
+        logger.warning(msg, *args)
+
+
+class _TimedCoroutine(Coroutine):
+    """Time each step of a coroutine run by a task."""
+
+    __slots__ = ("_coro", "_watchdog")
+
+    def __init__(self, coro: Coroutine, watchdog: Watchdog):
+        self._coro = coro
+        self._watchdog = watchdog
+
+    def send(self, value: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return self._coro.send(value)
+        finally:
+            if (duration := time.perf_counter() - start) >= self._watchdog.threshold:
+                self._watchdog.report(duration)
+
+    def throw(self, *args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return self._coro.throw(*args)
+        finally:
+            if (duration := time.perf_counter() - start) >= self._watchdog.threshold:
+                self._watchdog.report(duration)
+
+    def close(self) -> None:
+        self._coro.close()
+
+    def __await__(self) -> Generator[Any, None, Any]:
+        return self._coro.__await__()
+
+    def __getattr__(self, name: str) -> Any:
+        # Allow task introspection, such as name, frame or code.
+        return getattr(self._coro, name)
@@ -1,10 +1,17 @@
+import asyncio
 import contextlib
+from collections.abc import Callable
 from dataclasses import fields, is_dataclass
 
 import pytest
 
 from local_tuya.events import EventNotifier
-from local_tuya.tuya.events import TuyaConnectionEstablished
+from local_tuya.timers import get_scheduler
+from local_tuya.tuya.events import (
+    TuyaConnectionEstablished,
+    TuyaConnectionStale,
+    TuyaDeviceUnreachable,
+)
 from local_tuya.tuya.message import HeartbeatCommand, StateCommand, StatusResponse
 
 
@@ -22,7 +29,16 @@ def notifier_spy(mocker, notifier):
 def assert_event_emitted(notifier_spy):
     def _assert_equal(a, b):
         assert type(a) is type(b)
-        if isinstance(a, (TuyaConnectionEstablished, HeartbeatCommand, StateCommand)):
+        if isinstance(
+            a,
+            (
+                TuyaConnectionEstablished,
+                TuyaConnectionStale,
+                TuyaDeviceUnreachable,
+                HeartbeatCommand,
+                StateCommand,
+            ),
+        ):
             return
         if isinstance(a, StatusResponse):
             assert a.error == b.error
@@ -44,3 +60,43 @@ def assert_event_emitted(notifier_spy):
         assert n == count, f"incorrect number of event {expected_event} emitted"
 
     return _assert
+
+
+class FakeClock:
+    """Time of the timers, only advancing when requested."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._now = 0.0
+        self._handles: list[tuple[asyncio.TimerHandle, Callable[[], None]]] = []
+
+    def time(self) -> float:
+        return self._now
+
+    def call_at(self, when: float, callback: Callable[[], None]) -> asyncio.TimerHandle:
+        handle = asyncio.TimerHandle(when, callback, (), self._loop)
+        self._handles.append((handle, callback))
+        return handle
+
+    async def advance(self, delay: float) -> None:
+        """Fire the timers due in order, letting the tasks they start run."""
+        end = self._now + delay
+        while True:
+            await asyncio.sleep(0)  # Context switch.
+            self._handles = [(h, c) for h, c in self._handles if not h.cancelled()]
+            due = [(h, c) for h, c in self._handles if h.when() <= end]
+            if not due:
+                break
+            handle, callback = min(due, key=lambda e: e[0].when())
+            self._handles.remove((handle, callback))
+            self._now = handle.when()
+            callback()
+        self._now = end
+
+
+@pytest.fixture
+async def clock(mocker):
+    loop = asyncio.get_running_loop()
+    fake_clock = FakeClock(loop)
+    mocker.patch.object(get_scheduler(), "_loop", fake_clock)
+    return fake_clock
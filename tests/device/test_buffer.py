@@ -5,6 +5,9 @@ import pytest
 
 from local_tuya.backoff import SequenceBackoff
 from local_tuya.device.buffer import UpdateBuffer
+from local_tuya.device.constraints import Constraint, Constraints
+from local_tuya.device.events import AbortReason, UpdateAborted, UpdatePending
+from local_tuya.tracing import TRACER, Stage, Trace, TraceStatus
 from local_tuya.tuya import TuyaProtocol, TuyaStateUpdated
 
 
@@ -15,6 +18,10 @@ def protocol(mocker):
 
 @pytest.fixture
 async def buffer(protocol, notifier):
+    # Acknowledged as soon as sent.
+    ack = asyncio.get_running_loop().create_future()
+    ack.set_result(None)
+    protocol.update.return_value = ack
     buf = UpdateBuffer(
         device_name="test",
         delay=0.01,
@@ -23,52 +30,48 @@ async def buffer(protocol, notifier):
         constraints=None,
         retries=2,
         retry_backoff=SequenceBackoff(0.01),
+        timeout=0.05,
+        probe_delay=0.005,
     )
-    await notifier.emit(TuyaStateUpdated({"1": 1, "2": 2}))
-    try:
+    with buf:
+        await notifier.emit(TuyaStateUpdated({"1": 1, "2": 2}))
         yield buf
-    finally:
-        buf.close()
 
 
 async def test_filter_with_state(buffer):
-    filtered = await buffer._filter({"1": 2, "2": 2})
+    filtered = buffer._filter({"1": 2, "2": 2})
     assert filtered == {"1": 2}
 
 
 async def test_no_update(buffer, protocol):
-    await buffer.update({"1": 1})
+    buffer.update({"1": 1})
+    await asyncio.sleep(0.015)  # > delay
 
     protocol.update.assert_not_called()
 
 
 async def test_updates_buffered(buffer, protocol):
-    update1 = asyncio.create_task(buffer.update({"1": 2}))
-    await asyncio.sleep(0)  # context switch
-    update2 = asyncio.create_task(buffer.update({"2": 3}))
-    await update1
-    await update2
+    buffer.update({"1": 2})
+    buffer.update({"2": 3})
+    await asyncio.sleep(0.015)  # > delay
 
     protocol.update.assert_awaited_once_with({"1": 2, "2": 3})
 
 
 async def test_buffered_update_rollback(buffer, protocol):
-    update1 = asyncio.create_task(buffer.update({"1": 2}))
-    await asyncio.sleep(0)  # context switch
-    update2 = asyncio.create_task(buffer.update({"1": 1}))
-    await update1
-    await update2
+    buffer.update({"1": 2})
+    buffer.update({"1": 1})
+    await asyncio.sleep(0.015)  # > delay
 
     protocol.update.assert_not_called()
 
 
 async def test_updates_not_buffered(buffer, protocol, notifier):
-    update1 = asyncio.create_task(buffer.update({"1": 2}))
+    buffer.update({"1": 2})
     await asyncio.sleep(0.015)  # > delay
     await notifier.emit(TuyaStateUpdated({"1": 2, "2": 2}))
-    update2 = asyncio.create_task(buffer.update({"2": 3}))
-    await update1
-    await update2
+    buffer.update({"2": 3})
+    await asyncio.sleep(0.015)  # > delay
 
     assert protocol.update.call_args_list == [
         call({"1": 2}),
@@ -77,11 +80,10 @@ async def test_updates_not_buffered(buffer, protocol, notifier):
 
 
 async def test_updates_not_buffered_and_state_not_updated(buffer, protocol, notifier):
-    update1 = asyncio.create_task(buffer.update({"1": 2}))
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.015)  # > delay
+    buffer.update({"2": 3})
     await asyncio.sleep(0.015)  # > delay
-    update2 = asyncio.create_task(buffer.update({"2": 3}))
-    await update1
-    await update2
 
     assert protocol.update.call_args_list == [
         call({"1": 2}),
@@ -90,11 +92,86 @@ async def test_updates_not_buffered_and_state_not_updated(buffer, protocol, noti
     ]
 
 
-async def test_retry_ok(buffer, protocol, notifier):
-    await buffer.update({"1": 2})
-    await asyncio.sleep(0.015)  # Wait for the first retry to proceed.
+async def test_updates_while_sending(buffer, protocol):
+    sent = asyncio.Event()
+    ack = protocol.update.return_value
+
+    async def _update(values):
+        await sent.wait()
+        return ack
+
+    protocol.update.side_effect = _update
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.015)  # > delay
+    # Merged while the first update is being sent, without more tasks.
+    tasks = len(asyncio.all_tasks())
+    for i in range(3, 10):
+        buffer.update({"2": i})
+    assert len(asyncio.all_tasks()) == tasks
+    sent.set()
+    await asyncio.sleep(0.015)  # > delay
+
+    assert protocol.update.call_args_list == [
+        call({"1": 2}),
+        call({"1": 2, "2": 9}),
+    ]
+
+
+async def test_send_timeout(buffer, protocol, notifier):
+    ack = protocol.update.return_value
+
+    async def _update(values):
+        if protocol.update.call_count == 1:
+            await asyncio.Event().wait()
+        await notifier.emit(TuyaStateUpdated({"1": 2, "2": 2}))
+        return ack
+
+    protocol.update.side_effect = _update
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.1)  # > delay + timeout + probe + backoff
+
+    # Retried after the timeout.
+    assert protocol.update.call_count == 2
+    assert not buffer._buffer
+
+
+async def test_confirmed(buffer, protocol, notifier):
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.015)  # > delay
     await notifier.emit(TuyaStateUpdated({"1": 2, "2": 2}))
-    await buffer._retry_task
+    # Confirmed without waiting for the probe.
+    await asyncio.sleep(0)
+
+    assert not buffer._buffer
+    protocol.query_state.assert_not_called()
+    protocol.update.assert_awaited_once_with({"1": 2})
+
+
+async def test_confirmed_after_probe(buffer, protocol, notifier):
+    async def _query_state():
+        await notifier.emit(TuyaStateUpdated({"1": 2, "2": 2}))
+
+    protocol.query_state.side_effect = _query_state
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.03)  # > delay + probe
+
+    assert not buffer._buffer
+    protocol.query_state.assert_awaited_once_with()
+    protocol.update.assert_awaited_once_with({"1": 2})
+
+
+async def test_retry_ok(buffer, protocol, notifier):
+    ack = protocol.update.return_value
+
+    async def _update(values):
+        # Applied on the first retry.
+        if protocol.update.call_count == 2:
+            await notifier.emit(TuyaStateUpdated({"1": 2, "2": 2}))
+        return ack
+
+    protocol.update.side_effect = _update
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.06)
 
     # Should have tried once, and retried once.
     assert protocol.update.call_args_list == [
@@ -104,12 +181,196 @@ async def test_retry_ok(buffer, protocol, notifier):
 
 
 async def test_retry_ko(buffer, protocol, notifier):
-    await buffer.update({"1": 2})
-    await buffer._retry_task
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.1)
 
-    # Should have tried once, and retried 2 times.
+    # Should have tried once, and retried 2 times, querying the state each time.
+    assert protocol.query_state.await_count == 3
     assert protocol.update.call_args_list == [
         call({"1": 2}),
         call({"1": 2}),
         call({"1": 2}),
     ]
+
+
+async def test_error_does_not_stop_updates(
+    buffer, protocol, mocker, assert_event_emitted
+):
+    finish = mocker.patch.object(TRACER, "finish")
+    trace = Trace("test")
+    # Not in the device state.
+    buffer.update({"9": 1}, trace)
+    await asyncio.sleep(0.015)  # > delay
+
+    finish.assert_called_once_with([trace], TraceStatus.failed)
+    assert_event_emitted(UpdateAborted({"9": 1}, AbortReason.failed), 1)
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.015)  # > delay
+    protocol.update.assert_awaited_once_with({"1": 2})
+
+
+async def test_pending_events(buffer, assert_event_emitted):
+    buffer.update({"1": 2, "2": 2})
+    await asyncio.sleep(0.1)
+
+    # Emitted for the first update and each retry.
+    assert_event_emitted(UpdatePending({"1": 2}), 3)
+    assert_event_emitted(UpdateAborted({"1": 2}, AbortReason.unconfirmed), 1)
+
+
+async def test_pending_reverted(buffer, assert_event_emitted):
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.015)  # > delay
+    # Back to the device state before it is confirmed.
+    buffer.update({"1": 1})
+    await asyncio.sleep(0.015)  # > delay
+
+    assert_event_emitted(UpdatePending({"1": 2}), 1)
+    assert_event_emitted(UpdateAborted({"1": 2}, AbortReason.dropped), 1)
+
+
+async def test_pending_confirmed_not_aborted(buffer, notifier, assert_event_emitted):
+    buffer.update({"1": 2})
+    await asyncio.sleep(0.015)  # > delay
+    # Confirmed by the device, then updated again.
+    await notifier.emit(TuyaStateUpdated({"1": 2, "2": 2}))
+    buffer.update({"2": 3})
+    await asyncio.sleep(0.015)  # > delay
+
+    assert_event_emitted(UpdateAborted({"1": 2}, AbortReason.dropped), 0)
+
+
+@pytest.mark.parametrize("retries", [0, 2])
+async def test_phases(protocol, notifier, retries):
+    ack = asyncio.get_running_loop().create_future()
+    ack.set_result(None)
+    protocol.update.return_value = ack
+
+    async def _update(values):
+        # The device applies updates at once.
+        await notifier.emit(TuyaStateUpdated({"1": 1, "2": 2, **values}))
+        return ack
+
+    protocol.update.side_effect = _update
+    with UpdateBuffer(
+        device_name="test",
+        delay=0.01,
+        protocol=protocol,
+        event_notifier=notifier,
+        # "1" cannot be updated while "2" is 2.
+        constraints=Constraints(Constraint("2", 2, ("1", None))),
+        retries=retries,
+        retry_backoff=SequenceBackoff(0.01),
+        timeout=0.05,
+        probe_delay=0.005,
+    ) as buffer:
+        await notifier.emit(TuyaStateUpdated({"1": 1, "2": 2}))
+        buffer.update({"1": 2, "2": 3})
+        await asyncio.sleep(0.015)  # > delay
+
+    assert protocol.update.call_args_list == [call({"2": 3}), call({"1": 2})]
+    protocol.query_state.assert_not_called()
+
+
+async def test_traces_confirmed(buffer, notifier, mocker):
+    finish = mocker.patch.object(TRACER, "finish")
+    trace1, trace2 = Trace("test"), Trace("test")
+    buffer.update({"1": 2}, trace1)
+    buffer.update({"2": 3}, trace2)
+    await asyncio.sleep(0.015)  # > delay
+    await notifier.emit(TuyaStateUpdated({"1": 2, "2": 3}))
+    await asyncio.sleep(0)
+
+    finish.assert_called_once_with([trace1, trace2], TraceStatus.confirmed)
+    assert [stage for stage, _ in trace1.stages] == [
+        Stage.started,
+        Stage.debounced,
+        Stage.sent,
+        Stage.acknowledged,
+        Stage.confirmed,
+    ]
+
+
+async def test_traces_unconfirmed(buffer, mocker):
+    finish = mocker.patch.object(TRACER, "finish")
+    trace = Trace("test")
+    buffer.update({"1": 2}, trace)
+    await asyncio.sleep(0.1)
+
+    finish.assert_called_once_with([trace], TraceStatus.unconfirmed)
+    assert [stage for stage, _ in trace.stages].count(Stage.retried) == 2
+
+
+async def test_trace_cancelled(buffer, mocker):
+    finish = mocker.patch.object(TRACER, "finish")
+    trace = Trace("test")
+    buffer.update({"1": 1}, trace)
+    await asyncio.sleep(0.015)  # > delay
+
+    finish.assert_called_once_with([trace], TraceStatus.cancelled)
+
+
+async def test_traces_superseded(buffer, mocker):
+    finish = mocker.patch.object(TRACER, "finish")
+    traces = [Trace("test") for _ in range(UpdateBuffer.MAX_TRACES + 1)]
+    for trace in traces:
+        buffer.update({"1": 2}, trace)
+
+    finish.assert_called_once_with(traces[:1], TraceStatus.cancelled)
+    assert len(buffer._traces) == UpdateBuffer.MAX_TRACES
+
+
+@pytest.fixture
+async def adaptive_buffer(protocol, notifier):
+    ack = asyncio.get_running_loop().create_future()
+    ack.set_result(None)
+    protocol.update.return_value = ack
+    buf = UpdateBuffer(
+        device_name="test",
+        delay=0.02,
+        protocol=protocol,
+        event_notifier=notifier,
+        constraints=None,
+        retries=0,
+        retry_backoff=SequenceBackoff(0.01),
+        timeout=0.05,
+        max_delay=0.1,
+    )
+    with buf:
+        await notifier.emit(TuyaStateUpdated({"1": 1, "2": 2}))
+        yield buf
+
+
+async def test_adaptive_leading_edge(adaptive_buffer, protocol):
+    adaptive_buffer.update({"1": 2})
+    await asyncio.sleep(0.005)  # < delay
+    protocol.update.assert_awaited_once_with({"1": 2})
+
+
+async def test_adaptive_burst(adaptive_buffer, protocol, notifier):
+    adaptive_buffer.update({"1": 2})
+    await asyncio.sleep(0)
+    await notifier.emit(TuyaStateUpdated({"1": 2, "2": 2}))
+    # Following updates are grouped on the trailing edge.
+    adaptive_buffer.update({"2": 3})
+    await asyncio.sleep(0.01)
+    adaptive_buffer.update({"2": 4})
+    await asyncio.sleep(0.03)  # > delay
+    assert protocol.update.call_args_list == [call({"1": 2}), call({"2": 4})]
+
+
+async def test_adaptive_window(adaptive_buffer):
+    assert adaptive_buffer._debounce_delay() == 0
+    adaptive_buffer._last_update -= 0.03
+    # Larger than the window, but part of the burst, which grows the window.
+    assert adaptive_buffer._debounce_delay() == 0
+    assert adaptive_buffer._window == pytest.approx(0.06, abs=0.005)
+    adaptive_buffer._last_update -= 0.05
+    assert adaptive_buffer._debounce_delay() == pytest.approx(0.08, abs=0.005)
+    # Capped.
+    adaptive_buffer._last_update -= 0.07
+    assert adaptive_buffer._debounce_delay() == 0.1
+    # Idle.
+    adaptive_buffer._last_update -= 1
+    assert adaptive_buffer._debounce_delay() == 0
+    assert adaptive_buffer._window == 0.02
@@ -3,6 +3,7 @@ from enum import StrEnum
 import pytest
 
 from local_tuya.device.constraints import Constraint, Constraints
+from local_tuya.protocol import Values
 
 
 class DPS(StrEnum):
@@ -39,3 +40,57 @@ def test_constraints_filter_values(values, current, expected):
         Constraint(DPS.B, 10, (DPS.C, {20})),
     )
     assert constraints.filter_values(values, current) == expected
+
+
+def test_constraints_index():
+    constraints = Constraints(
+        Constraint(DPS.B, 10, (DPS.A, {1})),
+        Constraint(DPS.B, 10, (DPS.A, {2})),
+        Constraint(DPS.C, 20, (DPS.A, {3})),
+    )
+    assert constraints._triggers == (DPS.B, DPS.C)
+    values: Values = {DPS.A: 1}
+    assert constraints.filter_values(values, {DPS.B: 10, DPS.C: 21}) == {}
+    assert constraints.filter_values({DPS.A: 3}, {DPS.B: 10, DPS.C: 20}) == {}
+    assert constraints.filter_values({DPS.A: 4}, {DPS.B: 10, DPS.C: 20}) == {DPS.A: 4}
+    # Trigger not in the state.
+    assert constraints.filter_values(values, {}) == values
+    # Cached for the trigger values.
+    hits = constraints._get_blacklist.cache_info().hits
+    constraints.filter_values(values, {DPS.A: 5, DPS.B: 10, DPS.C: 21})
+    assert constraints._get_blacklist.cache_info().hits == hits + 1
+
+
+@pytest.mark.parametrize(
+    ("values", "current", "expected"),
+    [
+        ({}, {DPS.A: 1, DPS.B: 10, DPS.C: 20}, []),
+        ({DPS.A: 2}, {DPS.A: 1, DPS.B: 10, DPS.C: 20}, []),
+        (
+            {DPS.A: 2, DPS.B: 11},
+            {DPS.A: 1, DPS.B: 10, DPS.C: 20},
+            [{DPS.B: 11}, {DPS.A: 2}],
+        ),
+        (
+            {DPS.A: 2, DPS.B: 11, DPS.C: 21},
+            {DPS.A: 1, DPS.B: 10, DPS.C: 20},
+            [{DPS.B: 11, DPS.C: 21}, {DPS.A: 2}],
+        ),
+        ({DPS.A: 2, DPS.B: 10}, {DPS.A: 1, DPS.B: 11, DPS.C: 20}, [{DPS.B: 10}]),
+    ],
+)
+def test_constraints_plan(values, current, expected):
+    constraints = Constraints(
+        Constraint(DPS.B, 10, (DPS.A, None)),
+        Constraint(DPS.B, 10, (DPS.C, {20})),
+    )
+    assert constraints.plan(values, current) == expected
+
+
+def test_constraints_plan_blocking_each_other():
+    constraints = Constraints(
+        Constraint(DPS.A, 1, (DPS.B, None)),
+        Constraint(DPS.B, 10, (DPS.A, None)),
+    )
+    values: Values = {DPS.A: 2, DPS.B: 11}
+    assert constraints.plan(values, {DPS.A: 1, DPS.B: 10}) == [values]
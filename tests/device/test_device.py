@@ -0,0 +1,118 @@
+import asyncio
+from unittest.mock import call
+
+import pytest
+
+from local_tuya.device import Device, DeviceConfig
+from local_tuya.device.events import AbortReason, UpdateAborted, UpdatePending
+from local_tuya.metrics import REGISTRY
+from local_tuya.protocol import Protocol
+from local_tuya.tuya import TuyaConfig, TuyaProtocol, TuyaStateUpdated
+from local_tuya.watchdog import device_name
+
+
+class _Device(Device):
+    @classmethod
+    def filter_data_points(cls, included_components):
+        return set()
+
+    def _from_tuya_payload(self, tuya_payload):
+        return tuya_payload
+
+    def _to_tuya_payload(self, payload):
+        return payload
+
+
+@pytest.fixture
+def optimistic_device(mocker, notifier):
+    protocol = mocker.MagicMock(spec=Protocol)
+    protocol.timeout = 5
+    device = _Device(
+        "test",
+        DeviceConfig(
+            tuya=TuyaConfig(id_="id", address="127.0.0.1", key=b"0123456789abcdef"),
+            optimistic=True,
+        ),
+        protocol,
+        notifier,
+        mocker.MagicMock(spec=TuyaProtocol),
+    )
+    mocker.patch.object(device, "_send_state")
+    return device
+
+
+async def test_optimistic_confirmed(optimistic_device, notifier):
+    await notifier.emit(TuyaStateUpdated({"1": 1, "2": 2}))
+    await asyncio.sleep(0)  # Processed in a queue.
+    await notifier.emit(UpdatePending({"1": 2}))
+    # Not confirmed yet.
+    await notifier.emit(TuyaStateUpdated({"1": 1, "2": 3}))
+    await asyncio.sleep(0)
+    await notifier.emit(TuyaStateUpdated({"1": 2, "2": 3}))
+    await asyncio.sleep(0)
+
+    # Confirming the same values is not published again.
+    assert optimistic_device._send_state.call_args_list == [
+        call({"1": 1, "2": 2}),
+        call({"1": 2, "2": 2}),
+        call({"1": 2, "2": 3}),
+    ]
+
+
+async def test_optimistic_aborted(optimistic_device, notifier):
+    await notifier.emit(TuyaStateUpdated({"1": 1, "2": 2}))
+    await asyncio.sleep(0)  # Processed in a queue.
+    await notifier.emit(UpdatePending({"1": 2}))
+    await notifier.emit(UpdateAborted({"1": 2}, AbortReason.unconfirmed))
+
+    assert optimistic_device._send_state.call_args_list == [
+        call({"1": 1, "2": 2}),
+        call({"1": 2, "2": 2}),
+        # Rolled back.
+        call({"1": 1, "2": 2}),
+    ]
+
+
+async def test_state_coalesced(optimistic_device, notifier):
+    # The latest state replaces the ones not processed yet.
+    await notifier.emit(TuyaStateUpdated({"1": 1, "2": 2}))
+    await notifier.emit(TuyaStateUpdated({"1": 1, "2": 3}))
+    await notifier.emit(TuyaStateUpdated({"1": 1, "2": 4}))
+    await asyncio.sleep(0)
+
+    optimistic_device._send_state.assert_called_once_with({"1": 1, "2": 4})
+
+
+async def test_optimistic_aborted_republished(optimistic_device, notifier):
+    await notifier.emit(TuyaStateUpdated({"1": 1, "2": 2}))
+    await asyncio.sleep(0)  # Processed in a queue.
+    await notifier.emit(UpdatePending({"1": 1}))
+    await notifier.emit(UpdateAborted({"1": 1}, AbortReason.failed))
+
+    # The device state is published again, even if not changed.
+    assert optimistic_device._send_state.call_args_list == [
+        call({"1": 1, "2": 2}),
+        call({"1": 1, "2": 2}),
+    ]
+
+
+async def test_name_not_leaked(mocker, optimistic_device):
+    mocker.patch.object(optimistic_device, "DISCOVERY", create=True)
+    names = []
+    optimistic_device._protocol.send_discovery.side_effect = lambda *_: names.append(
+        device_name.get()
+    )
+
+    async with optimistic_device:
+        # Set for the tasks of the device only.
+        assert device_name.get() == ""
+        await asyncio.sleep(0)
+
+    assert names == ["test"]
+
+
+async def test_metrics_removed(mocker, optimistic_device):
+    mocker.patch.object(optimistic_device, "DISCOVERY", create=True)
+    async with optimistic_device:
+        assert 'device="test"' in REGISTRY.render()
+    assert 'device="test"' not in REGISTRY.render()
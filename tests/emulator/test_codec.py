@@ -0,0 +1,67 @@
+import pytest
+
+from local_tuya.emulator.codec import DeviceCodec
+from local_tuya.errors import LocalTuyaError
+from local_tuya.tuya.config import TuyaConfig
+from local_tuya.tuya.message import (
+    HeartbeatCommand,
+    HeartbeatResponse,
+    StateCommand,
+    StatusResponse,
+    UpdateCommand,
+    UpdateResponse,
+)
+from local_tuya.tuya.message.handlers.v33 import V33MessageHandler
+
+KEY = b"0123456789abcdef"
+
+
+@pytest.fixture
+def codec():
+    return DeviceCodec(KEY)
+
+
+@pytest.fixture
+def handler():
+    return V33MessageHandler(TuyaConfig(id_="id", address="address", key=KEY))
+
+
+def test_unpack(codec, handler):
+    data = (
+        handler.pack(1, StateCommand())
+        + handler.pack(0, HeartbeatCommand())
+        + handler.pack(2, UpdateCommand({"1": True}))
+    )
+    codec.feed(data[:10])
+    assert codec.unpack() is None
+    codec.feed(data[10:])
+    assert codec.unpack() == (1, 10, {})
+    assert codec.unpack() == (0, 9, {})
+    assert codec.unpack() == (2, 7, {"dps": {"1": True}})
+    assert codec.unpack() is None
+
+
+def test_unpack_invalid(codec, handler):
+    data = bytearray(handler.pack(1, StateCommand()))
+    data[-5] ^= 1
+    codec.feed(bytes(data))
+    with pytest.raises(LocalTuyaError, match="hash"):
+        codec.unpack()
+
+
+def test_pack(codec, handler):
+    handler.feed(
+        codec.pack(1, 10, {"dps": {"1": True}})
+        + codec.pack(2, 8, {"dps": {"1": False}}, version_header=True)
+        + codec.pack(0, 9)
+        + codec.pack(3, 7, return_code=1)
+    )
+    _, response, _ = handler.unpack()
+    assert isinstance(response, StatusResponse)
+    assert response.values == {"1": True}
+    _, response, _ = handler.unpack()
+    assert response.values == {"1": False}
+    assert handler.unpack() == (0, HeartbeatResponse(), HeartbeatCommand)
+    _, response, _ = handler.unpack()
+    assert isinstance(response, UpdateResponse)
+    assert response.error
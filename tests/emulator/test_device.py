@@ -0,0 +1,94 @@
+import asyncio
+
+from local_tuya.emulator.device import Behavior, EmulatedDevice, Fleet
+from local_tuya.emulator.schemas import CEILING_FAN
+from local_tuya.tuya.message import (
+    HeartbeatCommand,
+    HeartbeatResponse,
+    StateCommand,
+    StatusResponse,
+    UpdateCommand,
+    UpdateResponse,
+)
+from local_tuya.tuya.message.handlers.v33 import V33MessageHandler
+
+KEY = b"0123456789abcdef"
+
+
+async def _connect(device: EmulatedDevice):
+    handler = V33MessageHandler(device.tuya_config)
+    reader, writer = await asyncio.open_connection(device.host, device.port)
+
+    async def _receive():
+        while not (message := handler.unpack()):
+            handler.feed(await asyncio.wait_for(reader.read(1024), 1))
+        return message[1]
+
+    return handler, writer, _receive
+
+
+async def test_commands():
+    async with EmulatedDevice("id", KEY, 0, CEILING_FAN) as device:
+        handler, writer, receive = await _connect(device)
+        writer.write(handler.pack(0, HeartbeatCommand()))
+        assert await receive() == HeartbeatResponse()
+        writer.write(handler.pack(1, StateCommand()))
+        response = await receive()
+        assert isinstance(response, StatusResponse)
+        assert response.values == {
+            "1": False,
+            "3": "1",
+            "4": "forward",
+            "9": False,
+            "102": "normal",
+        }
+        writer.write(handler.pack(2, UpdateCommand({"1": True})))
+        assert await receive() == UpdateResponse()
+        response = await receive()
+        assert response.values == {"1": True}
+        assert device.values["1"] is True
+        # Unknown data point.
+        writer.write(handler.pack(3, UpdateCommand({"1000": True})))
+        assert (await receive()).error
+        writer.close()
+
+
+async def test_push():
+    behavior = Behavior(push_interval=0.01)
+    async with EmulatedDevice("id", KEY, 0, CEILING_FAN, behavior) as device:
+        _, writer, receive = await _connect(device)
+        response = await receive()
+        assert isinstance(response, StatusResponse)
+        assert response.values.items() <= device.values.items()
+        writer.close()
+
+
+async def test_latency_and_slow_reply():
+    behavior = Behavior(latency=0.02, slow_rate=1, slow_delay=0.02)
+    async with EmulatedDevice("id", KEY, 0, CEILING_FAN, behavior) as device:
+        handler, writer, receive = await _connect(device)
+        start = asyncio.get_running_loop().time()
+        writer.write(handler.pack(0, HeartbeatCommand()))
+        assert await receive() == HeartbeatResponse()
+        assert asyncio.get_running_loop().time() - start >= 0.04
+        writer.close()
+
+
+async def test_disconnect():
+    behavior = Behavior(disconnect_rate=1)
+    async with EmulatedDevice("id", KEY, 0, CEILING_FAN, behavior) as device:
+        handler, writer, _ = await _connect(device)
+        writer.write(handler.pack(0, HeartbeatCommand()))
+        await asyncio.sleep(0.01)
+        assert not device.connections
+        writer.close()
+
+
+async def test_fleet():
+    devices = [EmulatedDevice(f"id{i}", KEY, 0, CEILING_FAN) for i in range(100)]
+    async with Fleet(devices):
+        assert len({d.port for d in devices}) == 100
+        handler, writer, receive = await _connect(devices[-1])
+        writer.write(handler.pack(0, HeartbeatCommand()))
+        assert await receive() == HeartbeatResponse()
+        writer.close()
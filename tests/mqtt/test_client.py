@@ -6,6 +6,7 @@ import pytest
 from local_tuya.backoff import SequenceBackoff
 from local_tuya.mqtt.client import MQTTClient
 from local_tuya.mqtt.config import MQTTConfig
+from local_tuya.tracing import Stage, current_trace
 
 
 @pytest.fixture
@@ -85,6 +86,7 @@ async def test_publish_connecting(client, mock_client, aenter_future):
     assert mock_client.publish.call_args_list == []
     aenter_future.set_result(None)
     async with client:
+        await asyncio.sleep(0.001)  # context switch.
         assert mock_client.publish.call_args_list == [
             call("local-tuya/status/driver", b"online", retain=True),
             call("test-topic", "{}", retain=False),
@@ -93,6 +95,12 @@ async def test_publish_connecting(client, mock_client, aenter_future):
     await publish_task
 
 
+async def test_connect_in_background(client, mock_client):
+    async with client:
+        assert not client._connected.is_set()
+        mock_client.publish.assert_not_called()
+
+
 async def test_receive(mocker, connected_client, mock_client):
     mock_message = mocker.Mock()
     mock_message.topic = mocker.Mock()
@@ -102,6 +110,11 @@ async def test_receive(mocker, connected_client, mock_client):
     commands = []
     async for cmd in connected_client.receive_commands():
         commands.append(cmd)
+        # Traced by the consumer.
+        trace = current_trace.get()
+        assert trace
+        assert trace.device == "dev-id"
+        assert [stage for stage, _ in trace.stages] == [Stage.received]
     assert commands == [("dev-id", {"temp": 18.5})]
 
 
@@ -111,3 +124,31 @@ async def test_reconnect(connected_client, backoff):
     await connected_client._reconnect()
     await asyncio.sleep(0)  # context switch.
     assert backoff.wait.call_count == 2
+
+
+async def test_retained_published_on_connection(client, mock_client, aenter_future):
+    client._closed = False
+    # Not waiting for the connection.
+    await client.set_availability("dev-id", True)
+    mock_client.publish.assert_not_called()
+    aenter_future.set_result(None)
+    async with client:
+        await asyncio.sleep(0.001)  # context switch.
+        assert mock_client.publish.call_args_list == [
+            call("local-tuya/status/driver", b"online", retain=True),
+            call("local-tuya/status/dev-id", b"online", retain=True),
+        ]
+
+
+async def test_publish_paced(mocker, mock_client):
+    mocker.patch("local_tuya.mqtt.client.monotonic", return_value=0)
+    config = MQTTConfig(hostname="address", max_publish_rate=2)
+    client = MQTTClient(config)
+    client._connected.set()
+    client._closed = False
+    mocker.patch.object(client, "_client", mock_client)
+    sleep = mocker.patch("local_tuya.mqtt.client.asyncio.sleep")
+    for _ in range(4):
+        await client._publish("test-topic", "{}")
+    # Bursts of 2 messages, then 2 per second.
+    assert sleep.call_args_list == [call(0.5), call(1)]
@@ -1,8 +1,14 @@
 import time
 
 import pytest
+from pydantic import TypeAdapter
 
-from local_tuya.backoff import SequenceBackoff
+from local_tuya.backoff import (
+    CircuitBreaker,
+    CircuitState,
+    Jitter,
+    SequenceBackoff,
+)
 
 
 class TestSequenceBackoff:
@@ -27,3 +33,61 @@ class TestSequenceBackoff:
             await backoff.wait()
         end = time.monotonic()
         assert round(end - start, 2) == 0.02
+
+    @pytest.mark.parametrize(
+        ("jitter", "bounds"),
+        [
+            (Jitter.none, [(1, 1), (10, 10), (10, 10)]),
+            (Jitter.full, [(0, 1), (0, 10), (0, 10)]),
+            (Jitter.equal, [(0.5, 1), (5, 10), (5, 10)]),
+            (Jitter.decorrelated, [(1, 1), (1, 3), (1, 9)]),
+        ],
+    )
+    def test_jitter(self, jitter, bounds):
+        backoff = SequenceBackoff(0, 1, 10, jitter=jitter)
+        assert backoff.delay() == 0
+        for low, high in bounds:
+            assert low <= backoff.delay() <= high
+
+    @pytest.mark.parametrize(
+        ("value", "expected"),
+        [
+            ([0, 1], (0, 1)),
+            ({"sequence": [0, 1]}, (0, 1)),
+            (
+                {"sequence": [0, 1], "jitter": "full"},
+                {"sequence": (0, 1), "jitter": "full"},
+            ),
+        ],
+    )
+    def test_config(self, value, expected):
+        adapter = TypeAdapter(SequenceBackoff)
+        backoff = adapter.validate_python(value)
+        assert adapter.dump_python(backoff) == expected
+
+
+class TestCircuitBreaker:
+    def test_open(self, mocker):
+        monotonic = mocker.patch("local_tuya.backoff.time.monotonic", return_value=0)
+        breaker = CircuitBreaker(10, 60)
+        assert not breaker.failure()
+        monotonic.return_value = 9
+        assert not breaker.failure()
+        monotonic.return_value = 10
+        assert breaker.failure()
+        assert breaker.state is CircuitState.open
+        # Only reported once.
+        assert not breaker.failure()
+        assert breaker.success()
+        assert breaker.state is CircuitState.closed
+        assert not breaker.success()
+        # Failing time starts again.
+        assert not breaker.failure()
+
+    def test_disabled(self, mocker):
+        monotonic = mocker.patch("local_tuya.backoff.time.monotonic", return_value=0)
+        breaker = CircuitBreaker(0, 0)
+        breaker.failure()
+        monotonic.return_value = 1e6
+        assert not breaker.failure()
+        assert not breaker.open
@@ -1,6 +1,9 @@
+import asyncio
+import gc
 import types
 
-from local_tuya.events import Event, EventNotifier
+from local_tuya.events import Dispatch, Event, EventNotifier, Overflow
+from local_tuya.watchdog import device_name
 
 
 class Event1(Event): ...
@@ -9,6 +12,9 @@ class Event1(Event): ...
 class Event2(Event): ...
 
 
+class Event3(Event1): ...
+
+
 async def test_event_notifier(mocker):
     listener1 = mocker.Mock()
     listener2 = mocker.Mock()
@@ -30,3 +36,184 @@ async def test_event_notifier(mocker):
     listener1.assert_not_called()
     listener2.assert_called_with(event2)
     listener2_async.assert_awaited_with(event2)
+
+
+async def test_dispatch_task(mocker):
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def _slow(_):
+        started.set()
+        await release.wait()
+
+    failing = mocker.Mock(side_effect=ValueError)
+    log = mocker.patch("local_tuya.events.logger")
+    notifier = EventNotifier()
+    notifier.register(Event1, _slow, Dispatch.task)
+    notifier.register(Event1, failing, Dispatch.task)
+
+    # The emitter does not wait for listeners.
+    await notifier.emit(Event1())
+    assert not started.is_set()
+    await asyncio.sleep(0)  # Context switch.
+    assert started.is_set()
+    await asyncio.sleep(0.001)
+    log.warning.assert_called_once()
+    release.set()
+
+
+async def test_dispatch_queue(mocker):
+    received = []
+    release = asyncio.Event()
+
+    async def _slow(event):
+        await release.wait()
+        received.append(event)
+
+    notifier = EventNotifier()
+    notifier.register(Event1, _slow, Dispatch.queue, maxsize=2)
+    events = [Event1() for _ in range(4)]
+    await notifier.emit(events[0])
+    await asyncio.sleep(0)  # Context switch.
+    for event in events[1:]:
+        await notifier.emit(event)
+    release.set()
+    await asyncio.sleep(0.001)
+    # First one was being processed, the queue kept the next 2.
+    assert received == events[:3]
+
+
+async def test_dispatch_queue_coalesce():
+    received = []
+    release = asyncio.Event()
+
+    async def _slow(event):
+        await release.wait()
+        received.append(event)
+
+    notifier = EventNotifier()
+    notifier.register(
+        Event1, _slow, Dispatch.queue, maxsize=1, overflow=Overflow.coalesce
+    )
+    events = [Event1() for _ in range(4)]
+    await notifier.emit(events[0])
+    await asyncio.sleep(0)  # Context switch.
+    for event in events[1:]:
+        await notifier.emit(event)
+    release.set()
+    await asyncio.sleep(0.001)
+    # Only the latest was kept.
+    assert received == [events[0], events[3]]
+
+
+async def test_unregister_dispatched(mocker):
+    listener = mocker.AsyncMock(spec=types.FunctionType)
+    cancelled = []
+
+    async def _slow(_):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    notifier = EventNotifier()
+    task_registration = notifier.register(Event1, _slow, Dispatch.task)
+    queue_registration = notifier.register(Event1, _slow, Dispatch.queue)
+    registration = notifier.register(Event2, listener, Dispatch.queue)
+    await notifier.emit(Event1())
+    await notifier.emit(Event1())
+    await asyncio.sleep(0)  # Context switch.
+    await notifier.emit(Event2())
+    # Events queued are dropped and the ones being processed are cancelled.
+    registration.unregister()
+    task_registration.unregister()
+    queue_registration.unregister()
+    await asyncio.sleep(0)
+    # 2 tasks and the one processing the queue.
+    assert len(cancelled) == 3
+    listener.assert_not_awaited()
+    # Not dispatched after being unregistered.
+    await notifier.emit(Event1())
+    await asyncio.sleep(0)
+    assert len(cancelled) == 3
+
+
+async def test_hierarchy(mocker):
+    base_listener = mocker.Mock()
+    listener = mocker.Mock()
+    notifier = EventNotifier()
+    notifier.register(Event1, base_listener)
+    event = Event3()
+    await notifier.emit(event)
+    base_listener.assert_called_once_with(event)
+    # Routes are computed again.
+    notifier.register(Event3, listener)
+    await notifier.emit(event)
+    listener.assert_called_once_with(event)
+    assert base_listener.call_count == 2
+    await notifier.emit(Event2())
+    listener.assert_called_once()
+
+
+async def test_sync_listener_returning_coroutine(mocker):
+    listener = mocker.AsyncMock()
+    notifier = EventNotifier()
+    notifier.register(Event1, lambda e: listener(e))
+    event = Event1()
+    await notifier.emit(event)
+    listener.assert_awaited_once_with(event)
+
+
+async def test_emit_many(mocker):
+    listener = mocker.Mock()
+    notifier = EventNotifier()
+    notifier.register(Event1, listener)
+    events = [Event1(), Event3()]
+    await notifier.emit_many(iter(events))
+    assert listener.call_args_list == [mocker.call(e) for e in events]
+
+
+async def test_unregister(mocker):
+    listener = mocker.Mock()
+    notifier = EventNotifier()
+    with notifier.register(Event1, listener):
+        registration = notifier.register(Event2, listener)
+        assert notifier.listener_counts() == {"Event1": 1, "Event2": 1}
+        await notifier.emit(Event1())
+    listener.assert_called_once()
+    registration.unregister()
+    registration.unregister()
+    await notifier.emit(Event1())
+    await notifier.emit(Event2())
+    listener.assert_called_once()
+    assert notifier.listener_counts() == {}
+
+
+async def test_weak(mocker):
+    calls = mocker.Mock()
+
+    class Listener:
+        def on_event(self, event):
+            calls(event)
+
+    listener = Listener()
+    notifier = EventNotifier()
+    notifier.register(Event1, listener.on_event, weak=True)
+    event = Event1()
+    await notifier.emit(event)
+    calls.assert_called_once_with(event)
+    del listener
+    gc.collect()
+    assert notifier.listener_counts() == {}
+
+
+async def test_dispatch_context():
+    names = []
+    notifier = EventNotifier("test")
+    notifier.register(Event1, lambda _: names.append(device_name.get()), Dispatch.task)
+    notifier.register(Event1, lambda _: names.append(device_name.get()))
+    await notifier.emit(Event1())
+    await asyncio.sleep(0)  # Context switch.
+    # Inline listeners run in the context of the emitter.
+    assert names == ["", "test"]
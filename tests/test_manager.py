@@ -5,9 +5,13 @@ from imbue import Container, Package, auto_context
 
 from local_tuya.config import Config
 from local_tuya.device import Device, DeviceConfig
+from local_tuya.events import EventNotifier
 from local_tuya.manager import DeviceManager
+from local_tuya.metrics import MetricsConfig
 from local_tuya.protocol import Protocol
+from local_tuya.tracing import TracingConfig
 from local_tuya.tuya import TuyaConfig
+from local_tuya.watchdog import WatchdogConfig
 
 
 @pytest.fixture
@@ -32,6 +36,12 @@ def device_config(mocker):
 def config(mocker, device_config):
     cfg = mocker.Mock(spec=Config)
     cfg.devices = (device_config,)
+    cfg.max_concurrent_connections = 10
+    cfg.startup_rate = 100
+    cfg.presence_listener = False
+    cfg.watchdog = WatchdogConfig(enabled=False)
+    cfg.metrics = MetricsConfig()
+    cfg.tracing = TracingConfig()
     return cfg
 
 
@@ -49,8 +59,20 @@ def _container(mocker, protocol):
 
 
 @pytest.fixture
-def device(mocker, device_config, protocol):
-    mocker.patch("local_tuya.manager.Container", return_value=mocker.MagicMock())
+def device_container(mocker):
+    container = mocker.MagicMock()
+    context = container.application_context.return_value.__aenter__.return_value
+    context.get = mocker.AsyncMock(
+        side_effect=lambda cls: (
+            EventNotifier() if cls is EventNotifier else mocker.MagicMock()
+        )
+    )
+    mocker.patch("local_tuya.manager.Container", return_value=container)
+    return container
+
+
+@pytest.fixture
+def device(mocker, device_config, protocol, device_container):
     dev = mocker.MagicMock(spec=Device)
     dev.__aenter__.return_value = dev
     device_config.infer.return_value = mocker.Mock(return_value=dev)
@@ -84,3 +106,69 @@ async def test_receive(device, protocol, config):
         await asyncio.sleep(0.001)  # Context switch.
 
     device.update.assert_called_once_with({"temp": 18.5})
+
+
+@pytest.mark.usefixtures("_container")
+@pytest.mark.usefixtures("device_container")
+async def test_start_concurrently(mocker, config, device_config):
+    started: list[float] = []
+
+    def _create_device(*_):
+        dev = mocker.MagicMock(spec=Device)
+
+        async def _aenter():
+            started.append(asyncio.get_running_loop().time())
+            # Slow startups do not delay the next ones.
+            await asyncio.sleep(0.2)
+            return dev
+
+        dev.__aenter__.side_effect = _aenter
+        return dev
+
+    device_config.infer.return_value = _create_device
+    other_config = mocker.Mock()
+    other_config.name = "Other"
+    other_config.config.tuya.id_ = "other-id"
+    other_config.infer.return_value = _create_device
+    config.devices = (device_config, other_config)
+    config.startup_rate = 20
+    manager = DeviceManager(config)
+    mocker.patch.object(manager, "_receive_commands")
+
+    async with manager:
+        pass
+
+    assert len(started) == 2
+    # Staggered by the startup rate.
+    assert 0.025 <= started[1] - started[0] < 0.2
+
+
+@pytest.mark.usefixtures("_container")
+@pytest.mark.usefixtures("device_container")
+async def test_start_failure(mocker, config, device_config):
+    tasks = []
+
+    def _create_device(*_):
+        dev = mocker.MagicMock(spec=Device)
+        dev.__aenter__.side_effect = lambda: tasks.append(asyncio.current_task()) or dev
+        dev.__aexit__.side_effect = lambda *_: tasks.append(asyncio.current_task())
+        return dev
+
+    device_config.infer.return_value = _create_device
+    failing_config = mocker.Mock()
+    failing_config.name = "Failing"
+    failing_config.config.tuya.id_ = "failing-id"
+    failing_config.infer.side_effect = ValueError
+    config.devices = (failing_config, device_config)
+    manager = DeviceManager(config)
+    mock_receive_commands = mocker.patch.object(manager, "_receive_commands")
+
+    async with manager:
+        pass
+
+    # The other device started anyway.
+    assert list(mock_receive_commands.call_args[0][1]) == ["test-id"]
+    # Entered and exited in the same task.
+    assert len(tasks) == 2
+    assert tasks[0] is tasks[1]
+    assert tasks[0] is not asyncio.current_task()
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from local_tuya.metrics import MetricsConfig, MetricsServer, Registry
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter(registry):
+    counter = registry.counter("test_total", "Test counter.", ("device",))
+    child = counter.labels("a")
+    child.inc()
+    child.inc(2)
+    # Same child when requested again.
+    counter.labels("a").inc()
+    counter.labels("b")
+    assert registry.render() == (
+        "# HELP test_total Test counter.\n"
+        "# TYPE test_total counter\n"
+        'test_total{device="a"} 4.0\n'
+        'test_total{device="b"} 0.0\n'
+    )
+
+
+def test_gauge(registry):
+    gauge = registry.gauge("test", "Test gauge.").labels()
+    gauge.set(5)
+    gauge.dec()
+    gauge.inc(0.5)
+    assert registry.render().endswith("test 4.5\n")
+
+
+def test_histogram(registry):
+    histogram = registry.histogram(
+        "test_seconds", "Test histogram.", ("device",), buckets=(0.1, 1)
+    )
+    child = histogram.labels("a")
+    for value in (0.05, 0.1, 0.5, 2):
+        child.observe(value)
+    assert registry.render().splitlines()[2:] == [
+        'test_seconds_bucket{device="a",le="0.1"} 2.0',
+        'test_seconds_bucket{device="a",le="1"} 3.0',
+        'test_seconds_bucket{device="a",le="+Inf"} 4.0',
+        'test_seconds_sum{device="a"} 2.65',
+        'test_seconds_count{device="a"} 4.0',
+    ]
+
+
+def test_remove(registry):
+    counter = registry.counter("test_total", "Test counter.", ("device",))
+    histogram = registry.histogram(
+        "test_seconds", "Test histogram.", ("stage", "device"), buckets=(1,)
+    )
+    gauge = registry.gauge("test", "Test gauge.")
+    counter.labels("a").inc()
+    counter.labels("b").inc(2)
+    histogram.labels("x", "a").observe(0.5)
+    gauge.labels().set(1)
+    registry.remove("a")
+    assert registry.render() == (
+        "# HELP test_total Test counter.\n"
+        "# TYPE test_total counter\n"
+        'test_total{device="b"} 2.0\n'
+        "# HELP test_seconds Test histogram.\n"
+        "# TYPE test_seconds histogram\n"
+        "# HELP test Test gauge.\n"
+        "# TYPE test gauge\n"
+        "test 1.0\n"
+    )
+    # Created again when needed.
+    assert counter.labels("a").value == 0
+
+
+def test_labels_escaped(registry):
+    registry.counter("test_total", "Test.", ("device",)).labels('a "b"\n')
+    assert 'test_total{device="a \\"b\\"\\n"} 0.0' in registry.render()
+
+
+def test_invalid(registry):
+    counter = registry.counter("test_total", "Test.", ("device",))
+    with pytest.raises(ValueError, match="expects labels"):
+        counter.labels()
+    with pytest.raises(ValueError, match="already registered"):
+        registry.gauge("test_total", "Test.")
+
+
+def test_collector(registry):
+    gauge = registry.gauge("test", "Test.").labels()
+    registry.add_collector(lambda: gauge.set(3))
+    assert registry.render().endswith("test 3.0\n")
+
+
+async def test_server(registry):
+    registry.counter("test_total", "Test.").labels().inc()
+    async with MetricsServer(MetricsConfig(port=0), registry) as server:
+
+        async def _get(path: str) -> bytes:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            return response
+
+        response = await _get("/metrics")
+        assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert response.endswith(b"test_total 1.0\n")
+        assert (await _get("/")).startswith(b"HTTP/1.1 404 Not Found\r\n")
@@ -0,0 +1,64 @@
+import binascii
+import json
+
+from local_tuya.contrib import FullDeviceConfig
+from local_tuya.device import DeviceConfig
+from local_tuya.events import EventNotifier
+from local_tuya.replay import replay
+from local_tuya.tuya import TuyaConfig
+from local_tuya.tuya.message.handlers.crypto import AESCipher
+from local_tuya.tuya.message.handlers.v33 import V33MessageHandler
+from local_tuya.tuya.recorder import Direction, Record
+
+KEY = b"0123456789abcdef"
+
+
+def frame(command: int, payload: dict) -> bytes:
+    data = V33MessageHandler.RETURN_CODE.pack(0) + AESCipher(KEY).encrypt(
+        json.dumps(payload).encode()
+    )
+    data = (
+        V33MessageHandler.HEADER.pack(
+            V33MessageHandler.PREFIX, 1, command, len(data) + V33MessageHandler.END.size
+        )
+        + data
+    )
+    return data + V33MessageHandler.END.pack(
+        binascii.crc32(data) & 0xFFFFFFFF, V33MessageHandler.SUFFIX
+    )
+
+
+async def test_replay(mocker):
+    notifiers: list[EventNotifier] = []
+
+    def _notifier(name):
+        notifiers.append(EventNotifier(name))
+        return notifiers[-1]
+
+    mocker.patch("local_tuya.replay.EventNotifier", side_effect=_notifier)
+    device_config = FullDeviceConfig(
+        name="fan",
+        model="Ceiling Fan",
+        config=DeviceConfig(tuya=TuyaConfig(id_="id", address="address", key=KEY)),
+    )
+    state = frame(10, {"dps": {"1": False, "3": "1", "4": "forward", "9": False}})
+    records = [
+        Record(0, Direction.sent, b"ignored"),
+        Record(0, Direction.received, state),
+        # Split frame.
+        Record(0.01, Direction.received, frame(8, {"dps": {"1": True}})[:10]),
+        Record(0.02, Direction.received, frame(8, {"dps": {"1": True}})[10:]),
+        Record(0.03, Direction.received, b"garbage" + frame(8, {"dps": {"9": True}})),
+    ]
+    stats = await replay(device_config, records)
+    assert stats.frames == 4
+    assert stats.messages == 3
+    assert stats.decode_errors == 1
+    assert stats.states == 3
+    assert stats.elapsed >= 0.03
+    # Listeners released.
+    assert notifiers[0].listener_counts() == {}
+    # As fast as possible.
+    stats = await replay(device_config, records, speed=0)
+    assert stats.messages == 3
+    assert stats.elapsed < 0.03
@@ -0,0 +1,94 @@
+import gc
+import weakref
+
+from local_tuya.timers import Timer, get_scheduler
+
+
+async def test_timer(mocker, clock):
+    callback = mocker.Mock()
+    timer = Timer(callback)
+    timer.reset(10)
+    assert timer.active
+    await clock.advance(15)
+    callback.assert_called_once_with()
+    assert not timer.active
+
+
+async def test_timer_postpone(mocker, clock):
+    callback = mocker.Mock()
+    timer = Timer(callback)
+    timer.reset(10)
+    await clock.advance(5)
+    timer.reset(10)
+    await clock.advance(7)
+    callback.assert_not_called()
+    await clock.advance(5)
+    callback.assert_called_once_with()
+
+
+async def test_timer_advance(mocker, clock):
+    callback = mocker.Mock()
+    timer = Timer(callback)
+    timer.reset(100)
+    timer.reset(10)
+    await clock.advance(15)
+    callback.assert_called_once_with()
+    await clock.advance(100)
+    callback.assert_called_once_with()
+
+
+async def test_timer_cancel(mocker, clock):
+    callback = mocker.Mock()
+    timer = Timer(callback)
+    timer.reset(10)
+    timer.cancel()
+    await clock.advance(15)
+    callback.assert_not_called()
+    timer.reset(10)
+    await clock.advance(15)
+    callback.assert_called_once_with()
+
+
+class _Component:
+    def __init__(self):
+        self.timer = Timer(self.expired)
+
+    def expired(self) -> None: ...
+
+
+async def test_timer_cancel_released(clock):
+    component = _Component()
+    component.timer.reset(10)
+    ref = weakref.ref(component)
+    component.timer.cancel()
+    del component
+    gc.collect()
+    # Not referenced by the scheduler until due.
+    assert ref() is None
+
+
+async def test_timer_cancel_compacted(mocker, clock):
+    timers = [Timer(mocker.Mock()) for _ in range(100)]
+    for timer in timers:
+        timer.reset(10)
+    for timer in timers[:-1]:
+        timer.cancel()
+    assert len(get_scheduler()._heap) < 50
+
+
+async def test_timer_error(mocker, clock):
+    ok = mocker.Mock()
+    Timer(mocker.Mock(side_effect=ValueError)).reset(5)
+    Timer(ok).reset(5)
+    await clock.advance(10)
+    ok.assert_called_once_with()
+
+
+async def test_scheduler_shared(mocker, clock):
+    callbacks = [mocker.Mock() for _ in range(100)]
+    for i, callback in enumerate(callbacks):
+        Timer(callback).reset(10 + i / 10)
+    assert get_scheduler() is get_scheduler()
+    await clock.advance(25)
+    for callback in callbacks:
+        callback.assert_called_once_with()
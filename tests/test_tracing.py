@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from local_tuya.tracing import Stage, Trace, Tracer, TraceStatus, TracingConfig
+
+
+@pytest.fixture
+def tracer():
+    return Tracer(size=2)
+
+
+def _trace(tracer, device, *durations):
+    trace = tracer.start(device, received=0)
+    at = 0.0
+    for stage, duration in zip((Stage.dispatched, Stage.sent), durations, strict=False):
+        at += duration
+        trace.mark(stage, at)
+    return trace
+
+
+def test_finish(tracer):
+    traces = [_trace(tracer, "test", 0.1, 0.2) for _ in range(3)]
+    tracer.finish(traces, TraceStatus.confirmed)
+    # Bounded.
+    assert list(tracer.traces) == traces[1:]
+    assert traces[0].status is TraceStatus.confirmed
+    # Finished only once, not updated.
+    traces[0].mark(Stage.confirmed)
+    tracer.finish(traces[:1], TraceStatus.failed)
+    assert traces[0].status is TraceStatus.confirmed
+    assert len(traces[0].stages) == 3
+
+
+def test_durations():
+    trace = Trace("test")
+    trace.mark(Stage.received, 1)
+    trace.mark(Stage.dispatched, 1.5)
+    trace.mark(Stage.sent, 3)
+    assert list(trace.durations()) == [(Stage.dispatched, 0.5), (Stage.sent, 1.5)]
+
+
+def test_percentiles():
+    tracer = Tracer()
+    tracer.finish(
+        [_trace(tracer, "test", i / 100, 1) for i in range(1, 101)],
+        TraceStatus.confirmed,
+    )
+    tracer.finish([_trace(tracer, "other", 5)], TraceStatus.confirmed)
+    assert tracer.percentiles("test") == {
+        Stage.dispatched: {50: 0.5, 90: 0.9, 99: 0.99},
+        Stage.sent: {50: 1, 90: 1, 99: 1},
+    }
+    assert tracer.percentiles("other", (50,)) == {Stage.dispatched: {50: 5}}
+    assert tracer.percentiles("unknown") == {}
+
+
+def test_export(tracer, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    trace = _trace(tracer, "test", 0.1)
+    with tracer.configure(TracingConfig(size=10, export_path=path)):
+        tracer.finish([trace], TraceStatus.acknowledged)
+    tracer.finish([_trace(tracer, "test")], TraceStatus.failed)
+    assert tracer.traces.maxlen == 10
+    lines = path.read_text().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0]) == {
+        "id": trace.id,
+        "device": "test",
+        "status": "acknowledged",
+        "timestamp": trace.timestamp,
+        "stages": [["received", 0], ["dispatched", 0.1]],
+    }
+
+
+def test_stage_duration_cached(tracer):
+    tracer.finish([_trace(tracer, "test", 0.1, 0.2)], TraceStatus.confirmed)
+    children = dict(tracer._stage_durations)
+    assert set(children) == {("test", Stage.dispatched), ("test", Stage.sent)}
+    tracer.finish([_trace(tracer, "test", 0.1, 0.2)], TraceStatus.confirmed)
+    assert tracer._stage_durations == children
@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import time
+
+import pytest
+
+from local_tuya.watchdog import Watchdog, WatchdogConfig, device_name
+
+
+@pytest.fixture
+def watchdog():
+    return Watchdog(WatchdogConfig(interval=0.01, threshold=0.01, time_steps=True))
+
+
+async def test_slow_steps(mocker, watchdog):
+    log = mocker.patch("local_tuya.watchdog.logger")
+
+    async def _block():
+        time.sleep(0.015)
+        await asyncio.sleep(0)
+        time.sleep(0.015)
+
+    context = contextvars.copy_context()
+    context.run(device_name.set, "test")
+    async with watchdog:
+        await asyncio.create_task(_block(), context=context)
+        await asyncio.create_task(_block())
+    assert watchdog.slow_steps == {"test": 2, "": 2}
+    assert watchdog.max_step["test"] >= 0.015
+    # Rate limited by device.
+    assert log.warning.call_count == 2
+    assert log.warning.call_args_list[0][0][1] == "test"
+
+
+async def test_lag(watchdog):
+    async with watchdog:
+        await asyncio.sleep(0.005)
+        time.sleep(0.02)
+        await asyncio.sleep(0.01)
+    assert watchdog.max_lag >= 0.01
+    assert watchdog.metrics()["max_lag"] == watchdog.max_lag
+
+
+async def test_restore_task_factory(watchdog):
+    loop = asyncio.get_running_loop()
+    factory = loop.get_task_factory()
+    async with watchdog:
+        assert loop.get_task_factory() is not factory
+    assert loop.get_task_factory() is factory
+
+
+async def test_steps_not_timed_by_default():
+    loop = asyncio.get_running_loop()
+    factory = loop.get_task_factory()
+    watchdog = Watchdog(WatchdogConfig(interval=0.01, threshold=0.01))
+    async with watchdog:
+        assert loop.get_task_factory() is factory
+        time.sleep(0.015)
+        await asyncio.sleep(0)
+    assert not watchdog.slow_steps
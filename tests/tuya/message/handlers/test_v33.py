@@ -87,7 +87,7 @@ def test_pack(handler, message, expected):
         ),
     ],
 )
-async def test_unpack(
+def test_unpack(
     handler,
     header_data,
     payload_data,
@@ -95,30 +95,37 @@ async def test_unpack(
     expected_response_class,
     expected_command_class,
 ):
-    read_it = iter((header_data, payload_data))
-
-    async def _read(n):
-        data = next(read_it)
-        assert n == len(data)
-        return data
-
-    seq, resp, cmd_class = await handler.unpack(_read)
+    handler.feed(header_data)
+    assert handler.unpack() is None
+    handler.feed(payload_data)
+    seq, resp, cmd_class = handler.unpack()
     assert seq == expected_seq
     assert isinstance(resp, expected_response_class)
     assert resp.error is None
     assert cmd_class is expected_command_class
     if expected_response_class in {StatusResponse, StateResponse}:
         assert resp.values == {"1": 1}
+    assert handler.unpack() is None
 
 
 _correct_header = b"\x00\x00U\xaa\x00\x00\x00\x00\x00\x00\x00\x07\x00\x00\x00\x0c"
 _correct_payload = b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xaaU"
 
 
+def test_unpack_multiple(handler):
+    data = _correct_header + _correct_payload
+    handler.feed(data * 2 + data[:5])
+    assert handler.unpack()[1].__class__ is UpdateResponse
+    assert handler.unpack()[1].__class__ is UpdateResponse
+    assert handler.unpack() is None
+    handler.feed(data[5:])
+    assert handler.unpack()[1].__class__ is UpdateResponse
+    assert handler.unpack() is None
+
+
 @pytest.mark.parametrize(
     ("header_data", "payload_data", "error_message"),
     [
-        (b"\x00\x00U", _correct_payload, "not enough header data"),
         (b"\x00\x00U\x11" + _correct_header[4:], _correct_payload, "incorrect prefix"),
         (
             _correct_header[:8] + b"\x00" * 4 + _correct_header[12:],
@@ -126,16 +133,51 @@ _correct_payload = b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xaaU"
             "unknown response type",
         ),
         (_correct_header[:-1] + b"\x00", b"", "payload not long enough"),
-        (_correct_header, b"", "not enough payload data"),
+        (_correct_header[:12] + b"\xff" * 4, b"", "payload too long"),
         (_correct_header, b"\x00" * 12, "incorrect suffix"),
     ],
 )
-async def test_unpack_errors(handler, header_data, payload_data, error_message):
-    read_it = iter((header_data, payload_data))
+def test_unpack_errors(handler, header_data, payload_data, error_message):
+    handler.feed(header_data + payload_data)
+    with pytest.raises(DecodeResponseError, match=error_message):
+        handler.unpack()
 
-    async def _read(n):
-        data = next(read_it)
-        return data
 
-    with pytest.raises(DecodeResponseError, match=error_message):
-        await handler.unpack(_read)
+def test_unpack_resync(handler):
+    handler.feed(b"\x01" * 20 + _correct_header + _correct_payload)
+    with pytest.raises(DecodeResponseError, match="incorrect prefix"):
+        handler.unpack()
+    assert handler.unpack()[1].__class__ is UpdateResponse
+
+
+def test_reset(handler):
+    handler.feed(_correct_header)
+    handler.reset()
+    handler.feed(_correct_header + _correct_payload)
+    assert handler.unpack()[1].__class__ is UpdateResponse
+
+
+def test_pack_cached(mocker, handler):
+    encrypt = mocker.spy(handler._cipher, "encrypt")
+    first = handler.pack(1, UpdateCommand({"1": 1, "2": 2}))
+    second = handler.pack(2, UpdateCommand({"2": 2, "1": 1}))
+    handler.pack(0, HeartbeatCommand())
+    handler.pack(0, HeartbeatCommand())
+    assert encrypt.call_count == 2
+    # Only the header and hash differ.
+    assert first[16:-8] == second[16:-8]
+    assert first[:16] != second[:16]
+
+
+def test_pack_cached_by_type(mocker, handler):
+    encrypt = mocker.spy(handler._cipher, "encrypt")
+    handler.pack(1, UpdateCommand({"1": 1}))
+    handler.pack(1, UpdateCommand({"1": True}))
+    assert encrypt.call_count == 2
+
+
+def test_pack_order(mocker, handler):
+    encrypt = mocker.spy(handler._cipher, "encrypt")
+    handler.pack(1, UpdateCommand({"2": 2, "1": 1}))
+    # Not sorted.
+    encrypt.assert_called_once_with(b'{"dps":{"2":2,"1":1}}')
@@ -1,29 +1,58 @@
-import asyncio
-
 import pytest
 
 from local_tuya.tuya.events import (
     TuyaCommandSent,
     TuyaConnectionClosed,
     TuyaConnectionEstablished,
+    TuyaConnectionStale,
+    TuyaResponseReceived,
 )
-from local_tuya.tuya.heartbeat import Heartbeat
-from local_tuya.tuya.message import HeartbeatCommand
+from local_tuya.tuya.heartbeat import AdaptiveHeartbeat, Heartbeat
+from local_tuya.tuya.message import HeartbeatCommand, StatusResponse
 
 
 @pytest.fixture
 def heartbeat(notifier):
-    return Heartbeat(0.01, notifier)
+    return Heartbeat(10, notifier)
 
 
-async def test_heartbeat(heartbeat, notifier, notifier_spy, assert_event_emitted):
+async def test_heartbeat(
+    heartbeat, clock, notifier, notifier_spy, assert_event_emitted
+):
     with heartbeat:
-        await asyncio.sleep(0.015)
+        await clock.advance(15)
+        notifier_spy.assert_not_called()
+        await notifier.emit(TuyaConnectionEstablished())
+        await clock.advance(15)
+        assert_event_emitted(TuyaCommandSent(HeartbeatCommand()), 2)
+        await notifier.emit(TuyaConnectionClosed(None))
+        notifier_spy.reset_mock()
+        await clock.advance(15)
         notifier_spy.assert_not_called()
+    assert not notifier.listener_counts()
+
+
+@pytest.fixture
+def adaptive_heartbeat(notifier):
+    return AdaptiveHeartbeat("test", 10, 5, notifier)
+
+
+async def test_adaptive_heartbeat(
+    adaptive_heartbeat, clock, notifier, notifier_spy, assert_event_emitted
+):
+    with adaptive_heartbeat:
         await notifier.emit(TuyaConnectionEstablished())
-        await asyncio.sleep(0.015)
+        # Messages received, no heartbeat required.
+        for _ in range(3):
+            await clock.advance(5)
+            await notifier.emit(TuyaResponseReceived(0, StatusResponse(), None))
+        assert_event_emitted(TuyaCommandSent(HeartbeatCommand()), 0)
+        # Device stops answering.
+        await clock.advance(25)
         assert_event_emitted(TuyaCommandSent(HeartbeatCommand()), 2)
+        assert_event_emitted(TuyaConnectionStale(), 1)
         await notifier.emit(TuyaConnectionClosed(None))
         notifier_spy.reset_mock()
-        await asyncio.sleep(0.015)
+        await clock.advance(15)
         notifier_spy.assert_not_called()
+    assert not notifier.listener_counts()
@@ -0,0 +1,84 @@
+import asyncio
+import binascii
+import json
+import socket
+
+import pytest
+
+from local_tuya.tuya.message.handlers.crypto import AESCipher
+from local_tuya.tuya.message.handlers.v33 import V33MessageHandler
+from local_tuya.tuya.presence import UDP_KEY, PresenceListener, decode_broadcast
+
+BROADCAST = {"ip": "192.168.1.10", "gwId": "test-id", "version": "3.3"}
+
+
+def broadcast_frame(payload: dict, encrypt: bool = True) -> bytes:
+    data = json.dumps(payload).encode()
+    if encrypt:
+        data = AESCipher(UDP_KEY).encrypt(data)
+    data = V33MessageHandler.RETURN_CODE.pack(0) + data
+    data = (
+        V33MessageHandler.HEADER.pack(
+            V33MessageHandler.PREFIX,
+            0,
+            0x13,
+            len(data) + V33MessageHandler.END.size,
+        )
+        + data
+    )
+    return data + V33MessageHandler.END.pack(
+        binascii.crc32(data) & 0xFFFFFFFF,
+        V33MessageHandler.SUFFIX,
+    )
+
+
+@pytest.mark.parametrize("encrypt", [True, False])
+def test_decode_broadcast(encrypt):
+    frame = broadcast_frame(BROADCAST, encrypt)
+    assert decode_broadcast(frame, AESCipher(UDP_KEY)) == BROADCAST
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        b"",
+        b"\x00" * 28,
+        broadcast_frame(BROADCAST)[:-1],
+        broadcast_frame(BROADCAST)[:-8] + b"\x00" * 8,
+        broadcast_frame(BROADCAST)[:20] + b"\x00" * 16 + broadcast_frame({})[-8:],
+    ],
+)
+def test_decode_broadcast_invalid(frame):
+    assert decode_broadcast(frame, AESCipher(UDP_KEY)) is None
+
+
+async def test_listener(mocker):
+    callback = mocker.Mock()
+    other_callback = mocker.Mock()
+    listener = PresenceListener(ports=(0,))
+    listener.register("test-id", callback)
+    listener.register("other-id", other_callback)
+    async with listener:
+        port = listener._transports[0].get_extra_info("sockname")[1]
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            sender.sendto(broadcast_frame(BROADCAST), ("127.0.0.1", port))
+            sender.sendto(b"invalid", ("127.0.0.1", port))
+            sender.sendto(broadcast_frame({"gwId": "unknown"}), ("127.0.0.1", port))
+            # Address from the datagram if not in the broadcast.
+            sender.sendto(broadcast_frame({"gwId": "other-id"}), ("127.0.0.1", port))
+            await asyncio.sleep(0.01)  # Context switch.
+
+    callback.assert_called_once_with("192.168.1.10")
+    other_callback.assert_called_once_with("127.0.0.1")
+
+
+async def test_listener_unregister(mocker):
+    callback = mocker.Mock()
+    new_callback = mocker.Mock()
+    listener = PresenceListener(ports=(0,))
+    with listener.register("test-id", callback):
+        # Registered again, by a new transport for the same device.
+        registration = listener.register("test-id", new_callback)
+    assert listener._callbacks == {"test-id": new_callback}
+    registration.unregister()
+    assert listener._callbacks == {}
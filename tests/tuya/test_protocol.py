@@ -1,19 +1,84 @@
+import asyncio
+
 import pytest
 
-from local_tuya.tuya.events import TuyaCommandSent
-from local_tuya.tuya.message import UpdateCommand
+from local_tuya.backoff import CircuitState
+from local_tuya.errors import DeviceUnreachableError, ResponseError
+from local_tuya.tuya.events import (
+    TuyaCommandSent,
+    TuyaConnectionClosed,
+    TuyaResponseReceived,
+)
+from local_tuya.tuya.message import StateCommand, UpdateCommand, UpdateResponse
 from local_tuya.tuya.protocol import TuyaProtocol
 
 
 class TestProtocol:
     @pytest.fixture
     def transport(self, mocker):
-        return mocker.Mock()
+        t = mocker.Mock()
+        t.get_sequence_number.side_effect = [1, 2, 3]
+        t.circuit_state = CircuitState.closed
+        return t
 
     @pytest.fixture
     def protocol(self, transport, notifier):
-        return TuyaProtocol(notifier, transport)
+        return TuyaProtocol("test", notifier, transport, timeout=0.01, window=2)
+
+    async def test_update(self, protocol, notifier, assert_event_emitted):
+        ack = await protocol.update({"1": 1})
+        assert_event_emitted(TuyaCommandSent(UpdateCommand({"1": 1}), 1), 1)
+        response = UpdateResponse()
+        await notifier.emit(TuyaResponseReceived(2, UpdateResponse(), UpdateCommand))
+        assert not ack.done()
+        await notifier.emit(TuyaResponseReceived(1, response, UpdateCommand))
+        assert await ack is response
+        assert not protocol._in_flight
+
+    async def test_query_state(self, protocol, assert_event_emitted):
+        await protocol.query_state()
+        assert_event_emitted(TuyaCommandSent(StateCommand()), 1)
+
+    async def test_update_error(self, protocol, notifier):
+        ack = await protocol.update({"1": 1})
+        await notifier.emit(
+            TuyaResponseReceived(1, UpdateResponse(ResponseError("ko")), UpdateCommand)
+        )
+        with pytest.raises(ResponseError, match="ko"):
+            await ack
+
+    async def test_update_timeout(self, protocol):
+        ack = await protocol.update({"1": 1})
+        with pytest.raises(TimeoutError):
+            await ack
+        assert not protocol._in_flight
+
+    async def test_initialize(self, mocker, protocol, transport, notifier):
+        transport.__aenter__ = mocker.AsyncMock()
+        transport.__aexit__ = mocker.AsyncMock(return_value=None)
+        async with protocol.initialize():
+            transport.__aenter__.assert_awaited_once()
+        transport.__aexit__.assert_awaited_once()
+        assert not notifier.listener_counts()
+
+    async def test_update_unreachable(self, protocol, transport, notifier_spy):
+        transport.circuit_state = CircuitState.open
+        with pytest.raises(DeviceUnreachableError):
+            await protocol.update({"1": 1})
+        notifier_spy.assert_not_called()
+
+    async def test_update_connection_closed(self, protocol, notifier):
+        ack = await protocol.update({"1": 1})
+        await notifier.emit(TuyaConnectionClosed(None))
+        with pytest.raises(ConnectionResetError):
+            await ack
 
-    async def test_update(self, protocol, assert_event_emitted):
+    async def test_window(self, protocol, notifier):
         await protocol.update({"1": 1})
-        assert_event_emitted(TuyaCommandSent(UpdateCommand({"1": 1})), 1)
+        await protocol.update({"1": 2})
+        third = asyncio.create_task(protocol.update({"1": 3}))
+        await asyncio.sleep(0)  # context switch.
+        assert not third.done()
+        await notifier.emit(TuyaResponseReceived(1, UpdateResponse(), UpdateCommand))
+        ack = await third
+        assert not ack.done()
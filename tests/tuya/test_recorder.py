@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from local_tuya.tuya.recorder import Direction, Record, Recorder, read_records
+
+
+def test_record(tmp_path):
+    path = tmp_path / "recording"
+    with Recorder(path, 1000) as recorder:
+        recorder.record(Direction.sent, b"\x01\x02")
+        recorder.record(Direction.received, b"\x03")
+    # Appended.
+    with Recorder(path, 1000) as recorder:
+        recorder.record(Direction.received, b"\x04")
+    records = list(read_records(path))
+    assert [(r.direction, r.data) for r in records] == [
+        (Direction.sent, b"\x01\x02"),
+        (Direction.received, b"\x03"),
+        (Direction.received, b"\x04"),
+    ]
+    assert records[0].timestamp <= records[2].timestamp
+
+
+def test_record_off_thread(mocker, tmp_path):
+    threads = []
+    write = Recorder._write
+    mocker.patch.object(
+        Recorder,
+        "_write",
+        autospec=True,
+        side_effect=lambda *args: (
+            threads.append(threading.current_thread()) or write(*args)
+        ),
+    )
+    with Recorder(tmp_path / "recording", 1000) as recorder:
+        recorder.record(Direction.received, b"\x01")
+    assert len(threads) == 1
+    assert threads[0] is not threading.current_thread()
+    assert [r.data for r in read_records(tmp_path / "recording")] == [b"\x01"]
+
+
+def test_rotate(tmp_path):
+    path = tmp_path / "recording"
+    record_size = Recorder.HEADER.size + 10
+    with Recorder(path, len(Recorder.MAGIC) + 2 * record_size) as recorder:
+        for i in range(5):
+            recorder.record(Direction.received, bytes([i]) * 10)
+    assert [r.data[0] for r in read_records(path)] == [4]
+    assert [r.data[0] for r in read_records(tmp_path / "recording.1")] == [2, 3]
+
+
+def test_read_truncated(tmp_path):
+    path = tmp_path / "recording"
+    with Recorder(path, 1000) as recorder:
+        recorder.record(Direction.received, b"\x01")
+        recorder.record(Direction.received, b"\x02\x03")
+    path.write_bytes(path.read_bytes()[:-1])
+    (record,) = read_records(path)
+    assert record.timestamp == pytest.approx(time.time(), abs=60)
+    assert record == Record(record.timestamp, Direction.received, b"\x01")
+
+
+def test_read_invalid(tmp_path):
+    path = tmp_path / "recording"
+    path.write_bytes(b"invalid")
+    with pytest.raises(ValueError, match="not a recording"):
+        list(read_records(path))
@@ -31,6 +31,7 @@ async def test_connection_lifecycle(
         notifier_spy.reset_mock()
         await asyncio.sleep(0.015)
         notifier_spy.assert_not_called()
+    assert not notifier.listener_counts()
 
 
 @pytest.mark.usefixtures("state")
@@ -1,20 +1,28 @@
 import asyncio.transports
+import socket
 
 import pytest
 
-from local_tuya.backoff import SequenceBackoff
+from local_tuya.backoff import CircuitBreaker, SequenceBackoff
+from local_tuya.errors import DeviceUnreachableError
 from local_tuya.tuya.events import (
     TuyaCommandSent,
+    TuyaConnectionClosed,
+    TuyaConnectionStale,
+    TuyaDeviceUnreachable,
     TuyaResponseReceived,
 )
 from local_tuya.tuya.message import (
     HeartbeatCommand,
+    HeartbeatResponse,
     MessageHandler,
     StateCommand,
     UpdateCommand,
     UpdateResponse,
 )
+from local_tuya.tuya.recorder import Direction, Recorder
 from local_tuya.tuya.transport import (
+    ProtocolTransport,
     SequenceNumberGetter,
     Transport,
     TuyaStream,
@@ -31,6 +39,71 @@ def test_sequence_number():
         assert seq(StateCommand()) == 1
 
 
+async def test_stream_connection_limiter(notifier):
+    server = await asyncio.start_server(lambda *_: None, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    limiter = asyncio.Semaphore(1)
+    stream = TuyaStream(
+        "test", "127.0.0.1", port, SequenceBackoff(0), 0.01, notifier, limiter
+    )
+    async with server:
+        await limiter.acquire()
+        async with stream:
+            # Waiting longer than the timeout does not fail the attempt.
+            await asyncio.sleep(0.05)
+            assert not stream._connection_ready.is_set()
+            limiter.release()
+            await asyncio.wait_for(stream.wait_connected(), 1)
+        assert not limiter.locked()
+
+
+async def test_stream_device_seen(notifier):
+    server = await asyncio.start_server(lambda *_: None, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    # Long backoff before the first attempt.
+    stream = TuyaStream("test", "127.0.0.2", port, SequenceBackoff(60), 5, notifier)
+    async with server:
+        async with stream:
+            await asyncio.sleep(0.001)  # Context switch.
+            assert stream._backoff_task
+            stream.device_seen("127.0.0.1")
+            await asyncio.wait_for(stream.wait_connected(), 1)
+            assert stream._address == "127.0.0.1"
+            # Already connected on this address.
+            stream.device_seen("127.0.0.1")
+            assert stream._connection_ready.is_set()
+
+
+async def test_stream_unreachable(notifier, assert_event_emitted):
+    # Nothing listening on this port.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    breaker = CircuitBreaker(0.01, 60)
+    stream = TuyaStream(
+        "test", "127.0.0.1", port, SequenceBackoff(0.01), 1, notifier, None, breaker
+    )
+    async with stream:
+        await asyncio.sleep(0.05)
+        assert breaker.open
+        assert_event_emitted(TuyaDeviceUnreachable(), 1)
+        # Probing.
+        assert stream._backoff_task
+
+
+async def test_write_rejected_unreachable(notifier, transport, stream, msg_handler):
+    stream.wait_connected.side_effect = asyncio.Event().wait
+    async with transport:
+        task = asyncio.create_task(notifier.emit(TuyaCommandSent(UpdateCommand({}))))
+        await asyncio.sleep(0)  # Context switch.
+        sent = transport._queue[0].sent
+        await notifier.emit(TuyaDeviceUnreachable())
+        # Not waiting for the connection anymore.
+        await task
+        assert isinstance(sent.exception(), DeviceUnreachableError)
+    assert not transport._queue
+
+
 @pytest.fixture
 def backoff(mocker):
     return mocker.MagicMock(spec=SequenceBackoff)
@@ -74,20 +147,88 @@ async def test_write(notifier, transport, stream, msg_handler):
     cmd = HeartbeatCommand()
     async with transport:
         await notifier.emit(TuyaCommandSent(cmd))
-    stream.write.assert_called_once_with(b"\x00")
+    stream.writelines.assert_called_once_with([b"\x00"])
     msg_handler.pack.assert_called_once_with(0, cmd)
 
 
-async def test_receive(notifier, transport, reader, assert_event_emitted, msg_handler):
-    async def _unpack(read):
-        assert await read(1) == b"\x01"
-        return 1, UpdateResponse(), UpdateCommand
+async def test_write_queue(notifier, transport, stream, msg_handler):
+    msg_handler.pack.side_effect = lambda seq, cmd: cmd.__class__.__name__.encode()
+    async with transport:
+        await asyncio.gather(
+            notifier.emit(TuyaCommandSent(HeartbeatCommand())),
+            notifier.emit(TuyaCommandSent(StateCommand())),
+            notifier.emit(TuyaCommandSent(HeartbeatCommand())),
+            notifier.emit(TuyaCommandSent(UpdateCommand({"1": 1}), 5)),
+            notifier.emit(TuyaCommandSent(StateCommand())),
+        )
+    stream.writelines.assert_called_once_with(
+        [b"UpdateCommand", b"StateCommand", b"HeartbeatCommand"]
+    )
+    assert msg_handler.pack.call_args_list[0][0][0] == 5
+
+
+async def test_write_dropped_on_close(notifier, transport, stream, msg_handler):
+    connected = asyncio.Event()
+    stream.wait_connected.side_effect = connected.wait
+    async with transport:
+        heartbeat = asyncio.create_task(
+            notifier.emit(TuyaCommandSent(HeartbeatCommand()))
+        )
+        update = asyncio.create_task(
+            notifier.emit(TuyaCommandSent(UpdateCommand({"1": 1})))
+        )
+        await asyncio.sleep(0)  # context switch.
+        sent = {type(queued.command): queued.sent for queued in transport._queue}
+        await notifier.emit(TuyaConnectionClosed(None))
+        await heartbeat
+        await update
+        connected.set()
+        await asyncio.sleep(0)  # context switch.
+    # The update is sent again by the caller, with a new sequence number.
+    assert isinstance(sent[UpdateCommand].exception(), ConnectionResetError)
+    assert not transport._queue
+    msg_handler.pack.assert_not_called()
+
+
+async def test_write_cancelled(notifier, transport, stream, msg_handler):
+    connected = asyncio.Event()
+    stream.wait_connected.side_effect = connected.wait
+    async with transport:
+        update = asyncio.create_task(
+            notifier.emit(TuyaCommandSent(UpdateCommand({"1": 1})))
+        )
+        state1 = asyncio.create_task(notifier.emit(TuyaCommandSent(StateCommand())))
+        await asyncio.sleep(0)  # context switch.
+        state2 = asyncio.create_task(notifier.emit(TuyaCommandSent(StateCommand())))
+        await asyncio.sleep(0)  # context switch.
+        update.cancel()
+        state2.cancel()
+        await asyncio.sleep(0)  # context switch.
+        connected.set()
+        # Not cancelled along with the other caller.
+        await state1
+    # The update is not sent after it was cancelled.
+    msg_handler.pack.assert_called_once()
+    assert isinstance(msg_handler.pack.call_args[0][1], StateCommand)
+
+
+async def test_reconnect_stale(notifier, transport, stream):
+    async with transport:
+        await notifier.emit(TuyaConnectionStale())
+    stream.reconnect.assert_called_once()
+    assert not notifier.listener_counts()
+
 
-    msg_handler.unpack.side_effect = _unpack
+async def test_receive(notifier, transport, reader, assert_event_emitted, msg_handler):
+    msg_handler.unpack.side_effect = [
+        (1, UpdateResponse(), UpdateCommand),
+        (0, HeartbeatResponse(), HeartbeatCommand),
+        None,
+    ]
     returned = False
 
     async def _read(n):
-        assert n == 1
+        assert n == Transport.READ_SIZE
         nonlocal returned
         if not returned:
             returned = True
@@ -98,4 +239,76 @@ async def test_receive(notifier, transport, reader, assert_event_emitted, msg_ha
     reader.read.side_effect = _read
     async with transport:
         await asyncio.sleep(0)  # context switch.
+    msg_handler.feed.assert_called_once_with(b"\x01")
     assert_event_emitted(TuyaResponseReceived(1, UpdateResponse(), UpdateCommand), 1)
+    assert_event_emitted(
+        TuyaResponseReceived(0, HeartbeatResponse(), HeartbeatCommand), 1
+    )
+
+
+class TestProtocolTransport:
+    @pytest.fixture
+    async def transport(self, backoff, notifier, stream, msg_handler):
+        return ProtocolTransport(
+            name="test",
+            address="address",
+            port=6666,
+            backoff=backoff,
+            timeout=5,
+            keepalive=5,
+            message_handler=msg_handler,
+            event_notifier=notifier,
+        )
+
+    async def test_receive(
+        self, notifier, transport, stream, assert_event_emitted, msg_handler
+    ):
+        msg_handler.unpack.side_effect = [
+            (1, UpdateResponse(), UpdateCommand),
+            (0, HeartbeatResponse(), HeartbeatCommand),
+            None,
+        ]
+        async with transport:
+            assert stream.receiver == transport._data_received
+            stream.receiver(b"\x01")
+            await asyncio.sleep(0)  # context switch.
+        stream.reader.read.assert_not_called()
+        msg_handler.feed.assert_called_once_with(b"\x01")
+        assert_event_emitted(
+            TuyaResponseReceived(1, UpdateResponse(), UpdateCommand), 1
+        )
+        assert_event_emitted(
+            TuyaResponseReceived(0, HeartbeatResponse(), HeartbeatCommand), 1
+        )
+
+    async def test_reset(self, notifier, transport, msg_handler):
+        async with transport:
+            await notifier.emit(TuyaConnectionClosed(None))
+        msg_handler.reset.assert_called_once()
+
+
+async def test_record(notifier, backoff, stream, reader, msg_handler, mocker):
+    recorder = mocker.MagicMock(spec=Recorder)
+    transport = Transport(
+        name="test",
+        address="address",
+        port=6666,
+        backoff=backoff,
+        timeout=5,
+        keepalive=5,
+        message_handler=msg_handler,
+        event_notifier=notifier,
+        recorder=recorder,
+    )
+    msg_handler.pack.return_value = b"\x00"
+    msg_handler.unpack.return_value = None
+    reader.read.side_effect = asyncio.Event().wait
+    async with transport:
+        recorder.__enter__.assert_called_once()
+        await notifier.emit(TuyaCommandSent(HeartbeatCommand()))
+        list(transport.decode(b"\x01"))
+    recorder.__exit__.assert_called_once()
+    assert recorder.record.call_args_list == [
+        mocker.call(Direction.sent, b"\x00"),
+        mocker.call(Direction.received, b"\x01"),
+    ]